@@ -10,7 +10,7 @@ SRC_ROOT = PROJECT_ROOT / "src"
 if str(SRC_ROOT) not in sys.path:
     sys.path.insert(0, str(SRC_ROOT))
 
-from etl_for_all_studies.config import ConfigurationError, load_config
+from etl_for_all_studies.config import CORRELATION_METHODS, ConfigurationError, load_config
 from etl_for_all_studies.correlation_job import run_correlation_job
 
 LOGGER = logging.getLogger(__name__)
@@ -33,6 +33,68 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         default=None,
         help="Optional GSE accession to limit processing (can be repeated)",
     )
+    parser.add_argument(
+        "--method",
+        choices=CORRELATION_METHODS,
+        default=None,
+        help="Correlation coefficient to compute and store (default: spearman)",
+    )
+    parser.add_argument(
+        "--tile-size",
+        dest="tile_size",
+        type=int,
+        default=None,
+        help="Compute and write correlations in blocks of this many genes (0 disables tiling)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes computing study correlations in parallel",
+    )
+    parser.add_argument(
+        "--global-fdr",
+        dest="global_fdr",
+        action="store_true",
+        default=None,
+        help="Also compute q_value_global across all studies after the refresh",
+    )
+    parser.add_argument(
+        "--stratify-by-illness",
+        dest="stratify_by_illness",
+        action="store_true",
+        default=None,
+        help="Also store correlations computed within each illness of the study",
+    )
+    parser.add_argument(
+        "--meta-analysis",
+        dest="meta_analysis",
+        action="store_true",
+        default=None,
+        help="Maintain the cross-study Fisher-z meta-analysis in fact_gene_pair_meta",
+    )
+    parser.add_argument(
+        "--differential-reference",
+        dest="differential_reference",
+        help="Illness label to compare every other illness against",
+    )
+    parser.add_argument(
+        "--bootstrap-resamples",
+        dest="bootstrap_resamples",
+        type=int,
+        default=None,
+        help="Store bootstrap confidence intervals for rho from this many resamples",
+    )
+    parser.add_argument(
+        "--cache-directory",
+        dest="cache_directory",
+        help="Directory of per-study .npz result caches to write and restore from",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Recompute studies even when their expression data has not changed",
+    )
     return parser.parse_args(argv)
 
 
@@ -44,7 +106,44 @@ def main(argv: list[str] | None = None) -> int:
         LOGGER.error("Configuration error: %s", exc)
         return 2
 
-    run_correlation_job(config, study_accessions=args.studies)
+    if args.method:
+        config.correlation.method = args.method
+    if args.tile_size is not None:
+        if args.tile_size < 0:
+            LOGGER.error("--tile-size must not be negative")
+            return 2
+        config.correlation.tile_size = args.tile_size
+    if args.workers is not None:
+        if args.workers < 1:
+            LOGGER.error("--workers must be at least 1")
+            return 2
+        config.correlation.workers = args.workers
+    if args.bootstrap_resamples is not None:
+        if args.bootstrap_resamples < 0:
+            LOGGER.error("--bootstrap-resamples must not be negative")
+            return 2
+        config.correlation.bootstrap_resamples = args.bootstrap_resamples
+
+    if args.global_fdr:
+        config.correlation.global_fdr = True
+
+    if args.stratify_by_illness:
+        config.correlation.stratify_by_illness = True
+
+    if args.meta_analysis:
+        config.correlation.meta_analysis = True
+
+    if args.differential_reference:
+        config.correlation.differential_reference = args.differential_reference
+
+    if args.cache_directory:
+        config.correlation.cache_directory = Path(args.cache_directory).expanduser().resolve()
+
+    try:
+        run_correlation_job(config, study_accessions=args.studies, force=args.force)
+    except ConfigurationError as exc:
+        LOGGER.error("Configuration error: %s", exc)
+        return 2
     return 0
 
 
@@ -12,7 +12,7 @@ SRC_ROOT = PROJECT_ROOT / "src"
 if str(SRC_ROOT) not in sys.path:
     sys.path.insert(0, str(SRC_ROOT))
 
-from etl_for_all_studies.config import ConfigurationError, load_config
+from etl_for_all_studies.config import STUDY_EXECUTORS, ConfigurationError, load_config
 from etl_for_all_studies.pipeline import run_pipeline
 
 LOGGER = logging.getLogger(__name__)
@@ -26,6 +26,27 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         required=True,
         help="Path to the ETL configuration YAML file",
     )
+    parser.add_argument(
+        "--replace-study",
+        dest="replace_studies",
+        action="append",
+        default=None,
+        help=(
+            "GSE accession to reload from scratch: existing facts are deleted and "
+            "reinserted without duplicate checks (can be repeated)"
+        ),
+    )
+    parser.add_argument(
+        "--replace-all",
+        action="store_true",
+        help="Reload every discovered study from scratch",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=STUDY_EXECUTORS,
+        default=None,
+        help="Run studies in worker threads or worker processes (overrides processing.executor)",
+    )
     return parser.parse_args(argv)
 
 
@@ -37,7 +58,13 @@ def main(argv: list[str] | None = None) -> int:
         LOGGER.error("Configuration error: %s", exc)
         return 2
 
-    run_pipeline(config)
+    if args.executor:
+        config.processing.executor = args.executor
+    run_pipeline(
+        config,
+        replace_studies=args.replace_studies,
+        replace_all=args.replace_all,
+    )
     return 0
 
 
@@ -0,0 +1,151 @@
+"""Batch sizing helpers for expression loading."""
+from __future__ import annotations
+
+import logging
+import time
+from collections.abc import Callable
+
+from .config import DatabaseConfig, ProcessingConfig
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AdaptiveBatchSizer:
+    """Tune the expression batch size from observed throughput and commit latency.
+
+    The sizer hill-climbs: it keeps moving the batch size in the same direction
+    while rows/second improves, reverses (with a smaller step) when throughput
+    drops, and always backs off when a commit takes longer than
+    ``max_commit_seconds`` so that large transactions do not hold locks on busy
+    servers. Sizes are clamped to ``[minimum, maximum]``.
+    """
+
+    _MIN_STEP = 1.05
+    _TOLERANCE = 0.05
+
+    def __init__(
+        self,
+        initial: int,
+        *,
+        minimum: int,
+        maximum: int,
+        max_commit_seconds: float,
+        step: float = 1.5,
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_commit_seconds = max_commit_seconds
+        self.batch_size = self._clamp(initial)
+        self.best_batch_size = self.batch_size
+        self.best_throughput = 0.0
+        self.adjustments = 0
+        self._step = step
+        self._direction = 1
+        self._last_throughput: float | None = None
+
+    @classmethod
+    def from_config(cls, config: DatabaseConfig) -> "AdaptiveBatchSizer":
+        return cls(
+            config.batch_size,
+            minimum=config.min_batch_size,
+            maximum=config.max_batch_size,
+            max_commit_seconds=config.max_commit_seconds,
+        )
+
+    def _clamp(self, size: int) -> int:
+        return max(self.minimum, min(self.maximum, size))
+
+    def record(self, rows: int, elapsed_seconds: float, commit_seconds: float) -> int:
+        """Record a committed batch and return the size to use for the next one."""
+
+        throughput = rows / elapsed_seconds if elapsed_seconds > 0 else float("inf")
+        if throughput > self.best_throughput:
+            self.best_throughput = throughput
+            self.best_batch_size = self.batch_size
+
+        if commit_seconds > self.max_commit_seconds:
+            self._direction = -1
+        elif (
+            self._last_throughput is not None
+            and throughput < self._last_throughput * (1 - self._TOLERANCE)
+        ):
+            self._direction = -self._direction
+            self._step = max(self._MIN_STEP, 1 + (self._step - 1) / 2)
+        self._last_throughput = throughput
+
+        if self._direction > 0:
+            proposed = int(self.batch_size * self._step)
+        else:
+            proposed = int(self.batch_size / self._step)
+        proposed = self._clamp(proposed)
+
+        if proposed != self.batch_size:
+            self.adjustments += 1
+            LOGGER.debug(
+                "Batch size %s -> %s (%.0f rows/s, commit %.3fs)",
+                self.batch_size,
+                proposed,
+                throughput,
+                commit_seconds,
+            )
+            self.batch_size = proposed
+        return self.batch_size
+
+
+class CheckpointPolicy:
+    """Decide when a committed batch should also advance the resume checkpoint.
+
+    A checkpoint is due once any configured threshold (rows, seconds or bytes
+    since the previous checkpoint) is reached. With no thresholds configured
+    every batch is checkpointed. Replaying the rows written since the last
+    checkpoint after a crash is safe because fact inserts are deduplicated.
+    """
+
+    def __init__(
+        self,
+        *,
+        every_rows: int = 0,
+        every_seconds: float = 0.0,
+        every_bytes: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.every_rows = every_rows
+        self.every_seconds = every_seconds
+        self.every_bytes = every_bytes
+        self._clock = clock
+        self._rows = 0
+        self._bytes = 0
+        self._started = clock()
+
+    @classmethod
+    def from_config(cls, config: ProcessingConfig) -> "CheckpointPolicy":
+        return cls(
+            every_rows=config.checkpoint_every_rows,
+            every_seconds=config.checkpoint_every_seconds,
+            every_bytes=config.checkpoint_every_bytes,
+        )
+
+    @property
+    def every_batch(self) -> bool:
+        return not (self.every_rows > 0 or self.every_seconds > 0 or self.every_bytes > 0)
+
+    def add(self, rows: int, nbytes: int) -> bool:
+        """Account for a batch and return whether it should carry a checkpoint."""
+
+        self._rows += rows
+        self._bytes += nbytes
+        if self.every_batch:
+            return True
+        if self.every_rows > 0 and self._rows >= self.every_rows:
+            return True
+        if self.every_bytes > 0 and self._bytes >= self.every_bytes:
+            return True
+        return self.every_seconds > 0 and self._clock() - self._started >= self.every_seconds
+
+    def reset(self) -> None:
+        self._rows = 0
+        self._bytes = 0
+        self._started = self._clock()
+
+
+__all__ = ["AdaptiveBatchSizer", "CheckpointPolicy"]
@@ -7,6 +7,13 @@ from typing import Any, Dict, Iterable, List, Optional
 
 import yaml
 
+# Coefficients the correlation job can compute (see correlation.py).
+CORRELATION_METHODS = ("spearman", "pearson", "kendall", "biweight")
+
+# How run_pipeline runs studies concurrently: a thread pool sharing one
+# engine, or a process pool with one engine per worker process.
+STUDY_EXECUTORS = ("thread", "process")
+
 
 @dataclasses.dataclass(slots=True)
 class DatabaseConfig:
@@ -17,6 +24,13 @@ class DatabaseConfig:
     connection_timeout: int = 30
     max_retries: int = 5
     retry_backoff_seconds: int = 5
+    adaptive_batching: bool = False
+    min_batch_size: int = 100
+    max_batch_size: int = 50000
+    max_commit_seconds: float = 2.0
+    delete_chunk_size: int = 50000
+    pool_size: int | None = None
+    max_overflow: int | None = None
 
 
 @dataclasses.dataclass(slots=True)
@@ -27,6 +41,14 @@ class ProcessingConfig:
     gene_filter_file: pathlib.Path
     max_concurrent_studies: int = 6
     state_directory: pathlib.Path | None = None
+    pipelined_writes: bool = False
+    write_queue_depth: int = 4
+    checkpoint_every_rows: int = 0
+    checkpoint_every_seconds: float = 0.0
+    checkpoint_every_bytes: int = 0
+    write_expression_vectors: bool = False
+    inline_correlations: bool = False
+    executor: str = "thread"
 
 
 @dataclasses.dataclass(slots=True)
@@ -67,6 +89,30 @@ class FieldMappingConfig:
     )
 
 
+@dataclasses.dataclass(slots=True)
+class CorrelationConfig:
+    """Settings for the standalone correlation refresh job."""
+
+    # One of spearman, pearson, kendall, biweight.
+    method: str = "spearman"
+    tile_size: int = 0
+    workers: int = 1
+    write_page_size: int = 10000
+    min_abs_rho: float | None = None
+    max_q: float | None = None
+    top_k: int = 0
+    global_fdr: bool = False
+    stratify_by_illness: bool = False
+    meta_analysis: bool = False
+    # Illness label every other illness of a study is compared against.
+    differential_reference: str | None = None
+    # Directory holding per-study .npz copies of the results (None = no cache).
+    cache_directory: pathlib.Path | None = None
+    # Bootstrap resamples for rho confidence intervals (0 = no intervals).
+    bootstrap_resamples: int = 0
+    bootstrap_confidence: float = 0.95
+
+
 @dataclasses.dataclass(slots=True)
 class AppConfig:
     """Root configuration object."""
@@ -75,6 +121,7 @@ class AppConfig:
     processing: ProcessingConfig
     logging: LoggingConfig
     field_mappings: FieldMappingConfig
+    correlation: CorrelationConfig = dataclasses.field(default_factory=CorrelationConfig)
 
 
 class ConfigurationError(RuntimeError):
@@ -109,6 +156,18 @@ def _coerce_sequence(values: Iterable[str] | None) -> tuple[str, ...]:
     return tuple(str(v) for v in values if v)
 
 
+def _optional_int(value: Any) -> int | None:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def _optional_float(value: Any) -> float | None:
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
 def load_config(path: str | pathlib.Path, *, ensure_paths_exist: bool = True) -> AppConfig:
     """Load the ETL configuration from a YAML file."""
 
@@ -125,6 +184,7 @@ def load_config(path: str | pathlib.Path, *, ensure_paths_exist: bool = True) ->
     processing_section = _load_section(data, "processing")
     logging_section = _load_section(data, "logging", optional=True)
     field_mapping_section = _load_section(data, "field_mappings", optional=True)
+    correlation_section = _load_section(data, "correlation", optional=True)
 
     database = DatabaseConfig(
         connection_string=str(db_section.get("connection_string", "")),
@@ -132,9 +192,22 @@ def load_config(path: str | pathlib.Path, *, ensure_paths_exist: bool = True) ->
         connection_timeout=int(db_section.get("connection_timeout", 30)),
         max_retries=int(db_section.get("max_retries", 5)),
         retry_backoff_seconds=int(db_section.get("retry_backoff_seconds", 5)),
+        adaptive_batching=bool(db_section.get("adaptive_batching", False)),
+        min_batch_size=int(db_section.get("min_batch_size", 100)),
+        max_batch_size=int(db_section.get("max_batch_size", 50000)),
+        max_commit_seconds=float(db_section.get("max_commit_seconds", 2.0)),
+        delete_chunk_size=int(db_section.get("delete_chunk_size", 50000)),
+        pool_size=_optional_int(db_section.get("pool_size")),
+        max_overflow=_optional_int(db_section.get("max_overflow")),
     )
     if not database.connection_string:
         raise ConfigurationError("Database connection string is required")
+    if database.delete_chunk_size < 1:
+        raise ConfigurationError("database.delete_chunk_size must be at least 1")
+    if not 1 <= database.min_batch_size <= database.max_batch_size:
+        raise ConfigurationError(
+            "database.min_batch_size must be at least 1 and no larger than max_batch_size"
+        )
 
     input_directory = _ensure_path(
         processing_section.get("input_directory", "./data"),
@@ -156,7 +229,21 @@ def load_config(path: str | pathlib.Path, *, ensure_paths_exist: bool = True) ->
         gene_filter_file=gene_filter_file,
         max_concurrent_studies=int(processing_section.get("max_concurrent_studies", 6)),
         state_directory=state_path,
+        pipelined_writes=bool(processing_section.get("pipelined_writes", False)),
+        write_queue_depth=int(processing_section.get("write_queue_depth", 4)),
+        checkpoint_every_rows=int(processing_section.get("checkpoint_every_rows", 0)),
+        checkpoint_every_seconds=float(processing_section.get("checkpoint_every_seconds", 0.0)),
+        checkpoint_every_bytes=int(processing_section.get("checkpoint_every_bytes", 0)),
+        write_expression_vectors=bool(processing_section.get("write_expression_vectors", False)),
+        inline_correlations=bool(processing_section.get("inline_correlations", False)),
+        executor=str(processing_section.get("executor", "thread")).lower(),
     )
+    if processing.write_queue_depth < 1:
+        raise ConfigurationError("processing.write_queue_depth must be at least 1")
+    if processing.executor not in STUDY_EXECUTORS:
+        raise ConfigurationError(
+            "processing.executor must be one of " + ", ".join(STUDY_EXECUTORS)
+        )
 
     logging = LoggingConfig(
         log_level=str(logging_section.get("log_level", "INFO")),
@@ -180,6 +267,60 @@ def load_config(path: str | pathlib.Path, *, ensure_paths_exist: bool = True) ->
         or _DEFAULT_FIELD_MAPPINGS.platform_fields,
     )
 
+    correlation = CorrelationConfig(
+        method=str(correlation_section.get("method", "spearman")).lower(),
+        tile_size=int(correlation_section.get("tile_size", 0)),
+        workers=int(correlation_section.get("workers", 1)),
+        write_page_size=int(correlation_section.get("write_page_size", 10000)),
+        min_abs_rho=_optional_float(correlation_section.get("min_abs_rho")),
+        max_q=_optional_float(correlation_section.get("max_q")),
+        top_k=int(correlation_section.get("top_k", 0)),
+        global_fdr=bool(correlation_section.get("global_fdr", False)),
+        stratify_by_illness=bool(correlation_section.get("stratify_by_illness", False)),
+        meta_analysis=bool(correlation_section.get("meta_analysis", False)),
+        differential_reference=(
+            str(correlation_section["differential_reference"])
+            if correlation_section.get("differential_reference")
+            else None
+        ),
+        cache_directory=(
+            _ensure_path(correlation_section["cache_directory"])
+            if correlation_section.get("cache_directory")
+            else None
+        ),
+        bootstrap_resamples=int(correlation_section.get("bootstrap_resamples", 0)),
+        bootstrap_confidence=float(correlation_section.get("bootstrap_confidence", 0.95)),
+    )
+    if correlation.method not in CORRELATION_METHODS:
+        raise ConfigurationError(
+            "correlation.method must be one of " + ", ".join(CORRELATION_METHODS)
+        )
+    if correlation.tile_size < 0:
+        raise ConfigurationError("correlation.tile_size must not be negative")
+    if correlation.workers < 1:
+        raise ConfigurationError("correlation.workers must be at least 1")
+    if correlation.write_page_size < 1:
+        raise ConfigurationError("correlation.write_page_size must be at least 1")
+    if correlation.min_abs_rho is not None and not 0.0 <= correlation.min_abs_rho <= 1.0:
+        raise ConfigurationError("correlation.min_abs_rho must be between 0 and 1")
+    if correlation.max_q is not None and not 0.0 <= correlation.max_q <= 1.0:
+        raise ConfigurationError("correlation.max_q must be between 0 and 1")
+    if correlation.top_k < 0:
+        raise ConfigurationError("correlation.top_k must not be negative")
+    if correlation.bootstrap_resamples < 0:
+        raise ConfigurationError("correlation.bootstrap_resamples must not be negative")
+    if not 0.0 < correlation.bootstrap_confidence < 1.0:
+        raise ConfigurationError("correlation.bootstrap_confidence must be between 0 and 1")
+    if correlation.meta_analysis and (
+        correlation.min_abs_rho is not None
+        or correlation.max_q is not None
+        or correlation.top_k > 0
+    ):
+        # Pruned rows would bias the pooled estimate towards strong correlations.
+        raise ConfigurationError(
+            "correlation.meta_analysis cannot be combined with min_abs_rho, max_q or top_k"
+        )
+
     logging.log_directory.mkdir(parents=True, exist_ok=True)
     if processing.state_directory:
         processing.state_directory.mkdir(parents=True, exist_ok=True)
@@ -189,15 +330,19 @@ def load_config(path: str | pathlib.Path, *, ensure_paths_exist: bool = True) ->
         processing=processing,
         logging=logging,
         field_mappings=mappings,
+        correlation=correlation,
     )
 
 
 __all__ = [
     "AppConfig",
+    "CorrelationConfig",
     "DatabaseConfig",
     "FieldMappingConfig",
     "LoggingConfig",
     "ProcessingConfig",
     "ConfigurationError",
+    "CORRELATION_METHODS",
+    "STUDY_EXECUTORS",
     "load_config",
 ]
@@ -2,164 +2,1302 @@
 from __future__ import annotations
 
 import datetime as dt
-import itertools
 import math
-from collections import namedtuple
-from statistics import NormalDist
+import warnings
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
 from typing import Mapping
 
+import numpy as np
+
 try:  # pragma: no cover - exercised when SciPy is available
-    from scipy.stats import spearmanr  # type: ignore
+    from scipy import stats as _scipy_stats  # type: ignore
 except ModuleNotFoundError:  # pragma: no cover - lightweight fallback used in tests
-    _SpearmanResult = namedtuple("SpearmanResult", ["statistic", "pvalue"])
-
-    def _rankdata(values: list[float]) -> list[float]:
-        indexed = sorted(enumerate(values), key=lambda item: item[1])
-        ranks = [0.0] * len(values)
-        i = 0
-        while i < len(indexed):
-            j = i
-            total = 0.0
-            while j < len(indexed) and indexed[j][1] == indexed[i][1]:
-                total += j + 1
-                j += 1
-            avg_rank = total / (j - i)
-            for k in range(i, j):
-                ranks[indexed[k][0]] = avg_rank
-            i = j
-        return ranks
-
-    def _pearson(x: list[float], y: list[float]) -> float:
-        n = len(x)
-        if n == 0:
-            return math.nan
-        mean_x = sum(x) / n
-        mean_y = sum(y) / n
-        num = sum((a - mean_x) * (b - mean_y) for a, b in zip(x, y))
-        denom_x = math.sqrt(sum((a - mean_x) ** 2 for a in x))
-        denom_y = math.sqrt(sum((b - mean_y) ** 2 for b in y))
-        denom = denom_x * denom_y
-        if denom == 0:
-            return math.nan
-        return num / denom
-
-    def spearmanr(values_a: list[float], values_b: list[float]) -> tuple[float, float]:  # type: ignore
-        ranks_a = _rankdata(list(values_a))
-        ranks_b = _rankdata(list(values_b))
-        rho = _pearson(ranks_a, ranks_b)
-        if math.isnan(rho):
-            return _SpearmanResult(math.nan, math.nan)
-        n = len(values_a)
-        if n < 3:
-            return _SpearmanResult(rho, math.nan)
-        if abs(rho) >= 1.0:
-            return _SpearmanResult(max(min(rho, 1.0), -1.0), 0.0)
-        t_stat = rho * math.sqrt((n - 2) / (1 - rho**2))
-        dist = NormalDist()
-        p_value = 2 * (1 - dist.cdf(abs(t_stat)))
-        p_value = min(max(p_value, 0.0), 1.0)
-        return _SpearmanResult(rho, p_value)
-
-from .models import FactGenePairCorrelation
+    _scipy_stats = None
+
+from .config import CORRELATION_METHODS
+from .meta_analysis import MIN_SAMPLES_FOR_META, fisher_z, two_sided_normal_pvalues
+from .models import FactGenePairCorrelation, FactGenePairDiffCorrelation
+from .multiple_testing import benjamini_hochberg
 
 MIN_SAMPLES_FOR_CORRELATION = 2
 
 
-def _benjamini_hochberg(p_values: list[float | None]) -> list[float | None]:
-    if not p_values:
-        return []
+def _rank_rows_numpy(values: np.ndarray, column_groups: np.ndarray | None = None) -> np.ndarray:
+    """Average (tie-aware) ranks per row using only vectorised NumPy.
 
-    valid_indices = [
-        idx for idx, value in enumerate(p_values) if value is not None and not math.isnan(value)
-    ]
+    Each row is sorted once; runs of equal values are numbered with a
+    cumulative sum, offset per row so runs from different rows never share an
+    id, and every member of a run receives the mean of its ordinal ranks.
 
-    m = len(valid_indices)
-    adjusted = [None] * len(p_values)
-    if not m:
-        return adjusted
+    ``column_groups`` optionally labels each column with a non-decreasing
+    group id; ranks are then computed independently within every group of
+    adjacent columns, still in the same single sort.
+    """
 
-    sorted_indices = sorted(valid_indices, key=lambda idx: float(p_values[idx]))
-    prev = 1.0
+    values = np.asarray(values, dtype=np.float64)
+    rows, columns = values.shape
+    if not rows or not columns:
+        return np.zeros(values.shape, dtype=np.float64)
 
-    for rank, index in enumerate(reversed(sorted_indices), start=1):
-        p_val = float(p_values[index])
-        raw = (p_val * m) / (m - rank + 1)
-        value = min(prev, raw)
-        prev = value
-        adjusted[index] = min(value, 1.0)
+    if column_groups is None:
+        order = np.argsort(values, axis=1, kind="stable")
+        ordinal = np.arange(1, columns + 1, dtype=np.float64)
+        group_starts = np.zeros(columns, dtype=bool)
+    else:
+        column_groups = np.asarray(column_groups)
+        order = np.lexsort((values, np.broadcast_to(column_groups, values.shape)), axis=1)
+        group_starts = np.zeros(columns, dtype=bool)
+        group_starts[1:] = column_groups[1:] != column_groups[:-1]
+        first_column = np.maximum.accumulate(np.where(group_starts, np.arange(columns), 0))
+        ordinal = (np.arange(columns) - first_column + 1).astype(np.float64)
+    ordered = np.take_along_axis(values, order, axis=1)
+    starts = np.ones(values.shape, dtype=bool)
+    starts[:, 1:] = (ordered[:, 1:] != ordered[:, :-1]) | group_starts[1:]
+    runs = np.cumsum(starts, axis=1) - 1 + (np.arange(rows) * columns)[:, None]
+    ordinal = np.broadcast_to(ordinal, values.shape)
+    totals = np.bincount(runs.ravel(), weights=ordinal.ravel(), minlength=rows * columns)
+    counts = np.bincount(runs.ravel(), minlength=rows * columns)
+    ranks = np.empty(values.shape, dtype=np.float64)
+    np.put_along_axis(ranks, order, totals[runs] / counts[runs], axis=1)
+    return ranks
 
-    # Replace any None (from NaN inputs) with None explicitly
-    return adjusted
 
+def _rank_rows(values: np.ndarray) -> np.ndarray:
+    """Return average (tie-aware) ranks computed independently for each row."""
+
+    if _scipy_stats is not None:
+        return np.asarray(_scipy_stats.rankdata(values, axis=1), dtype=np.float64)
+    return _rank_rows_numpy(values)
 
-def compute_gene_pair_correlations(
-    gene_expression_by_sample: Mapping[int, Mapping[str, float]],
-    *,
-    sample_illness_map: Mapping[str, int | None] | None = None,
-    study_key: int,
-    min_samples: int = MIN_SAMPLES_FOR_CORRELATION,
-) -> list[FactGenePairCorrelation]:
-    """Compute Spearman correlations for all gene pairs within a study.
 
-    Illness assignments are ignored so that correlations can be generated even
-    when no illness metadata is available. Expression values are aggregated by
-    gene (Ensembl identifier) and study.
+_BETA_CF_MAX_ITERATIONS = 2000
+_BETA_CF_EPSILON = 1e-15
+_BETA_CF_TINY = 1e-300
+
+
+def _beta_continued_fraction(a: np.ndarray, b: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Modified Lentz evaluation of the incomplete beta continued fraction.
+
+    Iterates every element together and stops once all have converged; the
+    number of terms grows with ``sqrt(max(a, b))``, i.e. with the sample count.
     """
 
-    _ = sample_illness_map  # Deprecated parameter retained for compatibility.
+    def guard(value: np.ndarray) -> np.ndarray:
+        return np.where(np.abs(value) < _BETA_CF_TINY, _BETA_CF_TINY, value)
 
-    computed_at = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
-    gene_keys = sorted(gene_expression_by_sample.keys())
-    pair_stats: list[tuple[int, int, int, float, float | None]] = []
+    c = np.ones_like(x)
+    d = 1.0 / guard(1.0 - (a + b) * x / (a + 1.0))
+    h = d.copy()
+    for m in range(1, _BETA_CF_MAX_ITERATIONS + 1):
+        m2 = 2.0 * m
+        numerator = m * (b - m) * x / ((a - 1.0 + m2) * (a + m2))
+        d = 1.0 / guard(1.0 + numerator * d)
+        c = guard(1.0 + numerator / c)
+        h *= d * c
+        numerator = -(a + m) * (a + b + m) * x / ((a + m2) * (a + 1.0 + m2))
+        d = 1.0 / guard(1.0 + numerator * d)
+        c = guard(1.0 + numerator / c)
+        delta = d * c
+        h *= delta
+        if np.all(np.abs(delta - 1.0) < _BETA_CF_EPSILON):
+            break
+    return h
 
-    for gene_a_key, gene_b_key in itertools.combinations(gene_keys, 2):
-        expr_a = gene_expression_by_sample[gene_a_key]
-        expr_b = gene_expression_by_sample[gene_b_key]
-        shared_samples = sorted(expr_a.keys() & expr_b.keys())
-        if len(shared_samples) < min_samples:
-            continue
 
-        values_a = [expr_a[sample] for sample in shared_samples]
-        values_b = [expr_b[sample] for sample in shared_samples]
+def _lgamma(values: np.ndarray) -> np.ndarray:
+    """Elementwise ``log(gamma)``; evaluated once per distinct value.
 
-        if len(set(values_a)) < 2 or len(set(values_b)) < 2:
-            continue
+    Degrees of freedom repeat heavily across pairs, so the Python-level
+    :func:`math.lgamma` calls stay proportional to the distinct sample counts.
+    """
 
-        result = spearmanr(values_a, values_b)
-        rho = float(result.statistic)
-        p_value = float(result.pvalue)
-        if math.isnan(rho):
-            continue
+    distinct, inverse = np.unique(values, return_inverse=True)
+    return np.array([math.lgamma(value) for value in distinct.tolist()])[inverse.reshape(-1)]
 
-        stored_p_value: float | None = None if math.isnan(p_value) else p_value
-        pair_stats.append((gene_a_key, gene_b_key, len(shared_samples), rho, stored_p_value))
 
-    if not pair_stats:
-        return []
+def _regularized_incomplete_beta(
+    a: np.ndarray,
+    b: np.ndarray,
+    x: np.ndarray,
+    complement: np.ndarray | None = None,
+) -> np.ndarray:
+    """``I_x(a, b)`` for arrays, using the symmetry relation for fast convergence.
+
+    ``complement`` may supply ``1 - x`` computed without cancellation; it is
+    what the symmetric branch evaluates, so precision near ``x = 1`` is kept.
+    """
 
-    p_values = [entry[4] for entry in pair_stats]
-    q_values = _benjamini_hochberg(p_values)
+    a, b, x = np.broadcast_arrays(
+        np.asarray(a, dtype=np.float64),
+        np.asarray(b, dtype=np.float64),
+        np.asarray(x, dtype=np.float64),
+    )
+    y = 1.0 - x if complement is None else np.broadcast_to(complement, x.shape)
+    result = np.where(x <= 0.0, 0.0, 1.0)
+    inside = (x > 0.0) & (y > 0.0)
+    if not inside.any():
+        return result
 
-    correlations: list[FactGenePairCorrelation] = []
-    for (gene_a_key, gene_b_key, n_samples, rho, p_value), q_value in zip(
-        pair_stats, q_values
-    ):
-        stored_p_value = p_value if p_value is not None else 1.0
-        correlations.append(
+    a, b, x, y = a[inside], b[inside], x[inside], y[inside]
+    log_beta = _lgamma(a + b) - _lgamma(a) - _lgamma(b)
+    front = np.exp(log_beta + a * np.log(x) + b * np.log(y))
+    direct = x < (a + 1.0) / (a + b + 2.0)
+    values = np.empty_like(x)
+    if direct.any():
+        values[direct] = (
+            front[direct]
+            * _beta_continued_fraction(a[direct], b[direct], x[direct])
+            / a[direct]
+        )
+    swapped = ~direct
+    if swapped.any():
+        values[swapped] = 1.0 - (
+            front[swapped]
+            * _beta_continued_fraction(b[swapped], a[swapped], y[swapped])
+            / b[swapped]
+        )
+    result[inside] = values
+    return result
+
+
+def _t_two_sided_pvalues_numpy(rho: np.ndarray, dof: np.ndarray) -> np.ndarray:
+    """Exact two-sided Student-t p-values for correlations, without SciPy.
+
+    With ``t^2 = rho^2 * dof / (1 - rho^2)`` the two-sided tail
+    ``2 * sf(|t|, dof)`` equals ``I_{1 - rho^2}(dof / 2, 1 / 2)``.
+    """
+
+    rho = np.asarray(rho, dtype=np.float64)
+    x = np.clip((1.0 - rho) * (1.0 + rho), 0.0, 1.0)
+    return _regularized_incomplete_beta(
+        np.asarray(dof, dtype=np.float64) / 2.0, 0.5, x, complement=np.minimum(rho * rho, 1.0)
+    )
+
+
+def _unit_rows(values: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length; all-zero rows stay zero."""
+
+    norms = np.sqrt(np.einsum("ij,ij->i", values, values))
+    scaled = np.zeros_like(values)
+    nonzero = norms > 0
+    scaled[nonzero] = values[nonzero] / norms[nonzero, None]
+    return scaled
+
+
+def _standardize_rows(values: np.ndarray) -> np.ndarray:
+    """Centre each row and scale it to unit length so dot products are Pearson r."""
+
+    return _unit_rows(values - values.mean(axis=1, keepdims=True))
+
+
+def _biweight_rows(values: np.ndarray) -> np.ndarray:
+    """Biweight-weighted deviations from the row median, ``(x - med) * (1 - u^2)^2``.
+
+    ``u = (x - med) / (9 * MAD)``; observations with ``|u| >= 1`` get weight
+    zero. Rows with a zero MAD fall back to mean-centred values, so their
+    correlations are Pearson's.
+    """
+
+    deviations = values - np.median(values, axis=1, keepdims=True)
+    mad = np.median(np.abs(deviations), axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u = deviations / (9.0 * mad)
+        weighted = deviations * np.where(np.abs(u) < 1.0, (1.0 - u * u) ** 2, 0.0)
+    fallback = mad[:, 0] == 0
+    weighted[fallback] = values[fallback] - values[fallback].mean(axis=1, keepdims=True)
+    return weighted
+
+
+def _row_scores(values: np.ndarray, method: str) -> np.ndarray:
+    """Unit-length row transforms whose dot products are the ``method`` correlation.
+
+    Rows must be complete; constant rows come back as zeros. Kendall's tau
+    has no such transform short of one sign per sample pair, so it is
+    computed per pair by :func:`_kendall_pairs` instead.
+    """
+
+    if method == "spearman":
+        return _standardize_rows(_rank_rows(values))
+    if method == "pearson":
+        return _standardize_rows(values)
+    if method == "biweight":
+        return _unit_rows(_biweight_rows(values))
+    raise ValueError(f"Unknown correlation method: {method!r}")
+
+
+# Padded samples held at once (pairs x samples) while Kendall's tau is merge-sorted.
+_KENDALL_BATCH_ELEMENTS = 1 << 22
+
+
+def _run_positions(run_starts: np.ndarray) -> np.ndarray:
+    """Zero-based position of every element within its run of equal sorted values."""
+
+    positions = np.arange(run_starts.shape[1])
+    return positions - np.maximum.accumulate(np.where(run_starts, positions, 0), axis=1)
+
+
+def _tie_terms(run_starts: np.ndarray) -> np.ndarray:
+    """Per-row sums over tie runs of ``t(t-1)/2``, ``t(t-1)(t-2)`` and ``t(t-1)(2t+5)``.
+
+    Each sum is accumulated element by element from the position ``k``
+    within the run (``k``, ``3k(k-1)`` and ``6k(k+2)`` respectively).
+    """
+
+    k = _run_positions(run_starts).astype(np.float64)
+    return np.stack(
+        [k.sum(axis=1), (3.0 * k * (k - 1.0)).sum(axis=1), (6.0 * k * (k + 2.0)).sum(axis=1)],
+        axis=1,
+    )
+
+
+def _sorted_run_starts(ordered: np.ndarray) -> np.ndarray:
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    return starts
+
+
+def _count_inversions(ranks: np.ndarray) -> np.ndarray:
+    """Pairs ``i < j`` with ``ranks[i] > ranks[j]`` per row, by bottom-up merge sort.
+
+    ``ranks`` holds integers in ``[0, samples)``. Rows are padded to a power
+    of two with a larger value, which adds no inversions. Each level merges
+    adjacent sorted runs with a stable sort, which finds the two runs and
+    merges them in linear time; a right-run element that lands ``d``
+    places earlier than it started has passed exactly ``d`` larger
+    left-run elements.
+    """
+
+    rows, sample_count = ranks.shape
+    size = 1 << max(0, (sample_count - 1).bit_length())
+    merged = np.full((rows, size), sample_count, dtype=np.int32)
+    merged[:, :sample_count] = ranks
+    inversions = np.zeros(rows, dtype=np.int64)
+    width = 2
+    while width <= size:
+        runs = merged.reshape(-1, width)
+        order = np.argsort(runs, axis=1, kind="stable")
+        # Only right-run elements can land earlier than they started.
+        moved = np.maximum(order - np.arange(width), 0)
+        inversions += moved.reshape(rows, -1).sum(axis=1)
+        merged = np.take_along_axis(runs, order, axis=1).reshape(rows, size)
+        width *= 2
+    return inversions
+
+
+def _kendall_tau_b(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Kendall's tau-b and its two-sided p-value for each pair of rows ``x[i]``, ``y[i]``.
+
+    Knight's algorithm: rows are sorted by ``x`` then ``y``, and the
+    discordant pairs are the inversions left in ``y``, so each pair costs
+    ``O(n log n)`` time and ``O(n)`` memory. The p-value uses the normal
+    approximation with the tie-corrected variance of ``scipy.stats.kendalltau``.
+    Pairs where either row is constant are NaN.
+    """
+
+    pairs, n = x.shape
+    order = np.lexsort((y, x), axis=1)
+    x_sorted = np.take_along_axis(x, order, axis=1)
+    y_by_x = np.take_along_axis(y, order, axis=1)
+    x_starts = _sorted_run_starts(x_sorted)
+    joint_starts = x_starts | _sorted_run_starts(y_by_x)
+
+    y_order = np.argsort(y, axis=1, kind="stable")
+    y_starts = _sorted_run_starts(np.take_along_axis(y, y_order, axis=1))
+    y_ranks = np.empty((pairs, n), dtype=np.int32)
+    np.put_along_axis(y_ranks, y_order, np.cumsum(y_starts, axis=1, dtype=np.int32) - 1, axis=1)
+    swaps = _count_inversions(np.take_along_axis(y_ranks, order, axis=1)).astype(np.float64)
+
+    x_ties, y_ties = _tie_terms(x_starts), _tie_terms(y_starts)
+    joint_ties = _tie_terms(joint_starts)[:, 0]
+    total = n * (n - 1) / 2.0
+    score = total - x_ties[:, 0] - y_ties[:, 0] + joint_ties - 2.0 * swaps
+    denominator = (total - x_ties[:, 0]) * (total - y_ties[:, 0])
+    tau = np.full(pairs, np.nan)
+    p_values = np.full(pairs, np.nan)
+    defined = denominator > 0
+    tau[defined] = score[defined] / np.sqrt(denominator[defined])
+    if n > 2:
+        m = n * (n - 1.0)
+        variance = (
+            (m * (2.0 * n + 5.0) - x_ties[:, 2] - y_ties[:, 2]) / 18.0
+            + 2.0 * x_ties[:, 0] * y_ties[:, 0] / m
+            + x_ties[:, 1] * y_ties[:, 1] / (9.0 * m * (n - 2.0))
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z_scores = score[defined] / np.sqrt(variance[defined])
+        p_values[defined] = np.clip(two_sided_normal_pvalues(z_scores), 0.0, 1.0)
+    return tau, p_values
+
+
+def _kendall_pairs(
+    values: np.ndarray, rows_a: np.ndarray, rows_b: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """:func:`_kendall_tau_b` for row pairs of ``values``, in chunks of bounded size."""
+
+    tau = np.empty(len(rows_a))
+    p_values = np.empty(len(rows_a))
+    chunk = max(1, _KENDALL_BATCH_ELEMENTS // max(1, values.shape[1]))
+    for start in range(0, len(rows_a), chunk):
+        stop = start + chunk
+        tau[start:stop], p_values[start:stop] = _kendall_tau_b(
+            values[rows_a[start:stop]], values[rows_b[start:stop]]
+        )
+    return tau, p_values
+
+
+def _varying_rows(values: np.ndarray) -> np.ndarray:
+    if values.shape[1] == 0:
+        return np.zeros(values.shape[0], dtype=bool)
+    return np.ptp(values, axis=1) > 0
+
+
+def _correlation_pvalues(rho: np.ndarray, n_samples: np.ndarray) -> np.ndarray:
+    """Two-sided p-values for correlation coefficients via the t statistic.
+
+    Mirrors ``scipy.stats.spearmanr``: undefined (NaN) for fewer than three
+    samples and zero for perfect correlations. Kendall's p-values depend on
+    the ties of each pair and come from :func:`_kendall_tau_b` instead.
+    """
+
+    rho = np.asarray(rho, dtype=np.float64)
+    dof = np.asarray(n_samples, dtype=np.float64) - 2
+    p_values = np.full(rho.shape, np.nan)
+    defined = dof > 0
+    if not defined.any():
+        return p_values
+
+    r = rho[defined]
+    df = np.broadcast_to(dof, rho.shape)[defined]
+    if _scipy_stats is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_stat = np.abs(r) * np.sqrt(df / ((1.0 + r) * (1.0 - r)))
+        t_stat = np.where(np.abs(r) >= 1.0, np.inf, t_stat)
+        tail = 2 * _scipy_stats.t.sf(t_stat, df)
+    else:
+        tail = _t_two_sided_pvalues_numpy(r, df)
+    p_values[defined] = np.clip(tail, 0.0, 1.0)
+    return p_values
+
+
+@dataclass(slots=True)
+class PairCorrelations:
+    """Columnar statistics for gene pairs of one study.
+
+    ``p_values`` and ``q_values`` are NaN where the statistic is undefined
+    (for example with fewer than three shared samples). ``illness_key`` is
+    set when the pairs were computed over one illness stratum only, and
+    ``method`` names the correlation coefficient held in ``rho``.
+    ``rho_lower`` and ``rho_upper`` hold bootstrap confidence bounds when
+    they were requested (NaN for pairs without enough usable resamples).
+    """
+
+    gene_a_keys: np.ndarray
+    gene_b_keys: np.ndarray
+    rho: np.ndarray
+    p_values: np.ndarray
+    n_samples: np.ndarray
+    q_values: np.ndarray
+    illness_key: int | None = None
+    rho_lower: np.ndarray | None = None
+    rho_upper: np.ndarray | None = None
+    method: str = "spearman"
+
+    def __len__(self) -> int:
+        return len(self.rho)
+
+    def select(self, keep: np.ndarray) -> "PairCorrelations":
+        """Return the pairs where the boolean ``keep`` mask is true."""
+
+        return PairCorrelations(
+            gene_a_keys=self.gene_a_keys[keep],
+            gene_b_keys=self.gene_b_keys[keep],
+            rho=self.rho[keep],
+            p_values=self.p_values[keep],
+            n_samples=self.n_samples[keep],
+            q_values=self.q_values[keep],
+            illness_key=self.illness_key,
+            rho_lower=None if self.rho_lower is None else self.rho_lower[keep],
+            rho_upper=None if self.rho_upper is None else self.rho_upper[keep],
+            method=self.method,
+        )
+
+    @classmethod
+    def empty(
+        cls, illness_key: int | None = None, method: str = "spearman"
+    ) -> "PairCorrelations":
+        keys = np.empty(0, dtype=np.int64)
+        stats = np.empty(0, dtype=np.float64)
+        return cls(
+            keys,
+            keys.copy(),
+            stats,
+            stats.copy(),
+            keys.copy(),
+            stats.copy(),
+            illness_key,
+            method=method,
+        )
+
+    def to_records(
+        self, *, study_key: int, computed_at: str
+    ) -> list[FactGenePairCorrelation]:
+        missing = [None] * len(self)
+        lower = missing if self.rho_lower is None else self.rho_lower.tolist()
+        upper = missing if self.rho_upper is None else self.rho_upper.tolist()
+        return [
             FactGenePairCorrelation(
                 gene_a_key=gene_a_key,
                 gene_b_key=gene_b_key,
-                illness_key=None,
+                illness_key=self.illness_key,
+                method=self.method,
                 rho_spearman=rho,
-                p_value=stored_p_value,
-                q_value=q_value,
+                rho_ci_lower=_optional_float(rho_lower),
+                rho_ci_upper=_optional_float(rho_upper),
+                p_value=1.0 if math.isnan(p_value) else p_value,
+                q_value=None if math.isnan(q_value) else q_value,
                 n_samples=n_samples,
                 computed_at=computed_at,
                 study_key=study_key,
             )
+            for (
+                gene_a_key,
+                gene_b_key,
+                rho,
+                rho_lower,
+                rho_upper,
+                p_value,
+                q_value,
+                n_samples,
+            ) in zip(
+                self.gene_a_keys.tolist(),
+                self.gene_b_keys.tolist(),
+                self.rho.tolist(),
+                lower,
+                upper,
+                self.p_values.tolist(),
+                self.q_values.tolist(),
+                self.n_samples.tolist(),
+            )
+        ]
+
+
+def _optional_float(value: float | None) -> float | None:
+    return None if value is None or math.isnan(value) else value
+
+
+@dataclass(slots=True, frozen=True)
+class PersistenceFilter:
+    """Rules deciding which BH-corrected pairs are worth storing.
+
+    A pair passes when ``|rho| >= min_abs_rho`` or ``q <= max_q`` (either
+    rule alone when only one is set). With ``top_k`` each gene then keeps
+    only its ``top_k`` strongest passing partners by ``|rho|``; a pair stays
+    if it is in the top list of either of its genes, and ties at the cut-off
+    are kept. Filtering runs after Benjamini-Hochberg so q-values are
+    adjusted over every tested pair.
+    """
+
+    min_abs_rho: float | None = None
+    max_q: float | None = None
+    top_k: int = 0
+
+    @property
+    def active(self) -> bool:
+        return self.min_abs_rho is not None or self.max_q is not None or self.top_k > 0
+
+    def threshold_mask(self, pairs: PairCorrelations) -> np.ndarray:
+        if self.min_abs_rho is None and self.max_q is None:
+            return np.ones(len(pairs), dtype=bool)
+        keep = np.zeros(len(pairs), dtype=bool)
+        if self.min_abs_rho is not None:
+            keep |= np.abs(pairs.rho) >= self.min_abs_rho
+        if self.max_q is not None:
+            with np.errstate(invalid="ignore"):
+                keep |= pairs.q_values <= self.max_q
+        return keep
+
+
+@dataclass(slots=True, frozen=True)
+class BootstrapSettings:
+    """Percentile bootstrap confidence intervals for rho.
+
+    ``resamples`` sets of sample columns are drawn with replacement once per
+    study (or stratum) from a generator seeded with ``seed``, so results are
+    reproducible and independent of the tile size. ``resamples = 0`` turns
+    the intervals off.
+    """
+
+    resamples: int = 0
+    confidence: float = 0.95
+    seed: int = 0
+
+    @property
+    def active(self) -> bool:
+        return self.resamples > 0
+
+
+class TopPartnerTracker:
+    """Track each gene's ``k`` largest ``|rho|`` values across pair batches.
+
+    Memory is ``len(gene_keys) x k`` regardless of how many pairs are seen,
+    so tiles can be fed one at a time before a second pass applies
+    :meth:`keep_mask`.
+    """
+
+    def __init__(self, gene_keys: Sequence[int] | np.ndarray, k: int) -> None:
+        self._gene_keys = np.asarray(gene_keys, dtype=np.int64)
+        self._k = k
+        self._best = np.full((len(self._gene_keys), k), -np.inf)
+
+    def _rows(self, keys: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self._gene_keys, keys)
+
+    def update(self, pairs: PairCorrelations) -> None:
+        if not len(pairs):
+            return
+        genes = np.concatenate([self._rows(pairs.gene_a_keys), self._rows(pairs.gene_b_keys)])
+        strength = np.tile(np.abs(pairs.rho), 2)
+        order = np.lexsort((-strength, genes))
+        genes, strength = genes[order], strength[order]
+        rank = np.arange(len(genes)) - np.searchsorted(genes, genes, side="left")
+        top = rank < self._k
+        candidates = np.full_like(self._best, -np.inf)
+        candidates[genes[top], rank[top]] = strength[top]
+        merged = np.concatenate([self._best, candidates], axis=1)
+        self._best = -np.sort(-merged, axis=1)[:, : self._k]
+
+    def keep_mask(self, pairs: PairCorrelations) -> np.ndarray:
+        cutoff = self._best[:, -1]
+        strength = np.abs(pairs.rho)
+        return (strength >= cutoff[self._rows(pairs.gene_a_keys)]) | (
+            strength >= cutoff[self._rows(pairs.gene_b_keys)]
+        )
+
+
+def prune_pair_correlations(
+    pairs: PairCorrelations,
+    gene_keys: Sequence[int] | np.ndarray,
+    persistence_filter: PersistenceFilter,
+) -> PairCorrelations:
+    """Apply ``persistence_filter`` to pairs whose q-values are already final."""
+
+    if not persistence_filter.active:
+        return pairs
+    pairs = pairs.select(persistence_filter.threshold_mask(pairs))
+    if persistence_filter.top_k:
+        tracker = TopPartnerTracker(gene_keys, persistence_filter.top_k)
+        tracker.update(pairs)
+        pairs = pairs.select(tracker.keep_mask(pairs))
+    return pairs
+
+
+@dataclass(slots=True)
+class _RankedMatrix:
+    """A gene x sample matrix with its validity mask and full-row correlation scores.
+
+    ``scores`` holds the ``method`` transform (see :func:`_row_scores`) of
+    rows usable in the dense product (no missing values and not constant)
+    and zeros elsewhere. Kendall's tau is computed per pair, so for Kendall
+    ``scores`` is ``None``.
+    """
+
+    values: np.ndarray
+    mask: np.ndarray
+    complete: np.ndarray
+    dense_ok: np.ndarray
+    scores: np.ndarray | None
+    method: str = "spearman"
+
+
+def _rank_matrix(values: np.ndarray, method: str = "spearman") -> _RankedMatrix:
+    mask = ~np.isnan(values)
+    complete = mask.all(axis=1)
+    dense_ok = np.zeros(values.shape[0], dtype=bool)
+    rows = np.flatnonzero(complete)
+    if rows.size:
+        dense_ok[rows[_varying_rows(values[rows])]] = True
+    scores = None
+    if method != "kendall":
+        scores = np.zeros(values.shape, dtype=np.float64)
+        usable = np.flatnonzero(dense_ok)
+        if usable.size:
+            scores[usable] = _row_scores(values[usable], method)
+    return _RankedMatrix(values, mask, complete, dense_ok, scores, method)
+
+
+def _rank_matrix_by_strata(
+    values: np.ndarray, column_strata: Sequence[int | None], method: str = "spearman"
+) -> Iterator[tuple[int, _RankedMatrix]]:
+    """Rank a gene x sample matrix within every stratum of its columns at once.
+
+    Columns are regrouped so each stratum is contiguous, then one grouped
+    sort ranks every row within every stratum, and segment reductions
+    centre and scale those ranks per stratum. Each stratum is yielded as a
+    :class:`_RankedMatrix` over column views of the shared arrays, with
+    completeness judged within the stratum only. Columns whose stratum is
+    ``None`` are left out. Methods other than Spearman score each stratum's
+    columns separately.
+    """
+
+    assigned = np.array([stratum is not None for stratum in column_strata], dtype=bool)
+    labels = np.array(
+        [stratum for stratum in column_strata if stratum is not None], dtype=np.int64
+    )
+    if not labels.size:
+        return
+    order = np.argsort(labels, kind="stable")
+    values = values[:, np.flatnonzero(assigned)[order]]
+    labels = labels[order]
+    strata, starts, sizes = np.unique(labels, return_index=True, return_counts=True)
+    if method != "spearman":
+        for stratum, start, size in zip(strata.tolist(), starts, sizes):
+            yield stratum, _rank_matrix(values[:, start : start + size], method)
+        return
+
+    mask = ~np.isnan(values)
+    complete = np.add.reduceat(mask, starts, axis=1) == sizes
+    with np.errstate(invalid="ignore"):
+        varying = np.maximum.reduceat(values, starts, axis=1) > np.minimum.reduceat(
+            values, starts, axis=1
+        )
+    dense_ok = complete & varying
+
+    ranks = _rank_rows_numpy(values, labels)
+    centered = ranks - np.repeat(np.add.reduceat(ranks, starts, axis=1) / sizes, sizes, axis=1)
+    norms = np.sqrt(np.add.reduceat(centered * centered, starts, axis=1))
+    norms[~dense_ok] = np.inf
+    scores = centered / np.repeat(norms, sizes, axis=1)
+
+    for index, (stratum, start, size) in enumerate(zip(strata.tolist(), starts, sizes)):
+        columns = slice(start, start + size)
+        yield stratum, _RankedMatrix(
+            values[:, columns],
+            mask[:, columns],
+            complete[:, index],
+            dense_ok[:, index],
+            scores[:, columns],
+        )
+
+
+# Elements held at once by a batch of resampled rows or rho products.
+_BOOTSTRAP_BATCH_ELEMENTS = 1 << 24
+
+
+def _bootstrap_draws(sample_count: int, settings: BootstrapSettings) -> np.ndarray:
+    """Column indices of every resample, ``resamples x samples``, drawn once per matrix."""
+
+    return np.random.default_rng(settings.seed).integers(
+        0, sample_count, size=(settings.resamples, sample_count)
+    )
+
+
+def _bootstrap_scores(ranked: _RankedMatrix, block: np.ndarray, draws: np.ndarray) -> np.ndarray:
+    """Standardised ranks of the ``block`` rows under each bootstrap resample.
+
+    Returns a ``resamples x len(block) x samples`` float32 array, so memory
+    follows the tile size rather than the gene count. The resampled rows of
+    a batch of resamples are scored in one call; for Kendall they are kept
+    as resampled values for :func:`_kendall_pairs`. Rows with missing
+    values, and rows that are constant within a resample, are NaN so their
+    pairs drop out of the percentiles.
+    """
+
+    sample_count = ranked.values.shape[1]
+    scores = np.full((len(draws), len(block), sample_count), np.nan, dtype=np.float32)
+    rows = np.flatnonzero(ranked.complete[block])
+    if sample_count < 3 or not rows.size:
+        return scores
+
+    values = ranked.values[block[rows]]
+    batch = max(1, _BOOTSTRAP_BATCH_ELEMENTS // (rows.size * sample_count))
+    for start in range(0, len(draws), batch):
+        stop = min(start + batch, len(draws))
+        resampled = values[:, draws[start:stop]].transpose(1, 0, 2).reshape(-1, sample_count)
+        transformed = (
+            resampled.copy()
+            if ranked.method == "kendall"
+            else _row_scores(resampled, ranked.method)
+        )
+        transformed[~_varying_rows(resampled)] = np.nan
+        scores[start:stop, rows] = transformed.reshape(stop - start, rows.size, sample_count)
+    return scores
+
+
+def _resampled_kendall(
+    values_a: np.ndarray, values_b: np.ndarray, pair_a: np.ndarray, pair_b: np.ndarray
+) -> np.ndarray:
+    """One resample's Kendall tau for rows ``pair_a`` of block a and ``pair_b`` of block b."""
+
+    stacked = np.concatenate([values_a, values_b]).astype(np.float64)
+    tau, _ = _kendall_pairs(stacked, pair_a, len(values_a) + pair_b)
+    tau[np.isnan(values_a[pair_a, 0]) | np.isnan(values_b[pair_b, 0])] = np.nan
+    return tau
+
+
+def _bootstrap_intervals(
+    scores_a: np.ndarray,
+    scores_b: np.ndarray,
+    block_a: np.ndarray,
+    block_b: np.ndarray,
+    rows_a: np.ndarray,
+    rows_b: np.ndarray,
+    confidence: float,
+    method: str = "spearman",
+) -> tuple[np.ndarray, np.ndarray]:
+    """Percentile bounds of rho for the tile's pairs from batched resample products.
+
+    ``scores_a`` and ``scores_b`` are the blocks' :func:`_bootstrap_scores`.
+    Every resample's rho for the tile is one slice of a batched matrix
+    product (for Kendall, one :func:`_kendall_pairs` call per resample); the
+    tile's rows are processed in chunks so the products stay within
+    :data:`_BOOTSTRAP_BATCH_ELEMENTS`. ``rows_a`` must be non-decreasing, as
+    produced by :func:`_tile_correlations`.
+    """
+
+    lower = np.full(len(rows_a), np.nan)
+    upper = np.full(len(rows_a), np.nan)
+    if not len(rows_a):
+        return lower, upper
+
+    tail = (1.0 - confidence) / 2.0
+    offset_a = rows_a - block_a[0]
+    offset_b = rows_b - block_b[0]
+    right = scores_b.transpose(0, 2, 1)
+    chunk = max(1, _BOOTSTRAP_BATCH_ELEMENTS // (scores_a.shape[0] * len(block_b)))
+    for start in range(0, len(block_a), chunk):
+        first, last = np.searchsorted(offset_a, [start, start + chunk])
+        if first == last:
+            continue
+        if method == "kendall":
+            samples = np.stack(
+                [
+                    _resampled_kendall(
+                        resampled_a, resampled_b, offset_a[first:last], offset_b[first:last]
+                    )
+                    for resampled_a, resampled_b in zip(scores_a, scores_b)
+                ]
+            )
+        else:
+            products = np.matmul(scores_a[:, start : start + chunk], right)
+            samples = products[:, offset_a[first:last] - start, offset_b[first:last]]
+        with warnings.catch_warnings():
+            # Pairs without a usable resample are all-NaN and stay NaN.
+            warnings.simplefilter("ignore", RuntimeWarning)
+            bounds = np.nanquantile(samples.astype(np.float64), [tail, 1.0 - tail], axis=0)
+        lower[first:last], upper[first:last] = bounds
+    return np.clip(lower, -1.0, 1.0), np.clip(upper, -1.0, 1.0)
+
+
+def _tile_correlations(
+    ranked: _RankedMatrix,
+    block_a: np.ndarray,
+    block_b: np.ndarray,
+    *,
+    diagonal: bool,
+    min_samples: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Pairwise-complete correlations for row pairs ``a`` in ``block_a``, ``b`` in ``block_b``.
+
+    Shared-sample counts for the tile come from one product of the validity
+    masks. Pairs of complete rows read their rho from a single product of the
+    pre-computed scores. Only pairs whose shared mask differs from the full
+    sample set are re-scored: they are grouped by identical shared mask so
+    each distinct column subset is transformed once for all genes that use it.
+    Kendall's tau is computed per pair over the same shared columns.
+    A pair is skipped when it has fewer than ``min_samples`` shared samples
+    or either vector is constant over them. For a ``diagonal`` tile
+    (``block_a is block_b``) only pairs with ``a < b`` are produced.
+    Returns the kept pairs' rows, rho, shared-sample counts and p-values.
+    """
+
+    mask = ranked.mask
+    counts = mask[block_a].astype(np.int64) @ mask[block_b].T.astype(np.int64)
+    if diagonal:
+        index_a, index_b = np.triu_indices(len(block_a), 1)
+    else:
+        index_a, index_b = (axis.ravel() for axis in np.indices(counts.shape))
+    rows_a, rows_b = block_a[index_a], block_b[index_b]
+    n_samples = counts[index_a, index_b]
+    rho = np.full(len(rows_a), np.nan)
+    p_values = np.full(len(rows_a), np.nan)
+    kendall = ranked.method == "kendall"
+    candidate = n_samples >= min_samples
+
+    both_complete = ranked.complete[rows_a] & ranked.complete[rows_b]
+    dense_pairs = np.flatnonzero(
+        candidate & ranked.dense_ok[rows_a] & ranked.dense_ok[rows_b]
+    )
+    if dense_pairs.size and kendall:
+        rho[dense_pairs], p_values[dense_pairs] = _kendall_pairs(
+            ranked.values, rows_a[dense_pairs], rows_b[dense_pairs]
+        )
+    elif dense_pairs.size:
+        scores_a = ranked.scores[block_a]
+        scores_b = scores_a if diagonal else ranked.scores[block_b]
+        rho_tile = scores_a @ scores_b.T
+        rho[dense_pairs] = rho_tile[index_a[dense_pairs], index_b[dense_pairs]]
+
+    masked_pairs = np.flatnonzero(candidate & ~both_complete)
+    if masked_pairs.size:
+        values = ranked.values
+        packed = np.packbits(mask, axis=1)
+        shared = packed[rows_a[masked_pairs]] & packed[rows_b[masked_pairs]]
+        _, group_ids = np.unique(shared, axis=0, return_inverse=True)
+        group_ids = group_ids.reshape(-1)
+        order = np.argsort(group_ids, kind="stable")
+        boundaries = np.flatnonzero(np.diff(group_ids[order])) + 1
+        for members in np.split(masked_pairs[order], boundaries):
+            columns = mask[rows_a[members[0]]] & mask[rows_b[members[0]]]
+            genes = np.unique(np.concatenate([rows_a[members], rows_b[members]]))
+            block = values[np.ix_(genes, columns)]
+            member_a = np.searchsorted(genes, rows_a[members])
+            member_b = np.searchsorted(genes, rows_b[members])
+            if kendall:
+                rho[members], p_values[members] = _kendall_pairs(block, member_a, member_b)
+                continue
+            scores = _row_scores(block, ranked.method)
+            scores[~_varying_rows(block)] = np.nan
+            rho[members] = np.einsum("ij,ij->i", scores[member_a], scores[member_b])
+
+    keep = ~np.isnan(rho)
+    rho, n_samples = np.clip(rho[keep], -1.0, 1.0), n_samples[keep]
+    p_values = p_values[keep] if kendall else _correlation_pvalues(rho, n_samples)
+    return rows_a[keep], rows_b[keep], rho, n_samples, p_values
+
+
+def _iter_ranked_tiles(
+    ranked: _RankedMatrix,
+    gene_keys: np.ndarray,
+    *,
+    tile_size: int,
+    min_samples: int,
+    illness_key: int | None = None,
+    bootstrap: BootstrapSettings | None = None,
+) -> Iterator[PairCorrelations]:
+    gene_count, sample_count = ranked.values.shape
+    draws = (
+        _bootstrap_draws(sample_count, bootstrap)
+        if bootstrap is not None and bootstrap.active
+        else None
+    )
+    tile_size = max(1, tile_size)
+    blocks = [
+        np.arange(start, min(start + tile_size, gene_count))
+        for start in range(0, gene_count, tile_size)
+    ]
+    for position, block_a in enumerate(blocks):
+        # Resampled scores exist for at most two blocks at a time.
+        resampled_a = None if draws is None else _bootstrap_scores(ranked, block_a, draws)
+        for block_b in blocks[position:]:
+            rows_a, rows_b, rho, n_samples, p_values = _tile_correlations(
+                ranked,
+                block_a,
+                block_b,
+                diagonal=block_b is block_a,
+                min_samples=min_samples,
+            )
+            rho_lower = rho_upper = None
+            if resampled_a is not None:
+                resampled_b = (
+                    resampled_a
+                    if block_b is block_a
+                    else _bootstrap_scores(ranked, block_b, draws)
+                )
+                rho_lower, rho_upper = _bootstrap_intervals(
+                    resampled_a,
+                    resampled_b,
+                    block_a,
+                    block_b,
+                    rows_a,
+                    rows_b,
+                    bootstrap.confidence,
+                    ranked.method,
+                )
+            yield PairCorrelations(
+                gene_a_keys=gene_keys[rows_a],
+                gene_b_keys=gene_keys[rows_b],
+                rho=rho,
+                p_values=p_values,
+                n_samples=n_samples,
+                q_values=np.full(len(rho), np.nan),
+                illness_key=illness_key,
+                rho_lower=rho_lower,
+                rho_upper=rho_upper,
+                method=ranked.method,
+            )
+
+
+def iter_pair_correlation_tiles(
+    values: np.ndarray,
+    gene_keys: Sequence[int] | np.ndarray,
+    *,
+    tile_size: int,
+    min_samples: int = MIN_SAMPLES_FOR_CORRELATION,
+    bootstrap: BootstrapSettings | None = None,
+    method: str = "spearman",
+) -> Iterator[PairCorrelations]:
+    """Yield correlation statistics tile by tile over blocks of ``tile_size`` genes.
+
+    ``method`` is one of :data:`CORRELATION_METHODS`. Each gene is scored
+    once up front (ranked, for Spearman); a tile then only materialises its own
+    ``tile_size x tile_size`` products, so peak memory follows the tile size
+    rather than the square of the gene count. Q-values are left as NaN
+    because Benjamini-Hochberg needs the p-values of every tile. With an
+    active ``bootstrap`` the sample draws are made once and each tile adds
+    its confidence bounds from batched products of its two blocks' resampled
+    ranks; the intervals cover pairs of rows without missing values.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    yield from _iter_ranked_tiles(
+        _rank_matrix(values, method),
+        np.asarray(gene_keys, dtype=np.int64),
+        tile_size=tile_size,
+        min_samples=min_samples,
+        bootstrap=bootstrap,
+    )
+
+
+def iter_stratified_pair_correlation_tiles(
+    values: np.ndarray,
+    gene_keys: Sequence[int] | np.ndarray,
+    column_strata: Sequence[int | None],
+    *,
+    tile_size: int,
+    min_samples: int = MIN_SAMPLES_FOR_CORRELATION,
+    bootstrap: BootstrapSettings | None = None,
+    method: str = "spearman",
+) -> Iterator[PairCorrelations]:
+    """Yield per-stratum correlation tiles, one stratum after another.
+
+    ``column_strata`` gives each column's stratum (an illness key, or
+    ``None`` to leave the sample out). All strata are ranked in one
+    vectorised pass; every tile carries its stratum as ``illness_key`` and,
+    as with :func:`iter_pair_correlation_tiles`, NaN q-values. Bootstrap
+    resamples are drawn within each stratum.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    gene_keys = np.asarray(gene_keys, dtype=np.int64)
+    for stratum, ranked in _rank_matrix_by_strata(values, column_strata, method):
+        yield from _iter_ranked_tiles(
+            ranked,
+            gene_keys,
+            tile_size=tile_size,
+            min_samples=min_samples,
+            illness_key=stratum,
+            bootstrap=bootstrap,
+        )
+
+
+def compute_pair_correlations(
+    values: np.ndarray,
+    gene_keys: Sequence[int] | np.ndarray,
+    *,
+    min_samples: int = MIN_SAMPLES_FOR_CORRELATION,
+    bootstrap: BootstrapSettings | None = None,
+    method: str = "spearman",
+) -> PairCorrelations:
+    """Compute correlation statistics for all pairs of rows of a gene x sample matrix.
+
+    ``method`` is one of :data:`CORRELATION_METHODS`. Missing measurements
+    are NaN. Pairs are emitted in ``(i, j)``, ``i < j`` row order; pairs
+    with fewer than ``min_samples`` shared samples or a constant vector are
+    skipped. Q-values are Benjamini-Hochberg adjusted across the returned
+    pairs.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    tiles = iter_pair_correlation_tiles(
+        values,
+        gene_keys,
+        tile_size=max(1, values.shape[0]),
+        min_samples=min_samples,
+        bootstrap=bootstrap,
+        method=method,
+    )
+    pairs = next(tiles, None) or PairCorrelations.empty(method=method)
+    pairs.q_values = benjamini_hochberg(pairs.p_values)
+    return pairs
+
+
+def compute_stratified_pair_correlations(
+    values: np.ndarray,
+    gene_keys: Sequence[int] | np.ndarray,
+    column_strata: Sequence[int | None],
+    *,
+    min_samples: int = MIN_SAMPLES_FOR_CORRELATION,
+    bootstrap: BootstrapSettings | None = None,
+    method: str = "spearman",
+) -> list[PairCorrelations]:
+    """Compute :func:`compute_pair_correlations` within each column stratum.
+
+    Returns one :class:`PairCorrelations` per stratum, in ascending stratum
+    order, with q-values adjusted within that stratum.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    results = []
+    for pairs in iter_stratified_pair_correlation_tiles(
+        values,
+        gene_keys,
+        column_strata,
+        tile_size=max(1, values.shape[0]),
+        min_samples=min_samples,
+        bootstrap=bootstrap,
+        method=method,
+    ):
+        pairs.q_values = benjamini_hochberg(pairs.p_values)
+        results.append(pairs)
+    return results
+
+
+@dataclass(slots=True)
+class DifferentialCorrelations:
+    """Per-pair comparison of rho in one illness against a reference illness.
+
+    ``z_scores`` is the Fisher z-test statistic of ``rho_illness -
+    rho_reference``; q-values are Benjamini-Hochberg adjusted over the pairs
+    of this comparison. ``method`` names the correlation coefficient.
+    """
+
+    illness_key: int
+    reference_illness_key: int
+    gene_a_keys: np.ndarray
+    gene_b_keys: np.ndarray
+    rho_illness: np.ndarray
+    rho_reference: np.ndarray
+    n_illness: np.ndarray
+    n_reference: np.ndarray
+    z_scores: np.ndarray
+    p_values: np.ndarray
+    q_values: np.ndarray
+    method: str = "spearman"
+
+    def __len__(self) -> int:
+        return len(self.z_scores)
+
+    def to_records(
+        self, *, study_key: int, computed_at: str
+    ) -> list[FactGenePairDiffCorrelation]:
+        return [
+            FactGenePairDiffCorrelation(
+                study_key=study_key,
+                illness_key=self.illness_key,
+                reference_illness_key=self.reference_illness_key,
+                method=self.method,
+                gene_a_key=gene_a_key,
+                gene_b_key=gene_b_key,
+                rho_illness=rho_illness,
+                rho_reference=rho_reference,
+                n_illness=n_illness,
+                n_reference=n_reference,
+                z_score=z_score,
+                p_value=p_value,
+                q_value=q_value,
+                computed_at=computed_at,
+            )
+            for (
+                gene_a_key,
+                gene_b_key,
+                rho_illness,
+                rho_reference,
+                n_illness,
+                n_reference,
+                z_score,
+                p_value,
+                q_value,
+            ) in zip(
+                self.gene_a_keys.tolist(),
+                self.gene_b_keys.tolist(),
+                self.rho_illness.tolist(),
+                self.rho_reference.tolist(),
+                self.n_illness.tolist(),
+                self.n_reference.tolist(),
+                self.z_scores.tolist(),
+                self.p_values.tolist(),
+                self.q_values.tolist(),
+            )
+        ]
+
+
+def _compare_strata(
+    illness: PairCorrelations, reference: PairCorrelations
+) -> DifferentialCorrelations:
+    """Fisher z-test of the rho difference for the pairs present in both strata."""
+
+    span = int(max(illness.gene_b_keys.max(initial=0), reference.gene_b_keys.max(initial=0))) + 1
+    _, in_illness, in_reference = np.intersect1d(
+        illness.gene_a_keys * span + illness.gene_b_keys,
+        reference.gene_a_keys * span + reference.gene_b_keys,
+        assume_unique=True,
+        return_indices=True,
+    )
+    n_illness = illness.n_samples[in_illness]
+    n_reference = reference.n_samples[in_reference]
+    rho_illness = illness.rho[in_illness]
+    rho_reference = reference.rho[in_reference]
+    z_scores = (fisher_z(rho_illness) - fisher_z(rho_reference)) / np.sqrt(
+        1.0 / (n_illness - 3.0) + 1.0 / (n_reference - 3.0)
+    )
+    p_values = two_sided_normal_pvalues(z_scores)
+    return DifferentialCorrelations(
+        illness_key=int(illness.illness_key),
+        reference_illness_key=int(reference.illness_key),
+        gene_a_keys=illness.gene_a_keys[in_illness],
+        gene_b_keys=illness.gene_b_keys[in_illness],
+        rho_illness=rho_illness,
+        rho_reference=rho_reference,
+        n_illness=n_illness,
+        n_reference=n_reference,
+        z_scores=z_scores,
+        p_values=p_values,
+        q_values=benjamini_hochberg(p_values),
+        method=illness.method,
+    )
+
+
+def compute_differential_correlations(
+    values: np.ndarray,
+    gene_keys: Sequence[int] | np.ndarray,
+    column_strata: Sequence[int | None],
+    *,
+    reference: int,
+    method: str = "spearman",
+) -> list[DifferentialCorrelations]:
+    """Compare every stratum's gene pair correlations against the ``reference`` stratum.
+
+    All strata are scored as in :func:`iter_stratified_pair_correlation_tiles`
+    (one grouped ranking pass for Spearman); each stratum's rho is then one
+    matrix product, and the z-test runs over all of a comparison's pairs at
+    once. The Fisher z variance ``1 / (n - 3)`` is exact only for Pearson's
+    r, so for the other methods the test is approximate. Pairs need at least
+    four shared samples in both strata.
+    Returns one result per compared stratum, in ascending stratum order;
+    none when the reference stratum has no samples.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    by_stratum = {
+        pairs.illness_key: pairs
+        for pairs in iter_stratified_pair_correlation_tiles(
+            values,
+            gene_keys,
+            column_strata,
+            tile_size=max(1, values.shape[0]),
+            min_samples=MIN_SAMPLES_FOR_META,
+            method=method,
         )
+    }
+    baseline = by_stratum.pop(reference, None)
+    if baseline is None:
+        return []
+    return [_compare_strata(pairs, baseline) for pairs in by_stratum.values()]
 
-    return correlations
+
+def compute_differential_gene_pair_correlations(
+    gene_expression_by_sample: Mapping[int, Mapping[str, float]],
+    *,
+    sample_illness_map: Mapping[str, int | None],
+    reference_illness_key: int,
+    study_key: int,
+    method: str = "spearman",
+) -> list[FactGenePairDiffCorrelation]:
+    """Differential co-expression of each illness against ``reference_illness_key``.
+
+    The mapping-based counterpart of :func:`compute_differential_correlations`,
+    in the style of :func:`compute_gene_pair_correlations`.
+    """
+
+    computed_at = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+    values, gene_keys = expression_array_from_mapping(gene_expression_by_sample)
+    samples = sorted(
+        set().union(*(sample_map.keys() for sample_map in gene_expression_by_sample.values()))
+    )
+    records: list[FactGenePairDiffCorrelation] = []
+    for comparison in compute_differential_correlations(
+        values,
+        gene_keys,
+        [sample_illness_map.get(sample) for sample in samples],
+        reference=reference_illness_key,
+        method=method,
+    ):
+        records.extend(comparison.to_records(study_key=study_key, computed_at=computed_at))
+    return records
+
+
+def expression_array_from_mapping(
+    gene_expression_by_sample: Mapping[int, Mapping[str, float]],
+) -> tuple[np.ndarray, list[int]]:
+    """Return a gene x sample matrix (NaN where missing) and its sorted gene keys."""
+
+    gene_keys = sorted(gene_expression_by_sample.keys())
+    samples = sorted(
+        set().union(*(sample_map.keys() for sample_map in gene_expression_by_sample.values()))
+    )
+    sample_index = {sample: index for index, sample in enumerate(samples)}
+
+    values = np.full((len(gene_keys), len(samples)), np.nan)
+    for row, gene_key in enumerate(gene_keys):
+        for sample, value in gene_expression_by_sample[gene_key].items():
+            values[row, sample_index[sample]] = value
+    return values, gene_keys
+
+
+def compute_gene_pair_correlations(
+    gene_expression_by_sample: Mapping[int, Mapping[str, float]],
+    *,
+    sample_illness_map: Mapping[str, int | None] | None = None,
+    study_key: int,
+    min_samples: int = MIN_SAMPLES_FOR_CORRELATION,
+    stratify: bool = False,
+    method: str = "spearman",
+) -> list[FactGenePairCorrelation]:
+    """Compute ``method`` correlations (Spearman by default) for all gene pairs of a study.
+
+    Correlations are always computed across every sample, so they can be
+    generated even when no illness metadata is available; those records have
+    no ``illness_key``. With ``stratify`` the records computed within each
+    illness of ``sample_illness_map`` follow them. Expression values are
+    aggregated by gene (Ensembl identifier) and study.
+    """
+
+    computed_at = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+    values, gene_keys = expression_array_from_mapping(gene_expression_by_sample)
+    pairs = compute_pair_correlations(
+        values, gene_keys, min_samples=min_samples, method=method
+    )
+    records = pairs.to_records(study_key=study_key, computed_at=computed_at)
+    if stratify and sample_illness_map:
+        samples = sorted(
+            set().union(*(sample_map.keys() for sample_map in gene_expression_by_sample.values()))
+        )
+        column_strata = [sample_illness_map.get(sample) for sample in samples]
+        for stratum_pairs in compute_stratified_pair_correlations(
+            values, gene_keys, column_strata, min_samples=min_samples, method=method
+        ):
+            records.extend(
+                stratum_pairs.to_records(study_key=study_key, computed_at=computed_at)
+            )
+    return records
 
 
-__all__ = ["compute_gene_pair_correlations", "MIN_SAMPLES_FOR_CORRELATION"]
+__all__ = [
+    "BootstrapSettings",
+    "CORRELATION_METHODS",
+    "DifferentialCorrelations",
+    "MIN_SAMPLES_FOR_CORRELATION",
+    "PairCorrelations",
+    "PersistenceFilter",
+    "TopPartnerTracker",
+    "compute_differential_correlations",
+    "compute_differential_gene_pair_correlations",
+    "compute_gene_pair_correlations",
+    "compute_pair_correlations",
+    "compute_stratified_pair_correlations",
+    "expression_array_from_mapping",
+    "iter_pair_correlation_tiles",
+    "iter_stratified_pair_correlation_tiles",
+    "prune_pair_correlations",
+]
@@ -1,27 +1,94 @@
 """Standalone job for refreshing gene pair correlations."""
 from __future__ import annotations
 
+import atexit
+import concurrent.futures
+import datetime as dt
+import itertools
+import json
 import logging
+import multiprocessing
+import os
+import pathlib
+import shutil
+import tempfile
 import time
-from dataclasses import dataclass
+from collections.abc import Iterator
+from dataclasses import dataclass, field
 from typing import Iterable
 
+import numpy as np
 from sqlalchemy.orm import Session, sessionmaker
 
-from .config import AppConfig
-from .correlation import compute_gene_pair_correlations
-from .database import create_engine_with_retries, create_session_factory
+try:  # pragma: no cover - exercised when threadpoolctl is available
+    from threadpoolctl import threadpool_limits as _threadpool_limits  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover - environment variables are the fallback
+    _threadpool_limits = None
+
+from .config import AppConfig, ConfigurationError
+from .correlation import (
+    MIN_SAMPLES_FOR_CORRELATION,
+    BootstrapSettings,
+    DifferentialCorrelations,
+    PairCorrelations,
+    PersistenceFilter,
+    TopPartnerTracker,
+    compute_differential_correlations,
+    compute_pair_correlations,
+    compute_stratified_pair_correlations,
+    iter_pair_correlation_tiles,
+    iter_stratified_pair_correlation_tiles,
+    prune_pair_correlations,
+)
+from .database import (
+    create_engine_with_retries,
+    create_session_factory,
+    is_memory_sqlite,
+    log_pool_metrics,
+)
 from .logging_utils import configure_logging
+from .meta_analysis import fisher_z_contributions
+from .models import Base
+from .multiple_testing import SpilledBenjaminiHochberg
+from .result_cache import cache_file_path, read_result_cache, write_result_cache
 from .repositories import (
+    ExpressionFingerprint,
+    CORRELATION_WRITE_PAGE_SIZE,
+    ExpressionMatrix,
     StudyDescriptor,
-    bulk_insert_gene_pair_correlations,
+    apply_meta_correlation_sums,
+    compute_expression_fingerprint,
+    count_pruned_gene_pairs,
+    delete_differential_correlations_for_study,
     delete_gene_pair_correlations_for_study,
+    find_illness_key,
+    insert_differential_correlations,
+    insert_gene_pair_correlation_columns,
+    is_correlation_refresh_current,
+    is_study_in_meta_analysis,
+    iter_studies_missing_from_meta_analysis,
+    iter_gene_pair_p_value_pages,
     iter_studies_with_expression,
-    load_gene_expression_matrix,
+    load_expression_array,
+    load_sample_illness_keys,
+    load_study_pair_correlations,
+    record_correlation_refresh,
+    set_study_in_meta_analysis,
+    update_global_q_values,
 )
 
 LOGGER = logging.getLogger(__name__)
 
+# Native thread pools that NumPy/SciPy may start; each is capped per worker
+# process so ``workers x threads`` stays within the machine's cores.
+BLAS_THREAD_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
 
 @dataclass(slots=True)
 class CorrelationMetrics:
@@ -37,79 +104,681 @@ class CorrelationMetrics:
     compute_seconds: float
     write_seconds: float
     total_seconds: float
+    tile_count: int = 0
+    pruned_count: int = 0
+    differential_count: int = 0
+    restored: bool = False
+
+
+@dataclass(slots=True, frozen=True)
+class _ComputeOptions:
+    """Settings of the compute step, passed as one picklable value to workers."""
+
+    tile_size: int = 0
+    method: str = "spearman"
+    persistence_filter: PersistenceFilter = PersistenceFilter()
+    stratify_by_illness: bool = False
+    differential_reference: int | None = None
+    bootstrap: BootstrapSettings = BootstrapSettings()
+
+    @property
+    def needs_strata(self) -> bool:
+        return self.stratify_by_illness or self.differential_reference is not None
+
+
+@dataclass(slots=True)
+class StudyCorrelations:
+    """Correlations computed for a study and waiting for the writer.
+
+    Untiled results travel in ``pair_sets`` (the whole-study pairs, then one
+    set per illness stratum); tiled results are ``.npz`` files (q-values
+    included) under ``tile_directory``, which the writer removes.
+    ``study_pruned_count`` is the whole-study share of ``pruned_count``, the
+    pairs global FDR counts as tested.
+    ``differential`` holds the illness-vs-reference comparisons. Results
+    read back from the on-disk cache are flagged ``restored``. Only stored
+    rows of ``method`` are replaced.
+    """
+
+    descriptor: StudyDescriptor
+    gene_count: int
+    sample_count: int
+    correlation_count: int
+    load_seconds: float
+    compute_seconds: float
+    computed_at: str
+    pruned_count: int = 0
+    study_pruned_count: int = 0
+    pair_sets: list[PairCorrelations] = field(default_factory=list)
+    tile_directory: str | None = None
+    tile_paths: list[str] = field(default_factory=list)
+    differential: list[DifferentialCorrelations] = field(default_factory=list)
+    gene_keys: np.ndarray | None = None
+    restored: bool = False
+    method: str = "spearman"
+
+
+def _measured_columns(matrix: ExpressionMatrix) -> np.ndarray:
+    """Columns of samples with at least one measurement.
+
+    Dropping the others lets the remaining genes keep complete rows and stay
+    on the dense correlation path.
+    """
+
+    return matrix.mask.any(axis=0)
+
 
+_TILE_FIELDS = ("gene_a_keys", "gene_b_keys", "rho", "p_values", "n_samples", "q_values")
+_TILE_INTERVAL_FIELDS = ("rho_lower", "rho_upper")
 
-def _count_samples(expression_matrix: dict[int, dict[str, float]]) -> int:
-    samples: set[str] = set()
-    for sample_map in expression_matrix.values():
-        samples.update(sample_map.keys())
-    return len(samples)
 
+def _persistence_filter(config: AppConfig) -> PersistenceFilter:
+    """Build the pruning filter, refusing one that would bias the meta-analysis."""
+
+    persistence_filter = PersistenceFilter(
+        min_abs_rho=config.correlation.min_abs_rho,
+        max_q=config.correlation.max_q,
+        top_k=config.correlation.top_k,
+    )
+    if config.correlation.meta_analysis and persistence_filter.active:
+        raise ConfigurationError(
+            "correlation.meta_analysis cannot be combined with min_abs_rho, max_q or top_k"
+        )
+    return persistence_filter
+
+
+def _compute_options(config: AppConfig, session: Session) -> _ComputeOptions:
+    """Collect the compute settings, resolving the differential reference illness."""
+
+    persistence_filter = _persistence_filter(config)
+    reference_label = config.correlation.differential_reference
+    differential_reference = None
+    if reference_label:
+        differential_reference = find_illness_key(session, reference_label)
+        if differential_reference is None:
+            LOGGER.warning(
+                "Differential reference illness %r not found; skipping differential correlations",
+                reference_label,
+            )
+    return _ComputeOptions(
+        tile_size=config.correlation.tile_size,
+        method=config.correlation.method,
+        persistence_filter=persistence_filter,
+        stratify_by_illness=config.correlation.stratify_by_illness,
+        differential_reference=differential_reference,
+        bootstrap=BootstrapSettings(
+            resamples=config.correlation.bootstrap_resamples,
+            confidence=config.correlation.bootstrap_confidence,
+        ),
+    )
 
-def _process_single_study(
+
+def _compute_tiles(
+    tiles: Iterable[PairCorrelations],
+    gene_keys: np.ndarray,
+    *,
+    directory: pathlib.Path,
+    persistence_filter: PersistenceFilter,
+) -> tuple[list[str], int, int, int]:
+    """Spill correlation tiles under ``directory``.
+
+    Tiles are written as they are produced while their p-values feed a
+    Benjamini-Hochberg pass per illness stratum (the whole-study pairs being
+    one more); each tile is then rewritten with its q-values and the
+    threshold filter applied, so no step holds more than one tile of pair
+    statistics. A per-gene ``top_k`` cap needs every tile's survivors first,
+    so it is applied in one more pass over the files.
+
+    Returns ``(tile_paths, persisted_count, pruned_count, study_pruned_count)``,
+    the last counting whole-study pairs only.
+    """
+
+    adjusters: dict[int | None, SpilledBenjaminiHochberg] = {}
+    try:
+        tile_paths: list[str] = []
+        for index, tile in enumerate(tiles):
+            if not len(tile):
+                continue
+            adjuster = adjusters.get(tile.illness_key)
+            if adjuster is None:
+                spill_directory = directory / f"fdr_{len(adjusters):04d}"
+                spill_directory.mkdir()
+                adjuster = adjusters[tile.illness_key] = SpilledBenjaminiHochberg(
+                    spill_directory
+                )
+            tile_path = str(directory / f"tile_{index:06d}.npz")
+            _save_tile(tile_path, tile)
+            adjuster.add(tile.p_values)
+            tile_paths.append(tile_path)
+        for adjuster in adjusters.values():
+            adjuster.finalize()
+
+        trackers: dict[int | None, TopPartnerTracker] = (
+            {
+                stratum: TopPartnerTracker(gene_keys, persistence_filter.top_k)
+                for stratum in adjusters
+            }
+            if persistence_filter.top_k
+            else {}
+        )
+        # Pairs tested and kept, per whole study (``None``) and in total.
+        tested: dict[int | None, int] = {}
+        kept: dict[int | None, int] = {}
+        for tile_path in tile_paths:
+            tile = _load_tile(tile_path)
+            tile.q_values = adjusters[tile.illness_key].q_values(tile.p_values)
+            tested[tile.illness_key] = tested.get(tile.illness_key, 0) + len(tile)
+            tile = tile.select(persistence_filter.threshold_mask(tile))
+            if trackers:
+                trackers[tile.illness_key].update(tile)
+            _save_tile(tile_path, tile)
+            kept[tile.illness_key] = kept.get(tile.illness_key, 0) + len(tile)
+
+        if trackers:
+            kept = {}
+            for tile_path in tile_paths:
+                tile = _load_tile(tile_path)
+                tile = tile.select(trackers[tile.illness_key].keep_mask(tile))
+                _save_tile(tile_path, tile)
+                kept[tile.illness_key] = kept.get(tile.illness_key, 0) + len(tile)
+    finally:
+        for adjuster in adjusters.values():
+            adjuster.close()
+    persisted = sum(kept.values())
+    return (
+        tile_paths,
+        persisted,
+        sum(tested.values()) - persisted,
+        tested.get(None, 0) - kept.get(None, 0),
+    )
+
+
+def _save_tile(tile_path: str, tile: PairCorrelations) -> None:
+    # An empty ``illness_key`` array marks whole-study pairs.
+    illness_key = [] if tile.illness_key is None else [tile.illness_key]
+    np.savez(
+        tile_path,
+        illness_key=np.asarray(illness_key, dtype=np.int64),
+        method=np.asarray(tile.method),
+        **{name: getattr(tile, name) for name in _TILE_FIELDS},
+        **{
+            name: getattr(tile, name)
+            for name in _TILE_INTERVAL_FIELDS
+            if getattr(tile, name) is not None
+        },
+    )
+
+
+def _load_tile(tile_path: str) -> PairCorrelations:
+    """Read a spilled tile; q-values are NaN until they have been stored."""
+
+    with np.load(tile_path) as arrays:
+        columns = {name: arrays[name] for name in _TILE_FIELDS}
+        columns.update(
+            {name: arrays[name] for name in _TILE_INTERVAL_FIELDS if name in arrays.files}
+        )
+        illness_key = arrays["illness_key"]
+        method = str(arrays["method"])
+    return PairCorrelations(
+        **columns,
+        illness_key=int(illness_key[0]) if illness_key.size else None,
+        method=method,
+    )
+
+
+def _compute_study(
     session: Session,
     descriptor: StudyDescriptor,
-) -> CorrelationMetrics:
-    total_start = time.perf_counter()
-
+    options: _ComputeOptions = _ComputeOptions(),
+) -> StudyCorrelations:
     load_start = time.perf_counter()
-    expression_matrix = load_gene_expression_matrix(session, descriptor.study_key)
+    matrix = load_expression_array(session, descriptor.study_key)
+    column_strata = (
+        load_sample_illness_keys(session, descriptor.study_key, matrix.sample_keys)
+        if options.needs_strata
+        else None
+    )
     load_seconds = time.perf_counter() - load_start
+    # Release the read transaction before the CPU-bound part.
+    session.rollback()
+    return _compute_matrix(
+        descriptor,
+        matrix,
+        load_seconds=load_seconds,
+        options=options,
+        column_strata=column_strata,
+    )
 
-    gene_count = len(expression_matrix)
-    sample_count = _count_samples(expression_matrix)
 
-    if not expression_matrix:
-        deleted = delete_gene_pair_correlations_for_study(session, descriptor.study_key)
-        session.commit()
-        total_seconds = time.perf_counter() - total_start
-        LOGGER.warning(
-            "Study %s has no expression data; cleared %s existing correlations",
-            descriptor.accession,
-            deleted,
+def _compute_matrix(
+    descriptor: StudyDescriptor,
+    matrix: ExpressionMatrix,
+    *,
+    load_seconds: float,
+    options: _ComputeOptions,
+    column_strata: list[int | None] | None = None,
+) -> StudyCorrelations:
+    """Correlate ``matrix``; ``column_strata`` (one illness key per column) adds strata."""
+
+    measured = _measured_columns(matrix)
+    values, gene_keys = matrix.values[:, measured], matrix.gene_keys
+    if column_strata is not None:
+        column_strata = [
+            stratum for stratum, keep in zip(column_strata, measured.tolist()) if keep
+        ]
+    gene_count, sample_count = values.shape
+    computed_at = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+    computation = StudyCorrelations(
+        descriptor=descriptor,
+        gene_count=gene_count,
+        sample_count=sample_count,
+        correlation_count=0,
+        load_seconds=load_seconds,
+        compute_seconds=0.0,
+        computed_at=computed_at,
+        gene_keys=gene_keys,
+        method=options.method,
+    )
+    if not gene_count:
+        return computation
+
+    compute_start = time.perf_counter()
+    persistence_filter = options.persistence_filter
+    stratified = column_strata if options.stratify_by_illness else None
+    if options.tile_size:
+        tiles = iter_pair_correlation_tiles(
+            values,
+            gene_keys,
+            tile_size=options.tile_size,
+            bootstrap=options.bootstrap,
+            method=options.method,
         )
-        return CorrelationMetrics(
-            study_key=descriptor.study_key,
-            study_accession=descriptor.accession,
-            gene_count=0,
-            sample_count=0,
-            correlation_count=0,
-            deleted_count=deleted,
-            load_seconds=load_seconds,
-            compute_seconds=0.0,
-            write_seconds=0.0,
-            total_seconds=total_seconds,
+        if stratified is not None:
+            tiles = itertools.chain(
+                tiles,
+                iter_stratified_pair_correlation_tiles(
+                    values,
+                    gene_keys,
+                    stratified,
+                    tile_size=options.tile_size,
+                    bootstrap=options.bootstrap,
+                    method=options.method,
+                ),
+            )
+        directory = tempfile.mkdtemp(prefix="correlation-tiles-")
+        try:
+            (
+                computation.tile_paths,
+                computation.correlation_count,
+                computation.pruned_count,
+                computation.study_pruned_count,
+            ) = _compute_tiles(
+                tiles,
+                gene_keys,
+                directory=pathlib.Path(directory),
+                persistence_filter=persistence_filter,
+            )
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        computation.tile_directory = directory
+    else:
+        pair_sets = [
+            compute_pair_correlations(
+                values, gene_keys, bootstrap=options.bootstrap, method=options.method
+            )
+        ]
+        if stratified is not None:
+            pair_sets.extend(
+                compute_stratified_pair_correlations(
+                    values,
+                    gene_keys,
+                    stratified,
+                    bootstrap=options.bootstrap,
+                    method=options.method,
+                )
+            )
+        for pairs in pair_sets:
+            kept = prune_pair_correlations(pairs, gene_keys, persistence_filter)
+            computation.pair_sets.append(kept)
+            computation.correlation_count += len(kept)
+            computation.pruned_count += len(pairs) - len(kept)
+            if pairs.illness_key is None:
+                computation.study_pruned_count += len(pairs) - len(kept)
+    if options.differential_reference is not None and column_strata is not None:
+        computation.differential = compute_differential_correlations(
+            values,
+            gene_keys,
+            column_strata,
+            reference=options.differential_reference,
+            method=options.method,
         )
+    computation.compute_seconds = time.perf_counter() - compute_start
+    return computation
 
-    compute_start = time.perf_counter()
-    correlations = compute_gene_pair_correlations(
-        expression_matrix,
-        study_key=descriptor.study_key,
+
+def _insert_pairs(
+    session: Session,
+    computation: StudyCorrelations,
+    pairs: PairCorrelations,
+    *,
+    page_size: int,
+) -> None:
+    insert_gene_pair_correlation_columns(
+        session,
+        study_key=computation.descriptor.study_key,
+        computed_at=computation.computed_at,
+        gene_a_keys=pairs.gene_a_keys,
+        gene_b_keys=pairs.gene_b_keys,
+        rho=pairs.rho,
+        p_values=pairs.p_values,
+        q_values=pairs.q_values,
+        n_samples=pairs.n_samples,
+        illness_key=pairs.illness_key,
+        rho_lower=pairs.rho_lower,
+        rho_upper=pairs.rho_upper,
+        method=pairs.method,
+        page_size=page_size,
+    )
+
+
+def _apply_study_to_meta(
+    session: Session, study_key: int, *, sign: int, method: str, page_size: int
+) -> None:
+    """Add (``sign=1``) or remove (``sign=-1``) a study's stored pairs in the meta sums."""
+
+    contributions = fisher_z_contributions(
+        *load_study_pair_correlations(session, study_key, method=method), sign=sign
+    )
+    apply_meta_correlation_sums(
+        session,
+        contributions,
+        updated_at=dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        method=method,
+        page_size=page_size,
+    )
+
+
+def _cache_path(
+    config: AppConfig,
+    descriptor: StudyDescriptor,
+    fingerprint: ExpressionFingerprint,
+    parameters: str,
+) -> pathlib.Path | None:
+    """Where the study's results are cached, or ``None`` when they are not cached.
+
+    Differential comparisons are not part of the cache, so it is not used
+    while they are enabled.
+    """
+
+    directory = config.correlation.cache_directory
+    if directory is None or config.correlation.differential_reference:
+        return None
+    return cache_file_path(directory, descriptor.accession, fingerprint, parameters)
+
+
+def _restore_from_cache(descriptor: StudyDescriptor, cache_path: pathlib.Path) -> StudyCorrelations:
+    load_start = time.perf_counter()
+    cached = read_result_cache(cache_path)
+    return StudyCorrelations(
+        descriptor=descriptor,
+        gene_count=len(cached.gene_keys),
+        sample_count=cached.sample_count,
+        correlation_count=cached.correlation_count,
+        load_seconds=time.perf_counter() - load_start,
+        compute_seconds=0.0,
+        computed_at=cached.computed_at,
+        pruned_count=cached.pruned_count,
+        study_pruned_count=cached.study_pruned_count,
+        pair_sets=cached.pair_sets,
+        gene_keys=cached.gene_keys,
+        restored=True,
+        method=cached.method,
     )
-    compute_seconds = time.perf_counter() - compute_start
 
+
+def _write_cache(computation: StudyCorrelations, cache_path: pathlib.Path) -> None:
+    if computation.gene_keys is None or computation.restored:
+        return
+    try:
+        write_result_cache(
+            cache_path,
+            gene_keys=computation.gene_keys,
+            sample_count=computation.sample_count,
+            computed_at=computation.computed_at,
+            pruned_count=computation.pruned_count,
+            study_pruned_count=computation.study_pruned_count,
+            method=computation.method,
+            pair_sets=itertools.chain(
+                computation.pair_sets,
+                (_load_tile(tile_path) for tile_path in computation.tile_paths),
+            ),
+        )
+    except OSError:
+        LOGGER.warning("Could not write correlation cache %s", cache_path, exc_info=True)
+
+
+def _persist_study(
+    session: Session,
+    computation: StudyCorrelations,
+    *,
+    fingerprint: ExpressionFingerprint | None = None,
+    parameters: str | None = None,
+    page_size: int = CORRELATION_WRITE_PAGE_SIZE,
+    meta_analysis: bool = False,
+    cache_path: pathlib.Path | None = None,
+) -> CorrelationMetrics:
+    """Replace the study's stored correlations with ``computation`` in one transaction.
+
+    The old rows go in one set-based ``DELETE``; the new ones are streamed
+    through Core inserts of ``page_size`` rows, one tile at a time.
+
+    When ``fingerprint`` is given it is recorded alongside ``parameters`` in
+    the same transaction so later runs can skip the unchanged study. The
+    old rows' share of ``fact_gene_pair_meta`` is subtracted before they are
+    deleted, and with ``meta_analysis`` the new rows are added back. Once
+    committed, freshly computed results are also saved to ``cache_path``.
+    """
+
+    descriptor = computation.descriptor
+    method = computation.method
     write_start = time.perf_counter()
-    deleted = delete_gene_pair_correlations_for_study(session, descriptor.study_key)
-    if correlations:
-        bulk_insert_gene_pair_correlations(session, correlations)
-    session.commit()
+    try:
+        if is_study_in_meta_analysis(session, descriptor.study_key, method=method):
+            _apply_study_to_meta(
+                session, descriptor.study_key, sign=-1, method=method, page_size=page_size
+            )
+            set_study_in_meta_analysis(session, descriptor.study_key, False, method=method)
+        deleted = delete_gene_pair_correlations_for_study(
+            session, descriptor.study_key, method=method
+        )
+        for pairs in computation.pair_sets:
+            _insert_pairs(session, computation, pairs, page_size=page_size)
+        for tile_path in computation.tile_paths:
+            _insert_pairs(session, computation, _load_tile(tile_path), page_size=page_size)
+        delete_differential_correlations_for_study(session, descriptor.study_key, method=method)
+        for comparison in computation.differential:
+            insert_differential_correlations(
+                session,
+                comparison,
+                study_key=descriptor.study_key,
+                computed_at=computation.computed_at,
+                page_size=page_size,
+            )
+        if fingerprint is not None and parameters is not None:
+            record_correlation_refresh(
+                session,
+                descriptor.study_key,
+                fingerprint,
+                parameters,
+                pruned_count=computation.study_pruned_count,
+                method=method,
+            )
+            if meta_analysis:
+                session.flush()
+                _apply_study_to_meta(
+                    session, descriptor.study_key, sign=1, method=method, page_size=page_size
+                )
+                set_study_in_meta_analysis(session, descriptor.study_key, True, method=method)
+        session.commit()
+        if cache_path is not None:
+            _write_cache(computation, cache_path)
+    finally:
+        if computation.tile_directory:
+            shutil.rmtree(computation.tile_directory, ignore_errors=True)
     write_seconds = time.perf_counter() - write_start
 
-    total_seconds = time.perf_counter() - total_start
+    if not computation.gene_count:
+        LOGGER.warning(
+            "Study %s has no expression data; cleared %s existing correlations",
+            descriptor.accession,
+            deleted,
+        )
     return CorrelationMetrics(
         study_key=descriptor.study_key,
         study_accession=descriptor.accession,
-        gene_count=gene_count,
-        sample_count=sample_count,
-        correlation_count=len(correlations),
+        gene_count=computation.gene_count,
+        sample_count=computation.sample_count,
+        correlation_count=computation.correlation_count,
         deleted_count=deleted,
-        load_seconds=load_seconds,
-        compute_seconds=compute_seconds,
+        load_seconds=computation.load_seconds,
+        compute_seconds=computation.compute_seconds,
         write_seconds=write_seconds,
-        total_seconds=total_seconds,
+        total_seconds=computation.load_seconds + computation.compute_seconds + write_seconds,
+        tile_count=len(computation.tile_paths),
+        pruned_count=computation.pruned_count,
+        differential_count=sum(len(comparison) for comparison in computation.differential),
+        restored=computation.restored,
     )
 
 
+_WORKER_SESSION_FACTORY: sessionmaker[Session] | None = None
+
+
+def _limit_blas_threads(threads: int) -> None:
+    """Cap this worker process's BLAS/OpenMP thread pools at ``threads``.
+
+    NumPy is already imported when a spawned worker's initializer runs, so
+    pools its BLAS has loaded are resized with ``threadpoolctl`` when it is
+    installed; the environment variables, set in the worker only, cover pools
+    started later.
+    """
+
+    os.environ.update({name: str(threads) for name in BLAS_THREAD_VARIABLES})
+    if _threadpool_limits is not None:
+        _threadpool_limits(limits=threads)
+    else:
+        LOGGER.debug("threadpoolctl is not installed; BLAS thread caps rely on the environment")
+
+
+def _initialize_worker(config: AppConfig, blas_threads: int) -> None:
+    global _WORKER_SESSION_FACTORY
+    _limit_blas_threads(blas_threads)
+    engine = create_engine_with_retries(config, workers=1)
+    atexit.register(engine.dispose)
+    _WORKER_SESSION_FACTORY = create_session_factory(engine)
+
+
+def _compute_study_in_worker(
+    descriptor: StudyDescriptor, options: _ComputeOptions
+) -> StudyCorrelations:
+    assert _WORKER_SESSION_FACTORY is not None, "worker initializer did not run"
+    with _WORKER_SESSION_FACTORY() as session:
+        return _compute_study(session, descriptor, options)
+
+
+StudyOutcome = tuple[StudyDescriptor, StudyCorrelations | BaseException]
+
+
+def _iter_sequential_computations(
+    session_factory: sessionmaker[Session],
+    descriptors: list[StudyDescriptor],
+    options: _ComputeOptions,
+) -> Iterator[StudyOutcome]:
+    for descriptor in descriptors:
+        LOGGER.info(
+            "Processing correlations for study %s (%s)",
+            descriptor.accession,
+            descriptor.study_key,
+        )
+        with session_factory() as session:
+            try:
+                outcome = _compute_study(session, descriptor, options)
+            except Exception as exc:  # reported by the writer loop
+                outcome = exc
+        yield descriptor, outcome
+
+
+def _iter_cached_computations(
+    descriptors: list[StudyDescriptor],
+    cache_paths: dict[int, pathlib.Path | None],
+) -> Iterator[StudyOutcome]:
+    for descriptor in descriptors:
+        cache_path = cache_paths[descriptor.study_key]
+        assert cache_path is not None
+        try:
+            outcome: StudyCorrelations | BaseException = _restore_from_cache(
+                descriptor, cache_path
+            )
+        except Exception as exc:  # reported by the writer loop
+            # Drop the unreadable file so the next run recomputes the study.
+            cache_path.unlink(missing_ok=True)
+            outcome = exc
+        yield descriptor, outcome
+
+
+def _iter_parallel_computations(
+    config: AppConfig,
+    descriptors: list[StudyDescriptor],
+    options: _ComputeOptions,
+    *,
+    workers: int,
+) -> Iterator[StudyOutcome]:
+    """Compute studies on a process pool, yielding results as they complete.
+
+    At most ``2 x workers`` studies are in flight so finished results cannot
+    pile up faster than the single writer drains them. Workers are spawned
+    (not forked) so they never inherit the parent's engine or locks.
+    """
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    remaining = iter(descriptors)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_initialize_worker,
+        initargs=(config, threads),
+    ) as executor:
+        pending: dict[concurrent.futures.Future[StudyCorrelations], StudyDescriptor] = {}
+
+        def submit_next() -> None:
+            descriptor = next(remaining, None)
+            if descriptor is None:
+                return
+            LOGGER.info(
+                "Processing correlations for study %s (%s)",
+                descriptor.accession,
+                descriptor.study_key,
+            )
+            future = executor.submit(_compute_study_in_worker, descriptor, options)
+            pending[future] = descriptor
+
+        for _ in range(2 * workers):
+            submit_next()
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                descriptor = pending.pop(future)
+                try:
+                    outcome: StudyCorrelations | BaseException = future.result()
+                except Exception as exc:  # reported by the writer loop
+                    outcome = exc
+                yield descriptor, outcome
+                submit_next()
+
+
 def _log_metrics(metrics: CorrelationMetrics, logging_config) -> None:
     LOGGER.info(
         "Correlation refresh for study %s (%s) loaded %s genes across %s samples in %.2fs",
@@ -119,12 +788,37 @@ def _log_metrics(metrics: CorrelationMetrics, logging_config) -> None:
         metrics.sample_count,
         metrics.load_seconds,
     )
-    LOGGER.info(
-        "Computed %s correlation pairs for study %s in %.2fs",
-        metrics.correlation_count,
-        metrics.study_accession,
-        metrics.compute_seconds,
-    )
+    if metrics.restored:
+        LOGGER.info(
+            "Restored %s correlation pairs for study %s from the result cache",
+            metrics.correlation_count,
+            metrics.study_accession,
+        )
+    else:
+        LOGGER.info(
+            "Computed %s correlation pairs for study %s in %.2fs",
+            metrics.correlation_count,
+            metrics.study_accession,
+            metrics.compute_seconds,
+        )
+    if metrics.pruned_count:
+        LOGGER.info(
+            "Pruned %s correlation pairs for study %s below the persistence thresholds",
+            metrics.pruned_count,
+            metrics.study_accession,
+        )
+    if metrics.differential_count:
+        LOGGER.info(
+            "Compared %s correlation pairs between illnesses for study %s",
+            metrics.differential_count,
+            metrics.study_accession,
+        )
+    if metrics.tile_count:
+        LOGGER.info(
+            "Correlations for study %s were computed and written in %s tile(s)",
+            metrics.study_accession,
+            metrics.tile_count,
+        )
     LOGGER.info(
         "Persisted correlation results for study %s in %.2fs (replaced %s rows)",
         metrics.study_accession,
@@ -162,15 +856,223 @@ def _resolve_target_studies(
     return descriptors, missing
 
 
+def _apply_global_fdr(
+    session_factory: sessionmaker[Session], *, method: str, page_size: int
+) -> int:
+    """Benjamini-Hochberg across every stored whole-study ``method`` pair of every study.
+
+    Per-illness stratum rows are a separate family per illness and keep their
+    per-study ``q_value`` only; their ``q_value_global`` stays NULL.
+
+    All p-values are streamed through an external sort, then each page of
+    rows is read again and its ``q_value_global`` written with one bulk
+    UPDATE per page. Pairs pruned before persistence were still tested; they
+    are counted as ``p = 1`` so the global q-values stay conservative.
+    Returns the number of rows updated.
+    """
+
+    updated = 0
+    with tempfile.TemporaryDirectory(prefix="correlation-global-fdr-") as spill_root:
+        adjuster = SpilledBenjaminiHochberg(spill_root)
+        try:
+            with session_factory() as session:
+                for _, p_values in iter_gene_pair_p_value_pages(
+                    session, page_size, method=method
+                ):
+                    adjuster.add(p_values)
+                pruned = count_pruned_gene_pairs(session, method=method)
+                for start in range(0, pruned, page_size):
+                    adjuster.add(np.ones(min(page_size, pruned - start)))
+                adjuster.finalize()
+                session.rollback()
+
+                for keys, p_values in iter_gene_pair_p_value_pages(
+                    session, page_size, method=method
+                ):
+                    update_global_q_values(session, keys, adjuster.q_values(p_values))
+                    session.commit()
+                    updated += len(keys)
+        finally:
+            adjuster.close()
+    return updated
+
+
+def _catch_up_meta_analysis(
+    session_factory: sessionmaker[Session], *, method: str, page_size: int
+) -> int:
+    """Add refreshed studies not yet counted in ``fact_gene_pair_meta``, one per commit.
+
+    Studies refreshed by this run are already counted; this picks up the
+    ones refreshed while the meta-analysis was disabled. Returns how many
+    studies were added.
+    """
+
+    with session_factory() as session:
+        study_keys = iter_studies_missing_from_meta_analysis(session, method=method)
+        for study_key in study_keys:
+            _apply_study_to_meta(
+                session, study_key, sign=1, method=method, page_size=page_size
+            )
+            set_study_in_meta_analysis(session, study_key, True, method=method)
+            session.commit()
+    return len(study_keys)
+
+
+def _refresh_parameters(config: AppConfig) -> str:
+    """Serialise the settings that change stored correlation values.
+
+    ``tile_size`` and ``workers`` only affect how results are produced, so
+    they are deliberately left out.
+    """
+
+    parameters = {
+        "method": config.correlation.method,
+        "min_samples": MIN_SAMPLES_FOR_CORRELATION,
+        "min_abs_rho": config.correlation.min_abs_rho,
+        "max_q": config.correlation.max_q,
+        "top_k": config.correlation.top_k,
+        "stratify_by_illness": config.correlation.stratify_by_illness,
+        "differential_reference": config.correlation.differential_reference,
+    }
+    if config.correlation.bootstrap_resamples:
+        # Only recorded when enabled, so existing refreshes stay current.
+        parameters["bootstrap"] = [
+            config.correlation.bootstrap_resamples,
+            config.correlation.bootstrap_confidence,
+        ]
+    return json.dumps(parameters, sort_keys=True)
+
+
+def _select_stale_studies(
+    session_factory: sessionmaker[Session],
+    descriptors: list[StudyDescriptor],
+    parameters: str,
+    *,
+    method: str,
+    force: bool,
+) -> tuple[list[StudyDescriptor], dict[int, ExpressionFingerprint]]:
+    """Fingerprint each study and drop those already refreshed with the same inputs."""
+
+    stale: list[StudyDescriptor] = []
+    fingerprints: dict[int, ExpressionFingerprint] = {}
+    with session_factory() as session:
+        for descriptor in descriptors:
+            fingerprint = compute_expression_fingerprint(session, descriptor.study_key)
+            fingerprints[descriptor.study_key] = fingerprint
+            if not force and is_correlation_refresh_current(
+                session, descriptor.study_key, fingerprint, parameters, method=method
+            ):
+                LOGGER.info(
+                    "Correlations for study %s are up to date; skipping",
+                    descriptor.accession,
+                )
+                continue
+            stale.append(descriptor)
+    return stale, fingerprints
+
+
+def refresh_global_q_values(session_factory: sessionmaker[Session], config: AppConfig) -> int:
+    """Recompute ``q_value_global`` for the configured method and log the pass.
+
+    Run once after a batch of study refreshes (the job, or an ETL run with
+    inline correlations), since every stored pair's global q-value depends on
+    all studies. Returns the number of rows updated.
+    """
+
+    fdr_start = time.perf_counter()
+    updated = _apply_global_fdr(
+        session_factory,
+        method=config.correlation.method,
+        page_size=config.correlation.write_page_size,
+    )
+    LOGGER.info(
+        "Updated global q-values for %s correlation pairs in %.2fs",
+        updated,
+        time.perf_counter() - fdr_start,
+    )
+    return updated
+
+
+def refresh_study_correlations(
+    session: Session,
+    config: AppConfig,
+    descriptor: StudyDescriptor,
+    matrix: ExpressionMatrix | None = None,
+) -> CorrelationMetrics:
+    """Recompute and store one study's correlations.
+
+    ``matrix`` lets a caller that already holds the study's expression values
+    (the ETL, right after writing them) skip the database read; without it
+    the facts are loaded as in :func:`run_correlation_job`. The study's
+    refresh fingerprint is recorded, so the next job run skips it. Results
+    already in the configured cache are restored instead of recomputed.
+    Global q-values are not touched; call :func:`refresh_global_q_values`
+    once the batch of studies is done.
+    """
+
+    fingerprint = compute_expression_fingerprint(session, descriptor.study_key)
+    parameters = _refresh_parameters(config)
+    cache_path = _cache_path(config, descriptor, fingerprint, parameters)
+    options = _compute_options(config, session)
+    if cache_path is not None and cache_path.exists():
+        computation = _restore_from_cache(descriptor, cache_path)
+    elif matrix is None:
+        computation = _compute_study(session, descriptor, options)
+    else:
+        computation = _compute_matrix(
+            descriptor,
+            matrix,
+            load_seconds=0.0,
+            options=options,
+            column_strata=(
+                load_sample_illness_keys(session, descriptor.study_key, matrix.sample_keys)
+                if options.needs_strata
+                else None
+            ),
+        )
+    metrics = _persist_study(
+        session,
+        computation,
+        fingerprint=fingerprint,
+        parameters=parameters,
+        page_size=config.correlation.write_page_size,
+        meta_analysis=config.correlation.meta_analysis,
+        cache_path=cache_path,
+    )
+    _log_metrics(metrics, config.logging)
+    return metrics
+
+
+def _finish_meta_analysis(
+    config: AppConfig, session_factory: sessionmaker[Session]
+) -> None:
+    if not config.correlation.meta_analysis:
+        return
+    added = _catch_up_meta_analysis(
+        session_factory,
+        method=config.correlation.method,
+        page_size=config.correlation.write_page_size,
+    )
+    if added:
+        LOGGER.info("Added %s previously refreshed study(ies) to the meta-analysis", added)
+
+
 def run_correlation_job(
     config: AppConfig,
     *,
     study_accessions: Iterable[str] | None = None,
+    force: bool = False,
 ) -> None:
-    """Execute the correlation refresh job for the given studies."""
+    """Execute the correlation refresh job for the given studies.
+
+    Studies whose expression fingerprint and parameters match their last
+    successful refresh are skipped unless ``force`` is set.
+    """
 
+    _persistence_filter(config)
     configure_logging(config)
-    engine = create_engine_with_retries(config)
+    engine = create_engine_with_retries(config, workers=1)
+    Base.metadata.create_all(engine)
     session_factory = create_session_factory(engine)
 
     descriptors, missing = _resolve_target_studies(session_factory, study_accessions)
@@ -184,6 +1086,19 @@ def run_correlation_job(
         LOGGER.warning("No studies with expression data available for correlation refresh")
         return
 
+    parameters = _refresh_parameters(config)
+    descriptors, fingerprints = _select_stale_studies(
+        session_factory,
+        descriptors,
+        parameters,
+        method=config.correlation.method,
+        force=force,
+    )
+    if not descriptors:
+        LOGGER.info("All requested studies already have up-to-date correlations")
+        _finish_meta_analysis(config, session_factory)
+        return
+
     total_start = time.perf_counter()
     processed: list[CorrelationMetrics] = []
     failures = 0
@@ -193,15 +1108,53 @@ def run_correlation_job(
         len(descriptors),
     )
 
-    for descriptor in descriptors:
+    cache_paths = {
+        descriptor.study_key: _cache_path(
+            config, descriptor, fingerprints[descriptor.study_key], parameters
+        )
+        for descriptor in descriptors
+    }
+    cached = [
+        descriptor
+        for descriptor in descriptors
+        if (path := cache_paths[descriptor.study_key]) is not None and path.exists()
+    ]
+    if cached:
+        LOGGER.info("Restoring %s study(ies) from the correlation result cache", len(cached))
+    descriptors = [descriptor for descriptor in descriptors if descriptor not in cached]
+
+    workers = max(1, min(config.correlation.workers, len(descriptors)))
+    if workers > 1 and is_memory_sqlite(config.database.connection_string):
+        LOGGER.warning("In-memory SQLite cannot be shared with worker processes; using 1 worker")
+        workers = 1
+    with session_factory() as session:
+        options = _compute_options(config, session)
+    if workers > 1:
+        LOGGER.info("Computing correlations on %s worker processes", workers)
+        computations = _iter_parallel_computations(
+            config, descriptors, options, workers=workers
+        )
+    else:
+        computations = _iter_sequential_computations(session_factory, descriptors, options)
+    computations = itertools.chain(
+        _iter_cached_computations(cached, cache_paths), computations
+    )
+
+    # Only this process writes, so per-study delete+insert never contend.
+    for descriptor, outcome in computations:
         session = session_factory()
         try:
-            LOGGER.info(
-                "Processing correlations for study %s (%s)",
-                descriptor.accession,
-                descriptor.study_key,
+            if isinstance(outcome, BaseException):
+                raise outcome
+            metrics = _persist_study(
+                session,
+                outcome,
+                fingerprint=fingerprints[descriptor.study_key],
+                parameters=parameters,
+                page_size=config.correlation.write_page_size,
+                meta_analysis=config.correlation.meta_analysis,
+                cache_path=cache_paths[descriptor.study_key],
             )
-            metrics = _process_single_study(session, descriptor)
         except Exception:
             failures += 1
             session.rollback()
@@ -237,5 +1190,15 @@ def run_correlation_job(
             failures,
         )
 
+    if processed and config.correlation.global_fdr:
+        refresh_global_q_values(session_factory, config)
+    _finish_meta_analysis(config, session_factory)
+    log_pool_metrics(engine)
+
 
-__all__ = ["run_correlation_job"]
+__all__ = [
+    "CorrelationMetrics",
+    "refresh_global_q_values",
+    "refresh_study_correlations",
+    "run_correlation_job",
+]
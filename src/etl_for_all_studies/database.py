@@ -2,19 +2,131 @@
 from __future__ import annotations
 
 import logging
+import threading
 import time
 from contextlib import contextmanager
-from typing import Iterator
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, TypeVar
 
 from sqlalchemy import create_engine, event
-from sqlalchemy.engine import Engine
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import DBAPIError, OperationalError
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
-from .config import AppConfig
+from .config import AppConfig, DatabaseConfig
 
 LOGGER = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Sessions held by a single study worker: the worker's own session. The
+# pipelined parser thread only reads files and never checks out a connection.
+CONNECTIONS_PER_WORKER = 1
+# Short-lived sessions opened outside the workers (study discovery, bookkeeping).
+RESERVED_CONNECTIONS = 1
+
+
+@dataclass(slots=True)
+class PoolMetrics:
+    """Connection pool usage observed over the life of an engine."""
+
+    pool_size: int
+    max_overflow: int
+    checkouts: int = 0
+    checked_out: int = 0
+    peak_checked_out: int = 0
+    peak_overflow: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_checkout(self, wait_seconds: float, overflow: int) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            self.peak_overflow = max(self.peak_overflow, overflow)
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def record_checkin(self) -> None:
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    @property
+    def mean_wait_seconds(self) -> float:
+        return (self.total_wait_seconds / self.checkouts) if self.checkouts else 0.0
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics(pool_size=self.size(), max_overflow=self._max_overflow)
+
+    def connect(self):  # type: ignore[override]
+        start = time.perf_counter()
+        connection = super().connect()
+        self.metrics.record_checkout(time.perf_counter() - start, max(0, self.overflow()))
+        return connection
+
+    def recreate(self) -> "MeteredQueuePool":
+        pool = super().recreate()
+        pool.metrics = self.metrics  # type: ignore[attr-defined]
+        return pool  # type: ignore[return-value]
+
+
+def derive_pool_settings(config: AppConfig, *, workers: int | None = None) -> tuple[int, int]:
+    """Return ``(pool_size, max_overflow)`` sized for the configured concurrency.
+
+    ``workers`` defaults to ``processing.max_concurrent_studies`` (one for
+    SQLite, which processes studies sequentially). Explicit ``pool_size`` and
+    ``max_overflow`` values in the database configuration take precedence.
+    """
+
+    if workers is None:
+        backend = make_url(config.database.connection_string).get_backend_name()
+        workers = 1 if backend == "sqlite" else config.processing.max_concurrent_studies
+    pool_size = max(1, workers) * CONNECTIONS_PER_WORKER + RESERVED_CONNECTIONS
+    max_overflow = max(1, pool_size // 4)
+
+    if config.database.pool_size is not None:
+        pool_size = config.database.pool_size
+    if config.database.max_overflow is not None:
+        max_overflow = config.database.max_overflow
+    return pool_size, max_overflow
+
+
+def is_memory_sqlite(connection_string: str) -> bool:
+    url = make_url(connection_string)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def get_pool_metrics(engine: Engine) -> PoolMetrics | None:
+    """Return checkout metrics for engines built by :func:`create_engine_with_retries`."""
+
+    return getattr(engine.pool, "metrics", None)
+
+
+def log_pool_metrics(engine: Engine) -> None:
+    metrics = get_pool_metrics(engine)
+    if metrics is None:
+        return
+    LOGGER.info(
+        "Connection pool (size=%s, overflow=%s): %s checkouts, peak in use %s, "
+        "peak overflow %s, wait mean %.3fs max %.3fs total %.2fs",
+        metrics.pool_size,
+        metrics.max_overflow,
+        metrics.checkouts,
+        metrics.peak_checked_out,
+        metrics.peak_overflow,
+        metrics.mean_wait_seconds,
+        metrics.max_wait_seconds,
+        metrics.total_wait_seconds,
+    )
+
 
 def _enable_sqlite_foreign_keys(engine: Engine) -> None:
     if engine.dialect.name == "sqlite":
@@ -25,24 +137,46 @@ def _enable_sqlite_foreign_keys(engine: Engine) -> None:
             cursor.close()
 
 
-def create_engine_with_retries(config: AppConfig) -> Engine:
-    """Create a SQLAlchemy engine with retry logic."""
+def create_engine_with_retries(
+    config: AppConfig, *, workers: int | None = None, single_connection: bool = False
+) -> Engine:
+    """Create a SQLAlchemy engine with retry logic.
+
+    The connection pool is sized from ``workers`` (see
+    :func:`derive_pool_settings`), or holds exactly one connection with
+    ``single_connection`` (a coordinator whose worker processes open their
+    own engines), and records checkout wait times, available through
+    :func:`get_pool_metrics`.
+    """
 
     delay = config.database.retry_backoff_seconds
     attempts = 0
     last_error: OperationalError | None = None
 
+    pool_options: dict[str, Any] = {}
+    if not is_memory_sqlite(config.database.connection_string):
+        pool_size, max_overflow = (
+            (1, 0) if single_connection else derive_pool_settings(config, workers=workers)
+        )
+        pool_options = {
+            "poolclass": MeteredQueuePool,
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": config.database.connection_timeout,
+        }
+
     while attempts <= config.database.max_retries:
         try:
             engine = create_engine(
                 config.database.connection_string,
                 pool_pre_ping=True,
-                pool_size=5,
-                max_overflow=10,
-                pool_timeout=config.database.connection_timeout,
                 future=True,
+                **pool_options,
             )
             _enable_sqlite_foreign_keys(engine)
+            if isinstance(engine.pool, MeteredQueuePool):
+                metrics = engine.pool.metrics
+                event.listen(engine, "checkin", lambda *_args: metrics.record_checkin())
             return engine
         except OperationalError as error:  # pragma: no cover - requires db failure
             last_error = error
@@ -81,8 +215,67 @@ def session_scope(session_factory: sessionmaker[Session]) -> Iterator[Session]:
         session.close()
 
 
+def is_transient_error(error: BaseException) -> bool:
+    """Return True for errors worth retrying on a fresh connection."""
+
+    if isinstance(error, OperationalError):
+        return True
+    return isinstance(error, DBAPIError) and bool(error.connection_invalidated)
+
+
+def run_with_retries(
+    session: Session,
+    operation: Callable[[Session], T],
+    *,
+    config: DatabaseConfig,
+    description: str,
+) -> T:
+    """Run ``operation`` (which must commit its own work) with retry and backoff.
+
+    On a transient failure the session is rolled back and closed, which drops
+    the broken connection and leaves the session ready to check out a new one,
+    and the operation is replayed from the start. ``operation`` must therefore
+    rebuild any pending objects on each call rather than reuse ones from a
+    failed attempt. A failure reported after the commit reached the database
+    replays work that is already stored, so ``operation`` must also tolerate
+    finding its own rows (see ``bulk_insert_expression_records``).
+    """
+
+    delay = config.retry_backoff_seconds
+    attempts = 0
+    while True:
+        try:
+            return operation(session)
+        except DBAPIError as error:
+            if not is_transient_error(error) or attempts >= config.max_retries:
+                raise
+            try:
+                session.rollback()
+            finally:
+                session.close()
+            attempts += 1
+            LOGGER.warning(
+                "%s failed (%s/%s): %s. Retrying in %s seconds...",
+                description,
+                attempts,
+                config.max_retries,
+                error.orig if error.orig is not None else error,
+                delay,
+            )
+            time.sleep(delay)
+            delay *= 2
+
+
 __all__ = [
+    "MeteredQueuePool",
+    "PoolMetrics",
     "create_engine_with_retries",
     "create_session_factory",
+    "derive_pool_settings",
+    "get_pool_metrics",
+    "is_memory_sqlite",
+    "is_transient_error",
+    "log_pool_metrics",
+    "run_with_retries",
     "session_scope",
 ]
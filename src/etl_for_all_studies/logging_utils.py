@@ -3,16 +3,21 @@ from __future__ import annotations
 
 import logging
 import logging.handlers
+import multiprocessing
 import pathlib
 from typing import Optional
 
 from .config import AppConfig
 
 
+def _log_level(config: AppConfig) -> int:
+    return getattr(logging, config.logging.log_level.upper(), logging.INFO)
+
+
 def configure_logging(config: AppConfig) -> None:
     """Configure logging based on configuration values."""
 
-    level = getattr(logging, config.logging.log_level.upper(), logging.INFO)
+    level = _log_level(config)
     log_dir = pathlib.Path(config.logging.log_directory)
     log_dir.mkdir(parents=True, exist_ok=True)
 
@@ -34,4 +39,28 @@ def configure_logging(config: AppConfig) -> None:
     )
 
 
-__all__ = ["configure_logging"]
+def configure_worker_logging(
+    config: AppConfig, log_queue: "multiprocessing.Queue[logging.LogRecord]"
+) -> None:
+    """Route a worker process's log records to ``log_queue`` for the parent to emit."""
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(_log_level(config))
+
+
+def start_log_listener(
+    log_queue: "multiprocessing.Queue[logging.LogRecord]",
+) -> logging.handlers.QueueListener:
+    """Emit records queued by worker processes through this process's root handlers."""
+
+    listener = logging.handlers.QueueListener(
+        log_queue, *logging.getLogger().handlers, respect_handler_level=True
+    )
+    listener.start()
+    return listener
+
+
+__all__ = ["configure_logging", "configure_worker_logging", "start_log_listener"]
@@ -0,0 +1,128 @@
+"""Fisher-z meta-analysis of per-study correlations kept as running sums."""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+try:  # pragma: no cover - exercised when SciPy is available
+    from scipy import special as _scipy_special  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover - lightweight fallback used in tests
+    _scipy_special = None
+
+# Fisher z needs n > 3; |rho| is capped so perfect correlations stay finite.
+MIN_SAMPLES_FOR_META = 4
+_MAX_ABS_RHO = 1.0 - 1e-12
+
+
+def fisher_z(rho: np.ndarray) -> np.ndarray:
+    """``atanh(rho)`` with ``|rho|`` capped just below one."""
+
+    return np.arctanh(np.clip(np.asarray(rho, dtype=np.float64), -_MAX_ABS_RHO, _MAX_ABS_RHO))
+
+
+def two_sided_normal_pvalues(z: np.ndarray) -> np.ndarray:
+    """``P(|Z| >= |z|)`` for standard normal ``Z``."""
+
+    scaled = np.abs(np.asarray(z, dtype=np.float64)) / math.sqrt(2.0)
+    if _scipy_special is not None:
+        return np.asarray(_scipy_special.erfc(scaled), dtype=np.float64)
+    return np.array([math.erfc(value) for value in scaled.ravel().tolist()]).reshape(scaled.shape)
+
+
+@dataclass(slots=True)
+class FisherZSums:
+    """Per-pair sums from which the inverse-variance meta-analysis follows.
+
+    Study ``i`` contributes weight ``w = n - 3`` and ``z = atanh(rho)``; the
+    columns hold ``sum(1)``, ``sum(w)``, ``sum(w z)``, ``sum(w z^2)`` and
+    ``sum(w^2)``. Sums are additive, so a study can be added or removed
+    (with ``sign = -1``) without revisiting the others.
+    """
+
+    gene_a_keys: np.ndarray
+    gene_b_keys: np.ndarray
+    study_count: np.ndarray
+    sum_weights: np.ndarray
+    sum_weighted_z: np.ndarray
+    sum_weighted_z_squared: np.ndarray
+    sum_squared_weights: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.gene_a_keys)
+
+
+def fisher_z_contributions(
+    gene_a_keys: np.ndarray,
+    gene_b_keys: np.ndarray,
+    rho: np.ndarray,
+    n_samples: np.ndarray,
+    *,
+    sign: int = 1,
+) -> FisherZSums:
+    """One study's contribution per pair; pairs with ``n < 4`` are dropped."""
+
+    usable = np.asarray(n_samples) >= MIN_SAMPLES_FOR_META
+    weights = np.asarray(n_samples, dtype=np.float64)[usable] - 3.0
+    z = fisher_z(np.asarray(rho)[usable])
+    weighted_z = weights * z
+    return FisherZSums(
+        gene_a_keys=np.asarray(gene_a_keys, dtype=np.int64)[usable],
+        gene_b_keys=np.asarray(gene_b_keys, dtype=np.int64)[usable],
+        study_count=np.full(len(weights), sign, dtype=np.int64),
+        sum_weights=sign * weights,
+        sum_weighted_z=sign * weighted_z,
+        sum_weighted_z_squared=sign * weighted_z * z,
+        sum_squared_weights=sign * weights * weights,
+    )
+
+
+@dataclass(slots=True)
+class MetaCorrelationSummary:
+    """Fixed-effect estimate and heterogeneity statistics derived from :class:`FisherZSums`.
+
+    ``q_statistic`` is Cochran's Q, ``i_squared`` the share of variation due
+    to heterogeneity and ``tau_squared`` the DerSimonian-Laird between-study
+    variance on the z scale; all three are zero for a single study.
+    """
+
+    rho: np.ndarray
+    z_score: np.ndarray
+    p_values: np.ndarray
+    q_statistic: np.ndarray
+    i_squared: np.ndarray
+    tau_squared: np.ndarray
+
+
+def summarize_fisher_z(sums: FisherZSums) -> MetaCorrelationSummary:
+    weights = sums.sum_weights
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_mean = np.where(weights > 0, sums.sum_weighted_z / weights, 0.0)
+        q_statistic = np.maximum(
+            sums.sum_weighted_z_squared - z_mean * sums.sum_weighted_z, 0.0
+        )
+        excess = np.maximum(q_statistic - (sums.study_count - 1), 0.0)
+        i_squared = np.where(q_statistic > 0, excess / q_statistic, 0.0)
+        scale = weights - np.where(weights > 0, sums.sum_squared_weights / weights, 0.0)
+        tau_squared = np.where(scale > 0, excess / scale, 0.0)
+    z_score = z_mean * np.sqrt(np.maximum(weights, 0.0))
+    return MetaCorrelationSummary(
+        rho=np.tanh(z_mean),
+        z_score=z_score,
+        p_values=two_sided_normal_pvalues(z_score),
+        q_statistic=q_statistic,
+        i_squared=i_squared,
+        tau_squared=tau_squared,
+    )
+
+
+__all__ = [
+    "FisherZSums",
+    "MIN_SAMPLES_FOR_META",
+    "MetaCorrelationSummary",
+    "fisher_z",
+    "fisher_z_contributions",
+    "summarize_fisher_z",
+    "two_sided_normal_pvalues",
+]
@@ -4,7 +4,18 @@ from __future__ import annotations
 import datetime as dt
 from typing import Optional
 
-from sqlalchemy import DateTime, Float, ForeignKey, Index, Integer, String, UniqueConstraint
+from sqlalchemy import (
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    UniqueConstraint,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -86,6 +97,26 @@ class FactExpression(Base):
     study: Mapped[DimStudy] = relationship(back_populates="expressions")
 
 
+class FactExpressionVector(Base):
+    """One packed float32 expression vector per gene and study.
+
+    ``expression_values`` holds ``sample_count`` little-endian float32 values
+    ordered by ascending ``dim_sample.sample_key`` for the study; missing
+    measurements are stored as NaN.
+    """
+
+    __tablename__ = "fact_expression_vector"
+    __table_args__ = (
+        UniqueConstraint("study_key", "gene_key", name="uq_expression_vector"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    study_key: Mapped[int] = mapped_column(ForeignKey("dim_study.study_key"), nullable=False)
+    gene_key: Mapped[int] = mapped_column(ForeignKey("dim_gene.gene_key"), nullable=False)
+    sample_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    expression_values: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
 class FactGenePairCorrelation(Base):
     __tablename__ = "fact_gene_pair_corr"
     __table_args__ = (
@@ -93,8 +124,23 @@ class FactGenePairCorrelation(Base):
             "gene_a_key",
             "gene_b_key",
             "study_key",
+            "illness_key",
+            "method",
             name="uq_gene_pair_corr",
         ),
+        # NULLs are distinct in the constraint above, so whole-study rows (NULL
+        # illness_key) get their own partial unique index. Backends without
+        # partial indexes skip it rather than reject every stratum row.
+        Index(
+            "uq_gene_pair_corr_study_rows",
+            "gene_a_key",
+            "gene_b_key",
+            "study_key",
+            "method",
+            unique=True,
+            sqlite_where=text("illness_key IS NULL"),
+            postgresql_where=text("illness_key IS NULL"),
+        ).ddl_if(dialect=("sqlite", "postgresql")),
         Index("ix_gene_pair_corr_gene_a", "gene_a_key"),
         Index("ix_gene_pair_corr_gene_b", "gene_b_key"),
         Index("ix_gene_pair_corr_study", "study_key"),
@@ -108,9 +154,14 @@ class FactGenePairCorrelation(Base):
     illness_key: Mapped[int | None] = mapped_column(
         ForeignKey("dim_illness.illness_key"), nullable=True
     )
+    # Correlation method of the row; rho_spearman holds that method's coefficient.
+    method: Mapped[str] = mapped_column(String(16), default="spearman", nullable=False)
     rho_spearman: Mapped[float] = mapped_column(Float, nullable=False)
+    rho_ci_lower: Mapped[float | None] = mapped_column(Float)
+    rho_ci_upper: Mapped[float | None] = mapped_column(Float)
     p_value: Mapped[float] = mapped_column(Float, nullable=False)
     q_value: Mapped[float | None] = mapped_column(Float)
+    q_value_global: Mapped[float | None] = mapped_column(Float)
     n_samples: Mapped[int] = mapped_column(Integer, nullable=False)
     computed_at: Mapped[str] = mapped_column(String(50), nullable=False)
     study_key: Mapped[int | None] = mapped_column(ForeignKey("dim_study.study_key"))
@@ -121,6 +172,79 @@ class FactGenePairCorrelation(Base):
     study: Mapped[DimStudy | None] = relationship()
 
 
+class FactGenePairMeta(Base):
+    """Cross-study Fisher-z meta-analysis of whole-study gene pair correlations.
+
+    The ``sum_*`` columns are running sums over contributing studies; the
+    remaining statistics are derived from them whenever they change. Each
+    correlation method is pooled separately.
+    """
+
+    __tablename__ = "fact_gene_pair_meta"
+    __table_args__ = (
+        UniqueConstraint("gene_a_key", "gene_b_key", "method", name="uq_gene_pair_meta"),
+        Index("ix_gene_pair_meta_gene_b", "gene_b_key"),
+    )
+
+    meta_key: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    gene_a_key: Mapped[int] = mapped_column(ForeignKey("dim_gene.gene_key"), nullable=False)
+    gene_b_key: Mapped[int] = mapped_column(ForeignKey("dim_gene.gene_key"), nullable=False)
+    method: Mapped[str] = mapped_column(String(16), default="spearman", nullable=False)
+    study_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    sum_weights: Mapped[float] = mapped_column(Float, nullable=False)
+    sum_weighted_z: Mapped[float] = mapped_column(Float, nullable=False)
+    sum_weighted_z_squared: Mapped[float] = mapped_column(Float, nullable=False)
+    sum_squared_weights: Mapped[float] = mapped_column(Float, nullable=False)
+    rho_meta: Mapped[float] = mapped_column(Float, nullable=False)
+    z_score: Mapped[float] = mapped_column(Float, nullable=False)
+    p_value: Mapped[float] = mapped_column(Float, nullable=False)
+    q_statistic: Mapped[float] = mapped_column(Float, nullable=False)
+    i_squared: Mapped[float] = mapped_column(Float, nullable=False)
+    tau_squared: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[str] = mapped_column(String(50), nullable=False)
+
+    gene_a: Mapped[DimGene] = relationship(foreign_keys=[gene_a_key])
+    gene_b: Mapped[DimGene] = relationship(foreign_keys=[gene_b_key])
+
+
+class FactGenePairDiffCorrelation(Base):
+    """Within-study difference in a gene pair's correlation between two illnesses."""
+
+    __tablename__ = "fact_gene_pair_diff_corr"
+    __table_args__ = (
+        UniqueConstraint(
+            "gene_a_key",
+            "gene_b_key",
+            "study_key",
+            "illness_key",
+            "reference_illness_key",
+            "method",
+            name="uq_gene_pair_diff_corr",
+        ),
+        Index("ix_gene_pair_diff_corr_study", "study_key"),
+    )
+
+    diff_key: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    study_key: Mapped[int] = mapped_column(ForeignKey("dim_study.study_key"), nullable=False)
+    illness_key: Mapped[int] = mapped_column(
+        ForeignKey("dim_illness.illness_key"), nullable=False
+    )
+    reference_illness_key: Mapped[int] = mapped_column(
+        ForeignKey("dim_illness.illness_key"), nullable=False
+    )
+    method: Mapped[str] = mapped_column(String(16), default="spearman", nullable=False)
+    gene_a_key: Mapped[int] = mapped_column(ForeignKey("dim_gene.gene_key"), nullable=False)
+    gene_b_key: Mapped[int] = mapped_column(ForeignKey("dim_gene.gene_key"), nullable=False)
+    rho_illness: Mapped[float] = mapped_column(Float, nullable=False)
+    rho_reference: Mapped[float] = mapped_column(Float, nullable=False)
+    n_illness: Mapped[int] = mapped_column(Integer, nullable=False)
+    n_reference: Mapped[int] = mapped_column(Integer, nullable=False)
+    z_score: Mapped[float] = mapped_column(Float, nullable=False)
+    p_value: Mapped[float] = mapped_column(Float, nullable=False)
+    q_value: Mapped[float | None] = mapped_column(Float)
+    computed_at: Mapped[str] = mapped_column(String(50), nullable=False)
+
+
 class EtlStudyState(Base):
     __tablename__ = "etl_study_state"
 
@@ -131,6 +255,27 @@ class EtlStudyState(Base):
     updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow, nullable=False)
 
 
+class EtlCorrelationRefresh(Base):
+    """Fingerprint of the expression facts behind a study's stored correlations of one method."""
+
+    __tablename__ = "etl_correlation_refresh"
+
+    study_key: Mapped[int] = mapped_column(
+        ForeignKey("dim_study.study_key"), primary_key=True
+    )
+    method: Mapped[str] = mapped_column(String(16), primary_key=True, default="spearman")
+    fact_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    max_fact_id: Mapped[int | None] = mapped_column(Integer)
+    checksum: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Canonical JSON of the correlation settings; bootstrap and filters can outgrow a VARCHAR.
+    parameters: Mapped[str] = mapped_column(Text, nullable=False)
+    # Whole-study pairs tested but not stored; illness strata are not counted.
+    pruned_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Whether the study's stored correlations are counted in fact_gene_pair_meta.
+    meta_applied: Mapped[bool] = mapped_column(Integer, default=0, nullable=False)
+    refreshed_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow, nullable=False)
+
+
 __all__ = [
     "Base",
     "DimGene",
@@ -139,6 +284,10 @@ __all__ = [
     "DimIllness",
     "DimPlatform",
     "FactExpression",
+    "FactExpressionVector",
     "FactGenePairCorrelation",
+    "FactGenePairDiffCorrelation",
+    "FactGenePairMeta",
+    "EtlCorrelationRefresh",
     "EtlStudyState",
 ]
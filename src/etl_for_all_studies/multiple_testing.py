@@ -0,0 +1,178 @@
+"""Multiple-testing corrections for p-values that do not fit in one array."""
+from __future__ import annotations
+
+import pathlib
+
+import numpy as np
+
+_P_VALUE_DTYPE = np.dtype(np.float64)
+
+# Values held in memory per sorted run, and per run while merging runs.
+DEFAULT_RUN_SIZE = 8_000_000
+DEFAULT_MERGE_CHUNK = 1_000_000
+
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted q-values; NaN p-values stay NaN."""
+
+    p_values = np.asarray(p_values, dtype=np.float64)
+    q_values = np.full(p_values.shape, np.nan)
+    valid = ~np.isnan(p_values)
+    m = int(valid.sum())
+    if not m:
+        return q_values
+
+    valid_p = p_values[valid]
+    order = np.argsort(valid_p, kind="stable")
+    scaled = valid_p[order] * m / np.arange(1, m + 1)
+    scaled = np.minimum.accumulate(scaled[::-1])[::-1]
+    adjusted = np.empty(m)
+    adjusted[order] = np.minimum(scaled, 1.0)
+    q_values[valid] = adjusted
+    return q_values
+
+
+def _merge_sorted_runs(
+    run_paths: list[pathlib.Path], output_path: pathlib.Path, *, chunk_size: int
+) -> None:
+    """K-way merge of sorted binary runs, ``chunk_size`` values per run in memory.
+
+    Each round emits every buffered value no larger than the smallest
+    buffered maximum among runs that still have unread data; those values
+    cannot be preceded by anything left on disk.
+    """
+
+    runs = [np.memmap(path, dtype=_P_VALUE_DTYPE, mode="r") for path in run_paths]
+    offsets = [0] * len(runs)
+    buffers = [np.empty(0, dtype=_P_VALUE_DTYPE) for _ in runs]
+    with output_path.open("wb") as handle:
+        while True:
+            for index, run in enumerate(runs):
+                if not buffers[index].size and offsets[index] < run.size:
+                    end = min(offsets[index] + chunk_size, run.size)
+                    buffers[index] = np.array(run[offsets[index] : end])
+                    offsets[index] = end
+            live = [index for index, buffer in enumerate(buffers) if buffer.size]
+            if not live:
+                break
+            pending = [index for index in live if offsets[index] < runs[index].size]
+            bound = min((buffers[index][-1] for index in pending), default=np.inf)
+            emitted = []
+            for index in live:
+                cut = int(np.searchsorted(buffers[index], bound, side="right"))
+                emitted.append(buffers[index][:cut])
+                buffers[index] = buffers[index][cut:]
+            merged = np.concatenate(emitted)
+            merged.sort(kind="stable")
+            merged.tofile(handle)
+    del runs
+
+
+class SpilledBenjaminiHochberg:
+    """Benjamini-Hochberg adjustment over p-values streamed in chunks.
+
+    P-values are buffered and written to disk as sorted runs of at most
+    ``run_size`` values. :meth:`finalize` merges the runs into one sorted file
+    and derives the q-value of every sorted position with a reverse pass of
+    bounded chunks; afterwards :meth:`q_values` maps any chunk of the same
+    p-values to its q-values with a binary search over the memory-mapped
+    files. Memory therefore stays bounded however many p-values are added.
+    NaN p-values are excluded from the test count and map to NaN.
+    """
+
+    def __init__(
+        self,
+        directory: str | pathlib.Path,
+        *,
+        run_size: int = DEFAULT_RUN_SIZE,
+        merge_chunk: int = DEFAULT_MERGE_CHUNK,
+    ) -> None:
+        self._directory = pathlib.Path(directory)
+        self._run_size = run_size
+        self._merge_chunk = merge_chunk
+        self._buffer: list[np.ndarray] = []
+        self._buffered = 0
+        self._runs: list[pathlib.Path] = []
+        self._finalized = False
+        self._sorted_p: np.ndarray | None = None
+        self._sorted_q: np.ndarray | None = None
+        self.count = 0
+
+    def add(self, p_values: np.ndarray) -> None:
+        if self._finalized:
+            raise RuntimeError("Cannot add p-values after finalize()")
+        p_values = np.asarray(p_values, dtype=_P_VALUE_DTYPE).ravel()
+        valid = p_values[~np.isnan(p_values)]
+        while valid.size:
+            room = self._run_size - self._buffered
+            self._buffer.append(valid[:room].copy())
+            self._buffered += min(room, valid.size)
+            self.count += min(room, valid.size)
+            valid = valid[room:]
+            if self._buffered >= self._run_size:
+                self._spill_run()
+
+    def _spill_run(self) -> None:
+        if not self._buffered:
+            return
+        run = np.concatenate(self._buffer)
+        run.sort(kind="stable")
+        path = self._directory / f"p_run_{len(self._runs):05d}.bin"
+        run.tofile(path)
+        self._runs.append(path)
+        self._buffer = []
+        self._buffered = 0
+
+    def finalize(self) -> None:
+        if self._finalized:
+            return
+        self._finalized = True
+        self._spill_run()
+        if not self.count:
+            return
+
+        sorted_path = self._directory / "p_sorted.bin"
+        if len(self._runs) == 1:
+            self._runs[0].replace(sorted_path)
+        else:
+            _merge_sorted_runs(self._runs, sorted_path, chunk_size=self._merge_chunk)
+            for path in self._runs:
+                path.unlink()
+        self._runs = []
+
+        sorted_p = np.memmap(sorted_path, dtype=_P_VALUE_DTYPE, mode="r")
+        q_path = self._directory / "q_sorted.bin"
+        sorted_q = np.memmap(q_path, dtype=_P_VALUE_DTYPE, mode="w+", shape=(self.count,))
+        running = np.inf
+        for end in range(self.count, 0, -self._merge_chunk):
+            start = max(0, end - self._merge_chunk)
+            scaled = sorted_p[start:end] * self.count / np.arange(start + 1, end + 1)
+            scaled = np.minimum.accumulate(scaled[::-1])[::-1]
+            np.minimum(scaled, running, out=scaled)
+            running = float(scaled[0])
+            sorted_q[start:end] = np.minimum(scaled, 1.0)
+        sorted_q.flush()
+        del sorted_q
+        self._sorted_p = sorted_p
+        self._sorted_q = np.memmap(q_path, dtype=_P_VALUE_DTYPE, mode="r")
+
+    def q_values(self, p_values: np.ndarray) -> np.ndarray:
+        if not self._finalized:
+            raise RuntimeError("finalize() must be called before looking up q-values")
+        p_values = np.asarray(p_values, dtype=_P_VALUE_DTYPE)
+        q_values = np.full(p_values.shape, np.nan)
+        valid = ~np.isnan(p_values)
+        if self._sorted_p is None or not valid.any():
+            return q_values
+        # Tied p-values share the q-value of the last of their run.
+        positions = np.searchsorted(self._sorted_p, p_values[valid], side="right") - 1
+        q_values[valid] = self._sorted_q[positions]
+        return q_values
+
+    def close(self) -> None:
+        self._buffer = []
+        self._sorted_p = None
+        self._sorted_q = None
+
+
+__all__ = ["SpilledBenjaminiHochberg", "benjamini_hochberg"]
@@ -1,21 +1,40 @@
 """Main orchestration logic for the genomic ETL pipeline."""
 from __future__ import annotations
 
+import atexit
 import concurrent.futures
+import contextlib
+import functools
 import logging
+import multiprocessing
 import pathlib
+import queue
+import threading
 import time
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass
-from typing import Iterable
+from typing import TypeVar
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session, sessionmaker
 
+from .batching import AdaptiveBatchSizer, CheckpointPolicy
 from .config import AppConfig
-from .database import create_engine_with_retries, create_session_factory
-from .expression_processing import ExpressionFormatError, iter_filtered_expression
+from .correlation_job import refresh_global_q_values, refresh_study_correlations
+from .database import (
+    create_engine_with_retries,
+    create_session_factory,
+    is_memory_sqlite,
+    log_pool_metrics,
+    run_with_retries,
+)
+from .expression_processing import (
+    ExpressionFormatError,
+    ExpressionRow,
+    iter_filtered_expression,
+)
 from .gene_filter import load_gene_filter
-from .logging_utils import configure_logging
+from .logging_utils import configure_logging, configure_worker_logging, start_log_listener
 from .metadata_processing import (
     MetadataFormatError,
     MetadataQuality,
@@ -26,16 +45,29 @@ from .metadata_processing import (
 from .models import Base, EtlStudyState, FactExpression
 from .repositories import (
     DimensionCache,
+    ExpressionMatrix,
+    ExpressionMatrixBuilder,
+    StudyDescriptor,
+    advance_checkpoint,
     bulk_insert_expression_records,
     bootstrap_cache,
     clear_state,
+    delete_expression_fact_chunk,
+    delete_expression_vectors_for_study,
     get_or_create_gene,
     get_or_create_sample,
     get_or_create_study,
+    rebuild_expression_vectors,
     upsert_state,
+    write_expression_vectors,
 )
 
 LOGGER = logging.getLogger(__name__)
+T = TypeVar("T")
+
+# Approximate width of a fact_expression row (three keys, a float and the
+# surrogate id) used to express checkpoint intervals in bytes.
+_FACT_ROW_BYTES = 40
 
 
 @dataclass(slots=True)
@@ -45,10 +77,114 @@ class StudyFiles:
     expression_file: pathlib.Path
 
 
+@dataclass(slots=True)
+class ExpressionLoadMetrics:
+    """Volume and pipelining metrics collected while loading expression facts."""
+
+    record_count: int = 0
+    gene_count: int = 0
+    batch_count: int = 0
+    checkpoint_count: int = 0
+    queue_samples: int = 0
+    queue_depth_total: int = 0
+    max_queue_depth: int = 0
+    writer_wait_seconds: float = 0.0
+    parser_wait_seconds: float = 0.0
+    final_batch_size: int = 0
+
+    @property
+    def mean_queue_depth(self) -> float:
+        return (self.queue_depth_total / self.queue_samples) if self.queue_samples else 0.0
+
+    def record_queue_depth(self, depth: int) -> None:
+        self.queue_samples += 1
+        self.queue_depth_total += depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+
+@dataclass(slots=True)
+class StudyLoadResult:
+    """Outcome of one study, returned to ``run_pipeline`` from threads or worker processes."""
+
+    study_accession: str
+    sample_count: int
+    elapsed_seconds: float
+    expression: ExpressionLoadMetrics
+
+
 class StudyProcessingError(RuntimeError):
     """Raised when processing a study fails."""
 
 
+_END_OF_BATCHES = object()
+
+
+class _BatchPrefetcher:
+    """Parse expression batches on a background thread into a bounded queue.
+
+    The calling thread keeps ownership of the database session and consumes the
+    queued batches, so commits overlap with parsing of the following batches.
+    Errors raised while parsing are re-raised on the consuming thread.
+    """
+
+    def __init__(
+        self,
+        batches: Iterable[list[ExpressionRow]],
+        *,
+        depth: int,
+        metrics: ExpressionLoadMetrics,
+    ) -> None:
+        self._batches = batches
+        self._queue: queue.Queue[object] = queue.Queue(maxsize=max(1, depth))
+        self._stop = threading.Event()
+        self._metrics = metrics
+        self._thread = threading.Thread(
+            target=self._produce, name="expression-parser", daemon=True
+        )
+
+    def __enter__(self) -> "_BatchPrefetcher":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _put(self, item: object) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def _produce(self) -> None:
+        try:
+            for batch in self._batches:
+                wait_start = time.perf_counter()
+                delivered = self._put(batch)
+                self._metrics.parser_wait_seconds += time.perf_counter() - wait_start
+                if not delivered:
+                    return
+        except BaseException as exc:  # re-raised by the consumer
+            self._put(exc)
+            return
+        self._put(_END_OF_BATCHES)
+
+    def __iter__(self) -> Iterator[list[ExpressionRow]]:
+        while True:
+            self._metrics.record_queue_depth(self._queue.qsize())
+            wait_start = time.perf_counter()
+            item = self._queue.get()
+            self._metrics.writer_wait_seconds += time.perf_counter() - wait_start
+            if item is _END_OF_BATCHES:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item  # type: ignore[misc]
+
+
 def discover_study_files(study_dir: pathlib.Path) -> StudyFiles:
     metadata_candidates = sorted(study_dir.glob("metadata_*.tsv"))
     if not metadata_candidates:
@@ -114,6 +250,72 @@ def _load_existing_expression_keys(session: Session, study_key: int) -> set[tupl
     return {(sample_key, gene_key) for sample_key, gene_key in rows}
 
 
+def _ensure_gene(
+    session: Session, cache: DimensionCache, gene_id: str, *, config: AppConfig
+) -> int:
+    """Create (or look up) a gene and commit it before facts reference it.
+
+    Committing new genes on their own keeps batch replays independent of keys
+    allocated inside a failed transaction.
+    """
+
+    def _create(active: Session) -> int:
+        try:
+            gene_key = get_or_create_gene(active, cache, gene_id)
+            active.commit()
+        except Exception:
+            cache.genes.pop(gene_id, None)
+            raise
+        return gene_key
+
+    return run_with_retries(
+        session, _create, config=config.database, description=f"Gene insert for {gene_id}"
+    )
+
+
+def _write_expression_batch(
+    session: Session,
+    *,
+    study_key: int,
+    facts: list[tuple[int, int, float]],
+    study_accession: str,
+    checkpoint: tuple[str, int] | None,
+) -> None:
+    bulk_insert_expression_records(
+        session,
+        [
+            {
+                "sample_key": sample_key,
+                "gene_key": gene_key,
+                "study_key": study_key,
+                "expression_value": expression_value,
+            }
+            for sample_key, gene_key, expression_value in facts
+        ],
+    )
+    if checkpoint is not None:
+        advance_checkpoint(
+            session,
+            study_accession,
+            last_gene=checkpoint[0],
+            last_sample_index=checkpoint[1],
+        )
+    session.commit()
+
+
+def _iter_row_batches(
+    rows: Iterable[ExpressionRow], next_batch_size: Callable[[], int]
+) -> Iterator[list[ExpressionRow]]:
+    batch: list[ExpressionRow] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= next_batch_size():
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def _process_metadata(
     session: Session,
     cache: DimensionCache,
@@ -169,7 +371,9 @@ def _process_expression(
     batch_size: int,
     resume_gene: str | None,
     resume_sample_index: int,
-) -> tuple[int, int]:
+    deduplicate: bool = True,
+    matrix_builder: ExpressionMatrixBuilder | None = None,
+) -> ExpressionLoadMetrics:
     sample_key_map: dict[str, int] = {}
     for sample in samples:
         key = (sample.gsm_accession, study_key)
@@ -182,74 +386,226 @@ def _process_expression(
 
     expected_samples = set(sample_key_map.keys())
 
-    existing_facts = _load_existing_expression_keys(session, study_key)
-
-    batch: list[FactExpression] = []
-    total_records = 0
-    total_genes = set()
-    last_gene = resume_gene
-    last_sample = resume_sample_index
-
-    for row in iter_filtered_expression(
-        str(study_files.expression_file),
-        allowed_genes=gene_filter,
-        sample_columns=expected_samples,
-        resume_gene=resume_gene,
-        resume_sample_index=resume_sample_index,
-    ):
-        last_gene = row.gene_id
-        last_sample = row.sample_index
-        gene_key = get_or_create_gene(session, cache, row.gene_id)
-        sample_key = sample_key_map[row.sample_accession]
-        cache.samples[(row.sample_accession, study_key)] = sample_key
-
-        fact_identity = (sample_key, gene_key)
-        if fact_identity in existing_facts:
-            continue
-
-        fact = FactExpression(
-            sample_key=sample_key,
-            gene_key=gene_key,
-            study_key=study_key,
-            expression_value=row.expression_value,
-        )
-        batch.append(fact)
-        existing_facts.add(fact_identity)
-        total_records += 1
-        total_genes.add(row.gene_id)
-
-        if len(batch) >= batch_size:
-            bulk_insert_expression_records(session, batch)
-            upsert_state(
-                session,
-                study_files.study_accession,
-                last_gene=last_gene,
-                last_sample_index=last_sample,
-                metadata_loaded=True,
+    existing_facts = (
+        _load_existing_expression_keys(session, study_key) if deduplicate else set()
+    )
+    if matrix_builder is not None and existing_facts:
+        # Facts from earlier runs are never re-written, so the builder misses them.
+        matrix_builder.complete = False
+
+    metrics = ExpressionLoadMetrics(final_batch_size=batch_size)
+    total_genes: set[str] = set()
+    sizer = (
+        AdaptiveBatchSizer.from_config(config.database)
+        if config.database.adaptive_batching
+        else None
+    )
+    checkpoints = CheckpointPolicy.from_config(config.processing)
+    batches: Iterable[list[ExpressionRow]] = _iter_row_batches(
+        iter_filtered_expression(
+            str(study_files.expression_file),
+            allowed_genes=gene_filter,
+            sample_columns=expected_samples,
+            resume_gene=resume_gene,
+            resume_sample_index=resume_sample_index,
+        ),
+        (lambda: sizer.batch_size) if sizer is not None else (lambda: batch_size),
+    )
+
+    with contextlib.ExitStack() as stack:
+        if config.processing.pipelined_writes:
+            batches = stack.enter_context(
+                _BatchPrefetcher(
+                    batches,
+                    depth=config.processing.write_queue_depth,
+                    metrics=metrics,
+                )
             )
-            session.commit()
-            batch.clear()
 
-    if batch:
-        bulk_insert_expression_records(session, batch)
-        upsert_state(
-            session,
+        last_commit_end = time.perf_counter()
+        for rows in batches:
+            pending: list[tuple[int, int, float]] = []
+            for row in rows:
+                gene_key = cache.genes.get(row.gene_id)
+                if gene_key is None:
+                    gene_key = _ensure_gene(session, cache, row.gene_id, config=config)
+                sample_key = sample_key_map[row.sample_accession]
+
+                if deduplicate:
+                    fact_identity = (sample_key, gene_key)
+                    if fact_identity in existing_facts:
+                        continue
+                    existing_facts.add(fact_identity)
+
+                pending.append((sample_key, gene_key, row.expression_value))
+                total_genes.add(row.gene_id)
+
+            if not pending:
+                continue
+
+            checkpoint_due = checkpoints.add(len(pending), len(pending) * _FACT_ROW_BYTES)
+            commit_start = time.perf_counter()
+            run_with_retries(
+                session,
+                functools.partial(
+                    _write_expression_batch,
+                    study_key=study_key,
+                    facts=pending,
+                    study_accession=study_files.study_accession,
+                    checkpoint=(rows[-1].gene_id, rows[-1].sample_index)
+                    if checkpoint_due
+                    else None,
+                ),
+                config=config.database,
+                description=f"Expression batch write for study {study_files.study_accession}",
+            )
+            if matrix_builder is not None:
+                matrix_builder.add(pending)
+            metrics.record_count += len(pending)
+            metrics.batch_count += 1
+            if checkpoint_due:
+                checkpoints.reset()
+                metrics.checkpoint_count += 1
+
+            commit_end = time.perf_counter()
+            if sizer is not None:
+                sizer.record(
+                    len(rows),
+                    commit_end - last_commit_end,
+                    commit_end - commit_start,
+                )
+            last_commit_end = commit_end
+
+    metrics.gene_count = len(total_genes)
+    if sizer is not None:
+        metrics.final_batch_size = sizer.batch_size
+        bind = session.get_bind()
+        LOGGER.info(
+            "Adaptive batching for study %s on %s converged to %s rows per batch "
+            "(best %.0f rows/s at %s, %s adjustments, bounds %s-%s)",
             study_files.study_accession,
-            last_gene=last_gene,
-            last_sample_index=last_sample,
-            metadata_loaded=True,
+            bind.dialect.name if bind is not None else "unknown",
+            sizer.batch_size,
+            sizer.best_throughput,
+            sizer.best_batch_size,
+            sizer.adjustments,
+            sizer.minimum,
+            sizer.maximum,
         )
-        session.commit()
 
     if config.logging.log_record_counts:
         LOGGER.info(
-            "Expression processed for study %s: %s records, %s genes",
+            "Expression processed for study %s: %s records, %s genes, %s checkpoints",
+            study_files.study_accession,
+            metrics.record_count,
+            metrics.gene_count,
+            metrics.checkpoint_count,
+        )
+    if config.processing.pipelined_writes:
+        LOGGER.info(
+            "Expression pipeline for study %s: %s batches, queue depth mean %.2f max %s, "
+            "writer waited %.2fs, parser waited %.2fs",
             study_files.study_accession,
-            total_records,
-            len(total_genes),
+            metrics.batch_count,
+            metrics.mean_queue_depth,
+            metrics.max_queue_depth,
+            metrics.writer_wait_seconds,
+            metrics.parser_wait_seconds,
         )
 
-    return total_records, len(total_genes)
+    return metrics
+
+
+def _commit_after(operation: Callable[[Session], T]) -> Callable[[Session], T]:
+    def _run(session: Session) -> T:
+        result = operation(session)
+        session.commit()
+        return result
+
+    return _run
+
+
+def _purge_study_expression(
+    session: Session, study_key: int, accession: str, *, config: AppConfig
+) -> int:
+    """Remove a study's facts in bounded, separately committed chunks."""
+
+    chunk_size = config.database.delete_chunk_size
+    description = f"Fact purge for study {accession}"
+    deleted = run_with_retries(
+        session,
+        _commit_after(lambda active: delete_expression_vectors_for_study(active, study_key)),
+        config=config.database,
+        description=description,
+    )
+    total = 0
+    while True:
+        removed = run_with_retries(
+            session,
+            _commit_after(
+                lambda active: delete_expression_fact_chunk(active, study_key, chunk_size)
+            ),
+            config=config.database,
+            description=description,
+        )
+        total += removed
+        if removed < chunk_size:
+            break
+    LOGGER.info(
+        "Replace mode: removed %s expression facts and %s vectors for study %s",
+        total,
+        deleted,
+        accession,
+    )
+    return total
+
+
+def _write_study_vectors(
+    session: Session,
+    study_key: int,
+    accession: str,
+    matrix: ExpressionMatrix | None,
+) -> None:
+    """Pack a study's vectors from the matrix gathered while writing its facts.
+
+    Resumed or partially deduplicated loads did not see every fact, so the
+    vectors are rebuilt from ``fact_expression`` instead.
+    """
+
+    if matrix is None:
+        vector_count = rebuild_expression_vectors(session, study_key)
+    else:
+        vector_count = write_expression_vectors(session, study_key, matrix)
+    session.commit()
+    LOGGER.info("Packed %s expression vectors for study %s", vector_count, accession)
+
+
+def _refresh_inline_correlations(
+    session: Session,
+    config: AppConfig,
+    descriptor: StudyDescriptor,
+    matrix: ExpressionMatrix | None,
+) -> None:
+    """Correlate a freshly loaded study from the matrix gathered while writing it.
+
+    Resumed or partially deduplicated loads did not see every fact, so
+    ``matrix`` is ``None`` and is read back from the database instead. A
+    failure here leaves the committed expression data in place; the
+    standalone correlation job will pick the study up because no refresh was
+    recorded.
+    """
+
+    if matrix is None:
+        LOGGER.info(
+            "Study %s was only partially loaded in this run; reading its expression "
+            "matrix back for correlations",
+            descriptor.accession,
+        )
+    try:
+        refresh_study_correlations(session, config, descriptor, matrix)
+    except Exception:
+        session.rollback()
+        LOGGER.exception("Inline correlation refresh failed for study %s", descriptor.accession)
 
 
 def _process_single_study(
@@ -257,9 +613,17 @@ def _process_single_study(
     session_factory: sessionmaker,
     study_dir: pathlib.Path,
     gene_filter: set[str],
-) -> None:
+    *,
+    replace_studies: frozenset[str] = frozenset(),
+    replace_all: bool = False,
+) -> StudyLoadResult:
     study_files = discover_study_files(study_dir)
-    LOGGER.info("Starting study %s", study_files.study_accession)
+    replace = replace_all or study_files.study_accession in replace_studies
+    LOGGER.info(
+        "Starting study %s%s",
+        study_files.study_accession,
+        " (replace mode)" if replace else "",
+    )
 
     start_time = time.perf_counter()
     with session_factory() as session:
@@ -272,15 +636,43 @@ def _process_single_study(
             study_key, samples, quality = _process_metadata(
                 session, cache, study_files, config=config
             )
-            upsert_state(
+            if replace:
+                # A full reload starts from the top of the file with dedup disabled.
+                resume_gene, resume_index = None, 0
+            # The reset checkpoint is committed before any fact is purged, so a
+            # crash mid-purge cannot leave a resume point past deleted facts.
+            run_with_retries(
                 session,
-                study_files.study_accession,
-                last_gene=resume_gene,
-                last_sample_index=resume_index,
-                metadata_loaded=True,
+                _commit_after(
+                    functools.partial(
+                        upsert_state,
+                        study_accession=study_files.study_accession,
+                        last_gene=resume_gene,
+                        last_sample_index=resume_index,
+                        metadata_loaded=True,
+                    )
+                ),
+                config=config.database,
+                description=f"Checkpoint for study {study_files.study_accession}",
             )
-            session.commit()
-            record_count, gene_count = _process_expression(
+            if replace:
+                _purge_study_expression(
+                    session,
+                    study_key,
+                    study_files.study_accession,
+                    config=config,
+                )
+            matrix_builder = None
+            if (
+                config.processing.inline_correlations
+                or config.processing.write_expression_vectors
+            ):
+                matrix_builder = ExpressionMatrixBuilder(
+                    cache.samples[(sample.gsm_accession, study_key)] for sample in samples
+                )
+                # Rows before the resume point were written by an earlier run.
+                matrix_builder.complete = resume_gene is None and not resume_index
+            metrics = _process_expression(
                 session,
                 cache,
                 study_key,
@@ -291,28 +683,127 @@ def _process_single_study(
                 batch_size=config.database.batch_size,
                 resume_gene=resume_gene,
                 resume_sample_index=resume_index,
+                deduplicate=not replace,
+                matrix_builder=matrix_builder,
+            )
+            matrix = (
+                matrix_builder.build()
+                if matrix_builder is not None and matrix_builder.complete
+                else None
             )
+            if config.processing.write_expression_vectors:
+                _write_study_vectors(session, study_key, study_files.study_accession, matrix)
+            elif metrics.record_count:
+                # Vectors packed by an earlier run no longer cover every fact.
+                delete_expression_vectors_for_study(session, study_key)
+                session.commit()
+            if config.processing.inline_correlations:
+                _refresh_inline_correlations(
+                    session,
+                    config,
+                    StudyDescriptor(study_key, study_files.study_accession),
+                    matrix,
+                )
         except (MetadataFormatError, ExpressionFormatError, StudyProcessingError) as exc:
             session.rollback()
             LOGGER.exception("Processing failed for study %s", study_files.study_accession)
             raise StudyProcessingError(str(exc)) from exc
         else:
-            clear_state(session, study_files.study_accession)
-            session.commit()
+            run_with_retries(
+                session,
+                _commit_after(
+                    functools.partial(clear_state, study_accession=study_files.study_accession)
+                ),
+                config=config.database,
+                description=f"Checkpoint for study {study_files.study_accession}",
+            )
 
     elapsed = time.perf_counter() - start_time
     if config.logging.log_processing_time:
         LOGGER.info(
             "Completed study %s in %.2fs", study_files.study_accession, elapsed
         )
+    return StudyLoadResult(
+        study_accession=study_files.study_accession,
+        sample_count=len(samples),
+        elapsed_seconds=elapsed,
+        expression=metrics,
+    )
+
+
+@dataclass(slots=True)
+class _StudyWorkerState:
+    config: AppConfig
+    session_factory: sessionmaker
+    gene_filter: set[str]
+
+
+_WORKER_STATE: _StudyWorkerState | None = None
+
+
+def _initialize_study_worker(
+    config: AppConfig,
+    gene_filter: set[str],
+    log_queue: "multiprocessing.Queue[logging.LogRecord]",
+) -> None:
+    """Give a worker process its own engine and the gene filter, sent once per process.
+
+    The engine is disposed when the worker exits, closing its pooled
+    connections instead of leaving them for the server to time out.
+    """
+
+    global _WORKER_STATE
+    configure_worker_logging(config, log_queue)
+    engine = create_engine_with_retries(config, workers=1)
+    atexit.register(engine.dispose)
+    _WORKER_STATE = _StudyWorkerState(config, create_session_factory(engine), gene_filter)
+
+
+def _process_study_in_worker(
+    study_dir: pathlib.Path, *, replace_studies: frozenset[str], replace_all: bool
+) -> StudyLoadResult:
+    assert _WORKER_STATE is not None, "worker initializer did not run"
+    return _process_single_study(
+        _WORKER_STATE.config,
+        _WORKER_STATE.session_factory,
+        study_dir,
+        _WORKER_STATE.gene_filter,
+        replace_studies=replace_studies,
+        replace_all=replace_all,
+    )
+
+
+def run_pipeline(
+    config: AppConfig,
+    *,
+    replace_studies: Iterable[str] | None = None,
+    replace_all: bool = False,
+) -> None:
+    """Run the ETL over every study directory in the configured input folder.
+
+    Studies listed in ``replace_studies`` (or every study when ``replace_all``
+    is set) have their existing facts deleted in chunks and are reloaded from
+    scratch without per-row duplicate checks.
 
+    With ``processing.executor: process`` studies run in spawned worker
+    processes, so CSV parsing is not serialised by the GIL. Each worker opens
+    its own engine and receives the gene filter once; its log records are
+    queued back and emitted through this process's handlers. Per-study results
+    are returned to this process either way and summarised at the end.
+
+    With inline correlations and ``correlation.global_fdr`` the global
+    q-values are recomputed once after the last study, as the correlation job
+    does.
+    """
 
-def run_pipeline(config: AppConfig) -> None:
     configure_logging(config)
     gene_filter = load_gene_filter(str(config.processing.gene_filter_file))
     LOGGER.info("Loaded %s gene identifiers from filter", len(gene_filter))
 
-    engine = create_engine_with_retries(config)
+    # Worker processes open their own engines, so the parent needs one connection.
+    engine = create_engine_with_retries(
+        config, single_connection=config.processing.executor == "process"
+    )
     Base.metadata.create_all(engine)
     session_factory = create_session_factory(engine)
 
@@ -331,29 +822,88 @@ def run_pipeline(config: AppConfig) -> None:
     else:
         max_workers = max(1, config.processing.max_concurrent_studies)
 
+    use_processes = config.processing.executor == "process"
+    if use_processes and is_memory_sqlite(config.database.connection_string):
+        LOGGER.warning(
+            "In-memory SQLite cannot be shared with worker processes; using threads instead"
+        )
+        use_processes = False
+
     LOGGER.info(
-        "Processing %s studies with up to %s concurrent workers",
+        "Processing %s studies with up to %s concurrent %s",
         len(study_dirs),
         max_workers,
+        "worker processes" if use_processes else "worker threads",
     )
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(
-                _process_single_study,
-                config,
-                session_factory,
-                study_dir,
-                gene_filter,
-            ): study_dir
-            for study_dir in study_dirs
-        }
+    replace_set = frozenset(replace_studies or ())
+    results: list[StudyLoadResult] = []
+    failures = 0
+    start_time = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if use_processes:
+            context = multiprocessing.get_context("spawn")
+            log_queue: "multiprocessing.Queue[logging.LogRecord]" = context.Queue()
+            # Registered first so it stops last, after the workers have exited.
+            stack.callback(start_log_listener(log_queue).stop)
+            executor = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    mp_context=context,
+                    initializer=_initialize_study_worker,
+                    initargs=(config, gene_filter, log_queue),
+                )
+            )
+            futures = {
+                executor.submit(
+                    _process_study_in_worker,
+                    study_dir,
+                    replace_studies=replace_set,
+                    replace_all=replace_all,
+                ): study_dir
+                for study_dir in study_dirs
+            }
+        else:
+            executor = stack.enter_context(
+                concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+            )
+            futures = {
+                executor.submit(
+                    _process_single_study,
+                    config,
+                    session_factory,
+                    study_dir,
+                    gene_filter,
+                    replace_studies=replace_set,
+                    replace_all=replace_all,
+                ): study_dir
+                for study_dir in study_dirs
+            }
         for future in concurrent.futures.as_completed(futures):
             study_dir = futures[future]
             try:
-                future.result()
+                results.append(future.result())
             except Exception as exc:
+                failures += 1
                 LOGGER.error("Study %s failed: %s", study_dir.name, exc)
 
+    LOGGER.info(
+        "Pipeline loaded %s of %s studies (%s samples, %s records) in %.2fs; %s failed",
+        len(results),
+        len(study_dirs),
+        sum(result.sample_count for result in results),
+        sum(result.expression.record_count for result in results),
+        time.perf_counter() - start_time,
+        failures,
+    )
+    if results and config.processing.inline_correlations and config.correlation.global_fdr:
+        try:
+            refresh_global_q_values(session_factory, config)
+        except Exception:
+            LOGGER.exception(
+                "Global q-value refresh failed; run run_correlation_job.py --global-fdr"
+            )
+    log_pool_metrics(engine)
+
 
-__all__ = ["run_pipeline"]
+__all__ = ["StudyLoadResult", "run_pipeline"]
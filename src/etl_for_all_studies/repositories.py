@@ -1,16 +1,32 @@
 """Repository helpers for interacting with the dimensional schema."""
 from __future__ import annotations
 
+import datetime as dt
+import hashlib
 import logging
 from collections import defaultdict
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
 
-from sqlalchemy import delete, select
+import numpy as np
+from sqlalchemy import (
+    BigInteger,
+    and_,
+    bindparam,
+    cast,
+    delete,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+)
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from .correlation import DifferentialCorrelations
+from .meta_analysis import FisherZSums, summarize_fisher_z
 from .metadata_processing import SampleMetadata
 from .models import (
     DimGene,
@@ -18,9 +34,13 @@ from .models import (
     DimPlatform,
     DimSample,
     DimStudy,
+    EtlCorrelationRefresh,
     EtlStudyState,
     FactExpression,
+    FactExpressionVector,
     FactGenePairCorrelation,
+    FactGenePairDiffCorrelation,
+    FactGenePairMeta,
 )
 
 LOGGER = logging.getLogger(__name__)
@@ -44,6 +64,89 @@ class StudyDescriptor:
     accession: str
 
 
+@dataclass(slots=True)
+class ExpressionMatrix:
+    """Dense gene x sample expression values for a single study.
+
+    Rows follow ``gene_keys`` and columns follow ``sample_keys`` (ascending
+    ``dim_sample`` key order); missing measurements are NaN.
+    """
+
+    gene_keys: np.ndarray
+    sample_keys: np.ndarray
+    values: np.ndarray
+
+    @property
+    def mask(self) -> np.ndarray:
+        return ~np.isnan(self.values)
+
+
+class ExpressionMatrixBuilder:
+    """Fill a study's gene x sample matrix as its facts are written.
+
+    Columns are the study's ``sample_keys`` (ascending), known from its
+    metadata before any fact is read. Each gene gets one float32 row, NaN
+    until measured, allocated on its first fact; ``build`` only stacks the
+    rows. Callers set ``complete`` to false when some of the study's facts
+    were not seen (a resumed load or skipped duplicates); the matrix must
+    then be read back from the database instead.
+    """
+
+    def __init__(self, sample_keys: Iterable[int]) -> None:
+        self.sample_keys = np.unique(np.asarray(list(sample_keys), dtype=np.int64))
+        self._rows: dict[int, np.ndarray] = {}
+        self.complete = True
+
+    def add(self, facts: list[tuple[int, int, float]]) -> None:
+        """Record a batch of ``(sample_key, gene_key, value)`` facts."""
+
+        if not facts:
+            return
+        sample_keys, gene_keys, values = zip(*facts)
+        columns = np.searchsorted(self.sample_keys, np.asarray(sample_keys, dtype=np.int64))
+        genes = np.asarray(gene_keys, dtype=np.int64)
+        values_array = np.asarray(values, dtype=np.float32)
+        # Batches follow the file's gene rows, so each gene is one short run.
+        order = np.argsort(genes, kind="stable")
+        genes, columns, values_array = genes[order], columns[order], values_array[order]
+        starts = np.flatnonzero(np.r_[True, genes[1:] != genes[:-1]])
+        for start, stop in zip(starts.tolist(), [*starts[1:].tolist(), len(genes)]):
+            gene_key = int(genes[start])
+            row = self._rows.get(gene_key)
+            if row is None:
+                row = self._rows[gene_key] = np.full(
+                    len(self.sample_keys), np.nan, dtype=np.float32
+                )
+            row[columns[start:stop]] = values_array[start:stop]
+
+    def build(self) -> ExpressionMatrix:
+        """Return the matrix over the genes seen (ascending) and every study sample."""
+
+        gene_keys = np.asarray(sorted(self._rows), dtype=np.int64)
+        values = np.empty((len(gene_keys), len(self.sample_keys)), dtype=np.float32)
+        for index, gene_key in enumerate(gene_keys.tolist()):
+            # Rows are released as they are copied, so peak memory stays near one matrix.
+            values[index] = self._rows.pop(gene_key)
+        self._rows = {int(key): row for key, row in zip(gene_keys.tolist(), values)}
+        return ExpressionMatrix(gene_keys, self.sample_keys, values)
+
+
+@dataclass(slots=True, frozen=True)
+class ExpressionFingerprint:
+    """Cheap summary of a study's expression facts used to detect changes."""
+
+    fact_count: int
+    max_fact_id: int | None
+    checksum: str
+
+
+_VECTOR_DTYPE = np.dtype("<f4")
+EXPRESSION_STREAM_CHUNK_SIZE = 10000
+CORRELATION_WRITE_PAGE_SIZE = 10000
+# 2**31 - 1: fingerprint terms reduced modulo it multiply without overflowing BIGINT.
+_CHECKSUM_MODULUS = 2_147_483_647
+
+
 def bootstrap_cache(session: Session) -> DimensionCache:
     """Load existing dimension keys into memory for duplicate detection."""
 
@@ -281,6 +384,40 @@ def upsert_state(
     )
 
 
+def advance_checkpoint(
+    session: Session,
+    study_accession: str,
+    *,
+    last_gene: str | None,
+    last_sample_index: int,
+) -> None:
+    """Move the resume position forward inside the caller's transaction.
+
+    Unlike :func:`upsert_state` this issues a single UPDATE without loading the
+    state row first, so it can ride along with a batch insert. It falls back to
+    :func:`upsert_state` when the row does not exist yet.
+    """
+
+    result = session.execute(
+        update(EtlStudyState)
+        .where(EtlStudyState.study_accession == study_accession)
+        .values(
+            last_processed_gene=last_gene,
+            last_sample_index=last_sample_index,
+            updated_at=dt.datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        upsert_state(
+            session,
+            study_accession,
+            last_gene=last_gene,
+            last_sample_index=last_sample_index,
+            metadata_loaded=True,
+        )
+
+
 def clear_state(session: Session, study_accession: str) -> None:
     state = session.get(EtlStudyState, study_accession)
     if state:
@@ -289,9 +426,51 @@ def clear_state(session: Session, study_accession: str) -> None:
 
 def bulk_insert_expression_records(
     session: Session,
-    records: Iterable[FactExpression],
+    records: Iterable[dict[str, object]],
 ) -> None:
-    session.add_all(records)
+    """Insert expression fact rows, skipping any already stored for the same key.
+
+    Facts are unique per ``(sample_key, gene_key, study_key)``, so replaying a
+    batch whose commit reached the database before the connection failed
+    inserts nothing twice.
+    """
+
+    _insert_ignoring_conflicts(
+        session,
+        FactExpression.__table__,
+        list(records),
+        ["sample_key", "gene_key", "study_key"],
+    )
+
+
+def delete_expression_fact_chunk(session: Session, study_key: int, chunk_size: int) -> int:
+    """Delete up to ``chunk_size`` expression facts of a study, lowest ids first.
+
+    The chunk is bounded by an id range rather than an ``IN`` list so the
+    statement stays small on every backend. Returns the number of rows removed;
+    callers commit between chunks to keep transactions short.
+    """
+
+    boundary = session.execute(
+        select(FactExpression.id)
+        .where(FactExpression.study_key == study_key)
+        .order_by(FactExpression.id)
+        .offset(chunk_size - 1)
+        .limit(1)
+    ).scalar_one_or_none()
+
+    stmt = delete(FactExpression).where(FactExpression.study_key == study_key)
+    if boundary is not None:
+        stmt = stmt.where(FactExpression.id <= boundary)
+    result = session.execute(stmt.execution_options(synchronize_session=False))
+    return int(result.rowcount or 0)
+
+
+def delete_expression_vectors_for_study(session: Session, study_key: int) -> int:
+    result = session.execute(
+        delete(FactExpressionVector).where(FactExpressionVector.study_key == study_key)
+    )
+    return int(result.rowcount or 0)
 
 
 def bulk_insert_gene_pair_correlations(
@@ -300,10 +479,533 @@ def bulk_insert_gene_pair_correlations(
     session.add_all(records)
 
 
-def delete_gene_pair_correlations_for_study(session: Session, study_key: int) -> int:
+def insert_gene_pair_correlation_columns(
+    session: Session,
+    *,
+    study_key: int,
+    computed_at: str,
+    gene_a_keys: np.ndarray,
+    gene_b_keys: np.ndarray,
+    rho: np.ndarray,
+    p_values: np.ndarray,
+    q_values: np.ndarray,
+    n_samples: np.ndarray,
+    illness_key: int | None = None,
+    rho_lower: np.ndarray | None = None,
+    rho_upper: np.ndarray | None = None,
+    method: str = "spearman",
+    page_size: int = CORRELATION_WRITE_PAGE_SIZE,
+) -> int:
+    """Insert columnar pair statistics through Core ``executemany`` in pages.
+
+    Bypasses the ORM unit of work entirely: each page becomes a list of plain
+    parameter dicts for one ``INSERT`` on the table. NaN p-values are stored
+    as 1.0 and NaN q-values and confidence bounds as NULL; every row gets
+    ``illness_key`` and ``method``. Returns the number of rows inserted.
+    """
+
+    def nullable(column: np.ndarray | None, page: slice) -> list[float | None]:
+        if column is None:
+            return [None] * len(rho[page])
+        values = column[page]
+        return np.where(np.isnan(values), None, values).tolist()
+
+    table = FactGenePairCorrelation.__table__
+    total = len(rho)
+    for start in range(0, total, page_size):
+        page = slice(start, start + page_size)
+        p_page = np.nan_to_num(p_values[page], nan=1.0)
+        session.execute(
+            insert(table),
+            [
+                {
+                    "gene_a_key": gene_a_key,
+                    "gene_b_key": gene_b_key,
+                    "illness_key": illness_key,
+                    "method": method,
+                    "rho_spearman": rho_value,
+                    "rho_ci_lower": lower_value,
+                    "rho_ci_upper": upper_value,
+                    "p_value": p_value,
+                    "q_value": q_value,
+                    "n_samples": n_value,
+                    "computed_at": computed_at,
+                    "study_key": study_key,
+                }
+                for (
+                    gene_a_key,
+                    gene_b_key,
+                    rho_value,
+                    lower_value,
+                    upper_value,
+                    p_value,
+                    q_value,
+                    n_value,
+                ) in zip(
+                    gene_a_keys[page].tolist(),
+                    gene_b_keys[page].tolist(),
+                    rho[page].tolist(),
+                    nullable(rho_lower, page),
+                    nullable(rho_upper, page),
+                    p_page.tolist(),
+                    nullable(q_values, page),
+                    n_samples[page].tolist(),
+                )
+            ],
+        )
+    return total
+
+
+def insert_differential_correlations(
+    session: Session,
+    comparison: DifferentialCorrelations,
+    *,
+    study_key: int,
+    computed_at: str,
+    page_size: int = CORRELATION_WRITE_PAGE_SIZE,
+) -> int:
+    """Insert one illness-vs-reference comparison with paged Core ``executemany``."""
+
+    table = FactGenePairDiffCorrelation.__table__
+    total = len(comparison)
+    for start in range(0, total, page_size):
+        page = slice(start, start + page_size)
+        q_page = comparison.q_values[page]
+        session.execute(
+            insert(table),
+            [
+                {
+                    "study_key": study_key,
+                    "illness_key": comparison.illness_key,
+                    "reference_illness_key": comparison.reference_illness_key,
+                    "method": comparison.method,
+                    "gene_a_key": gene_a_key,
+                    "gene_b_key": gene_b_key,
+                    "rho_illness": rho_illness,
+                    "rho_reference": rho_reference,
+                    "n_illness": n_illness,
+                    "n_reference": n_reference,
+                    "z_score": z_score,
+                    "p_value": p_value,
+                    "q_value": q_value,
+                    "computed_at": computed_at,
+                }
+                for (
+                    gene_a_key,
+                    gene_b_key,
+                    rho_illness,
+                    rho_reference,
+                    n_illness,
+                    n_reference,
+                    z_score,
+                    p_value,
+                    q_value,
+                ) in zip(
+                    comparison.gene_a_keys[page].tolist(),
+                    comparison.gene_b_keys[page].tolist(),
+                    comparison.rho_illness[page].tolist(),
+                    comparison.rho_reference[page].tolist(),
+                    comparison.n_illness[page].tolist(),
+                    comparison.n_reference[page].tolist(),
+                    comparison.z_scores[page].tolist(),
+                    comparison.p_values[page].tolist(),
+                    np.where(np.isnan(q_page), None, q_page).tolist(),
+                )
+            ],
+        )
+    return total
+
+
+def delete_differential_correlations_for_study(
+    session: Session, study_key: int, *, method: str = "spearman"
+) -> int:
+    result = session.execute(
+        delete(FactGenePairDiffCorrelation).where(
+            FactGenePairDiffCorrelation.study_key == study_key,
+            FactGenePairDiffCorrelation.method == method,
+        )
+    )
+    return int(result.rowcount or 0)
+
+
+def find_illness_key(session: Session, label: str) -> int | None:
+    return session.execute(
+        select(DimIllness.illness_key).where(DimIllness.illness_label == label)
+    ).scalar_one_or_none()
+
+
+def iter_gene_pair_p_value_pages(
+    session: Session,
+    page_size: int = CORRELATION_WRITE_PAGE_SIZE,
+    *,
+    method: str = "spearman",
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Yield ``(correlation_keys, p_values)`` pages of one method across every study.
+
+    Only whole-study rows (NULL ``illness_key``) are paged: they form the
+    global family, matching the refresh log's pruned counts. Pages are
+    keyset-paginated on ``correlation_key`` so callers may update and commit
+    the rows of a page before asking for the next one.
+    """
+
+    last_key = 0
+    while True:
+        rows = session.execute(
+            select(FactGenePairCorrelation.correlation_key, FactGenePairCorrelation.p_value)
+            .where(
+                FactGenePairCorrelation.correlation_key > last_key,
+                FactGenePairCorrelation.method == method,
+                FactGenePairCorrelation.illness_key.is_(None),
+            )
+            .order_by(FactGenePairCorrelation.correlation_key)
+            .limit(page_size)
+        ).all()
+        if not rows:
+            return
+        page = np.asarray(rows, dtype=np.float64)
+        keys = page[:, 0].astype(np.int64)
+        last_key = int(keys[-1])
+        yield keys, page[:, 1]
+
+
+def update_global_q_values(
+    session: Session, correlation_keys: np.ndarray, q_values: np.ndarray
+) -> None:
+    """Write ``q_value_global`` for the given rows with one executemany UPDATE."""
+
+    table = FactGenePairCorrelation.__table__
+    session.execute(
+        update(table)
+        .where(table.c.correlation_key == bindparam("row_key"))
+        .values(q_value_global=bindparam("row_q")),
+        [
+            {"row_key": key, "row_q": q_value}
+            for key, q_value in zip(correlation_keys.tolist(), q_values.tolist())
+        ],
+    )
+
+
+def count_pruned_gene_pairs(session: Session, *, method: str = "spearman") -> int:
+    """Whole-study pairs tested but not persisted across all studies, per the refresh log."""
+
+    return int(
+        session.execute(
+            select(func.sum(EtlCorrelationRefresh.pruned_count)).where(
+                EtlCorrelationRefresh.method == method
+            )
+        ).scalar()
+        or 0
+    )
+
+
+def load_study_pair_correlations(
+    session: Session,
+    study_key: int,
+    *,
+    method: str = "spearman",
+    chunk_size: int = EXPRESSION_STREAM_CHUNK_SIZE,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Return ``(gene_a_keys, gene_b_keys, rho, n_samples)`` of a study's whole-study pairs.
+
+    Only rows of ``method`` are read, and rows computed within an illness
+    stratum are excluded. Rows are streamed
+    ``chunk_size`` at a time into compact arrays.
+    """
+
+    result = session.execute(
+        select(
+            FactGenePairCorrelation.gene_a_key,
+            FactGenePairCorrelation.gene_b_key,
+            FactGenePairCorrelation.rho_spearman,
+            FactGenePairCorrelation.n_samples,
+        )
+        .where(
+            FactGenePairCorrelation.study_key == study_key,
+            FactGenePairCorrelation.method == method,
+            FactGenePairCorrelation.illness_key.is_(None),
+        )
+        .execution_options(yield_per=chunk_size)
+    )
+    chunks = [np.asarray(chunk, dtype=np.float64) for chunk in result.partitions()]
+    rows = np.concatenate(chunks) if chunks else np.empty((0, 4))
+    return (
+        rows[:, 0].astype(np.int64),
+        rows[:, 1].astype(np.int64),
+        rows[:, 2],
+        rows[:, 3].astype(np.int64),
+    )
+
+
+_META_SUM_COLUMNS = (
+    "study_count",
+    "sum_weights",
+    "sum_weighted_z",
+    "sum_weighted_z_squared",
+    "sum_squared_weights",
+)
+
+
+_META_STATISTIC_COLUMNS = (
+    "rho_meta",
+    "z_score",
+    "p_value",
+    "q_statistic",
+    "i_squared",
+    "tau_squared",
+)
+
+
+def _meta_key_range(table, gene_a: list[int], gene_b: list[int]):
+    """Predicate for pairs from ``(gene_a[0], gene_b[0])`` to ``(gene_a[-1], gene_b[-1])``."""
+
+    return and_(
+        or_(
+            table.c.gene_a_key > gene_a[0],
+            and_(table.c.gene_a_key == gene_a[0], table.c.gene_b_key >= gene_b[0]),
+        ),
+        or_(
+            table.c.gene_a_key < gene_a[-1],
+            and_(table.c.gene_a_key == gene_a[-1], table.c.gene_b_key <= gene_b[-1]),
+        ),
+    )
+
+
+def _insert_ignoring_conflicts(
+    session: Session, table, rows: list[dict[str, object]], conflict_columns: list[str]
+) -> None:
+    """Insert ``rows`` into ``table``, skipping any whose ``conflict_columns`` already exist.
+
+    SQLite and PostgreSQL use ``ON CONFLICT DO NOTHING``; other backends try
+    the whole batch in a savepoint and fall back to one savepoint per row.
+    """
+
+    if not rows:
+        return
+    bind = session.get_bind()
+    dialect = bind.dialect.name if bind is not None else None
+    if dialect == "sqlite":
+        session.execute(
+            sqlite_insert(table).on_conflict_do_nothing(index_elements=conflict_columns), rows
+        )
+    elif dialect == "postgresql":  # pragma: no cover - optional backend
+        from sqlalchemy.dialects.postgresql import insert as postgres_insert
+
+        session.execute(
+            postgres_insert(table).on_conflict_do_nothing(index_elements=conflict_columns), rows
+        )
+    else:
+        try:
+            with session.begin_nested():
+                session.execute(insert(table), rows)
+        except IntegrityError:
+            LOGGER.debug("Conflicting rows in %s; inserting rows one by one", table.name)
+            for row in rows:
+                try:
+                    with session.begin_nested():
+                        session.execute(insert(table), [row])
+                except IntegrityError:
+                    pass
+
+
+def _insert_missing_meta_rows(
+    session: Session, pairs: list[tuple[int, int]], *, method: str, updated_at: str
+) -> None:
+    """Insert zero-sum summary rows for ``pairs``, skipping rows another writer added first."""
+
+    _insert_ignoring_conflicts(
+        session,
+        FactGenePairMeta.__table__,
+        [
+            {
+                "gene_a_key": gene_a,
+                "gene_b_key": gene_b,
+                "method": method,
+                "updated_at": updated_at,
+                **{name: 0 for name in (*_META_SUM_COLUMNS, *_META_STATISTIC_COLUMNS)},
+            }
+            for gene_a, gene_b in pairs
+        ],
+        ["gene_a_key", "gene_b_key", "method"],
+    )
+
+
+def apply_meta_correlation_sums(
+    session: Session,
+    sums: FisherZSums,
+    *,
+    updated_at: str,
+    method: str = "spearman",
+    page_size: int = CORRELATION_WRITE_PAGE_SIZE,
+) -> None:
+    """Add signed per-pair contributions into the ``method`` rows of ``fact_gene_pair_meta``.
+
+    Contributions are sorted by pair and applied in pages. Pairs without a
+    summary row first get a zero row (an insert that tolerates rows added
+    concurrently); one executemany UPDATE then adds the contributions with
+    ``sum = sum + delta``, so concurrent writers never lose each other's
+    sums. The page's rows are read back under the row locks that UPDATE
+    took, the derived statistics are recomputed from the new sums, and rows
+    no study contributes to any more are deleted. A pair whose row was
+    deleted by another writer in between is applied again.
+    """
+
+    table = FactGenePairMeta.__table__
+    order = np.lexsort((sums.gene_b_keys, sums.gene_a_keys))
+    increment = (
+        update(table)
+        .where(
+            table.c.method == method,
+            table.c.gene_a_key == bindparam("pair_a"),
+            table.c.gene_b_key == bindparam("pair_b"),
+        )
+        .values({name: table.c[name] + bindparam(f"delta_{name}") for name in _META_SUM_COLUMNS})
+    )
+    for start in range(0, len(order), page_size):
+        page = order[start : start + page_size]
+        while page.size:
+            gene_a = sums.gene_a_keys[page].tolist()
+            gene_b = sums.gene_b_keys[page].tolist()
+            in_range = _meta_key_range(table, gene_a, gene_b)
+            existing = {
+                (row.gene_a_key, row.gene_b_key)
+                for row in session.execute(
+                    select(table.c.gene_a_key, table.c.gene_b_key).where(
+                        table.c.method == method, in_range
+                    )
+                )
+            }
+            missing = [pair for pair in zip(gene_a, gene_b) if pair not in existing]
+            if missing:
+                _insert_missing_meta_rows(
+                    session, missing, method=method, updated_at=updated_at
+                )
+            deltas = {name: getattr(sums, name)[page].tolist() for name in _META_SUM_COLUMNS}
+            session.execute(
+                increment,
+                [
+                    {
+                        "pair_a": pair_a,
+                        "pair_b": pair_b,
+                        **{f"delta_{name}": deltas[name][index] for name in _META_SUM_COLUMNS},
+                    }
+                    for index, (pair_a, pair_b) in enumerate(zip(gene_a, gene_b))
+                ],
+            )
+
+            stored = {
+                (row.gene_a_key, row.gene_b_key): row
+                for row in session.execute(
+                    select(
+                        table.c.meta_key,
+                        table.c.gene_a_key,
+                        table.c.gene_b_key,
+                        *(table.c[name] for name in _META_SUM_COLUMNS),
+                    ).where(table.c.method == method, in_range)
+                )
+            }
+            found = np.array([pair in stored for pair in zip(gene_a, gene_b)], dtype=bool)
+            rows = [stored[pair] for pair in zip(gene_a, gene_b) if pair in stored]
+            _refresh_meta_statistics(session, rows, updated_at=updated_at)
+            # Rows deleted by a concurrent writer did not take the increment.
+            page = page[~found]
+
+
+def _refresh_meta_statistics(session: Session, rows: list, *, updated_at: str) -> None:
+    """Recompute derived statistics of summary ``rows`` and drop rows without studies."""
+
+    if not rows:
+        return
+    table = FactGenePairMeta.__table__
+    meta_keys = np.array([row.meta_key for row in rows], dtype=np.int64)
+    totals = np.array([[getattr(row, name) for name in _META_SUM_COLUMNS] for row in rows])
+    merged = FisherZSums(
+        np.zeros(len(rows), dtype=np.int64),
+        np.zeros(len(rows), dtype=np.int64),
+        np.rint(totals[:, 0]).astype(np.int64),
+        *(totals[:, column] for column in range(1, len(_META_SUM_COLUMNS))),
+    )
+    summary = summarize_fisher_z(merged)
+    statistics = {
+        "rho_meta": summary.rho,
+        "z_score": summary.z_score,
+        "p_value": summary.p_values,
+        "q_statistic": summary.q_statistic,
+        "i_squared": summary.i_squared,
+        "tau_squared": summary.tau_squared,
+    }
+    alive = merged.study_count > 0
+    updates = [
+        {
+            "row_key": int(meta_keys[index]),
+            "new_updated_at": updated_at,
+            **{f"new_{name}": column[index].item() for name, column in statistics.items()},
+        }
+        for index in np.flatnonzero(alive).tolist()
+    ]
+    if updates:
+        # Bound names must differ from the column names they set.
+        session.execute(
+            update(table)
+            .where(table.c.meta_key == bindparam("row_key"))
+            .values(
+                {
+                    name: bindparam(f"new_{name}")
+                    for name in ("updated_at", *_META_STATISTIC_COLUMNS)
+                }
+            ),
+            updates,
+        )
+    removed = meta_keys[~alive]
+    if removed.size:
+        session.execute(
+            delete(table).where(table.c.meta_key.in_(removed.tolist()), table.c.study_count <= 0)
+        )
+
+
+def is_study_in_meta_analysis(
+    session: Session, study_key: int, *, method: str = "spearman"
+) -> bool:
+    refresh = session.get(EtlCorrelationRefresh, (study_key, method))
+    return bool(refresh is not None and refresh.meta_applied)
+
+
+def set_study_in_meta_analysis(
+    session: Session, study_key: int, applied: bool, *, method: str = "spearman"
+) -> None:
+    session.execute(
+        update(EtlCorrelationRefresh)
+        .where(
+            EtlCorrelationRefresh.study_key == study_key,
+            EtlCorrelationRefresh.method == method,
+        )
+        .values(meta_applied=int(applied))
+    )
+
+
+def iter_studies_missing_from_meta_analysis(
+    session: Session, *, method: str = "spearman"
+) -> list[int]:
+    """Refreshed studies whose ``method`` correlations are not yet in ``fact_gene_pair_meta``."""
+
+    return list(
+        session.execute(
+            select(EtlCorrelationRefresh.study_key)
+            .where(
+                EtlCorrelationRefresh.meta_applied == 0,
+                EtlCorrelationRefresh.method == method,
+            )
+            .order_by(EtlCorrelationRefresh.study_key)
+        ).scalars()
+    )
+
+
+def delete_gene_pair_correlations_for_study(
+    session: Session, study_key: int, *, method: str = "spearman"
+) -> int:
     result = session.execute(
         delete(FactGenePairCorrelation).where(
-            FactGenePairCorrelation.study_key == study_key
+            FactGenePairCorrelation.study_key == study_key,
+            FactGenePairCorrelation.method == method,
         )
     )
     return int(result.rowcount or 0)
@@ -328,6 +1030,245 @@ def load_gene_expression_matrix(
     return matrix
 
 
+def _load_study_sample_keys(session: Session, study_key: int) -> np.ndarray:
+    keys = session.execute(
+        select(DimSample.sample_key)
+        .where(DimSample.study_key == study_key)
+        .order_by(DimSample.sample_key)
+    ).scalars().all()
+    return np.asarray(keys, dtype=np.int64)
+
+
+def load_sample_illness_keys(
+    session: Session, study_key: int, sample_keys: Iterable[int]
+) -> list[int | None]:
+    """Return the ``illness_key`` of each of a study's samples, aligned with ``sample_keys``."""
+
+    illness_by_sample = dict(
+        session.execute(
+            select(DimSample.sample_key, DimSample.illness_key).where(
+                DimSample.study_key == study_key
+            )
+        ).all()
+    )
+    return [illness_by_sample.get(int(key)) for key in sample_keys]
+
+
+def load_expression_array(
+    session: Session,
+    study_key: int,
+    *,
+    chunk_size: int = EXPRESSION_STREAM_CHUNK_SIZE,
+    use_vectors: bool = True,
+) -> ExpressionMatrix:
+    """Stream a study's expression facts into a preallocated float32 matrix.
+
+    Gene rows are the distinct ``gene_key`` values of the study and columns
+    are its ``dim_sample`` keys, both ascending. When the study has packed
+    rows in ``fact_expression_vector`` (and ``use_vectors`` is set) they are
+    read instead, one row per gene. Otherwise facts are fetched
+    ``chunk_size`` rows at a time (a server-side cursor where the driver
+    supports one) and scattered straight into the matrix, so no per-fact
+    Python objects outlive their chunk. Unmeasured cells stay NaN.
+    """
+
+    if use_vectors and has_expression_vectors(session, study_key):
+        try:
+            return load_expression_vectors(session, study_key)
+        except ValueError:
+            LOGGER.warning(
+                "Expression vectors of study %s are stale; reading its facts instead",
+                study_key,
+                exc_info=True,
+            )
+
+    sample_keys = _load_study_sample_keys(session, study_key)
+    gene_keys = np.asarray(
+        session.execute(
+            select(FactExpression.gene_key)
+            .where(FactExpression.study_key == study_key)
+            .distinct()
+            .order_by(FactExpression.gene_key)
+        ).scalars().all(),
+        dtype=np.int64,
+    )
+    values = np.full((len(gene_keys), len(sample_keys)), np.nan, dtype=np.float32)
+    if not len(gene_keys):
+        return ExpressionMatrix(gene_keys, sample_keys, values)
+
+    result = session.execute(
+        select(
+            FactExpression.gene_key,
+            FactExpression.sample_key,
+            FactExpression.expression_value,
+        )
+        .where(FactExpression.study_key == study_key)
+        .execution_options(yield_per=chunk_size)
+    )
+    for chunk in result.partitions():
+        facts = np.asarray(chunk, dtype=np.float64)
+        rows = np.searchsorted(gene_keys, facts[:, 0].astype(np.int64))
+        columns = np.searchsorted(sample_keys, facts[:, 1].astype(np.int64))
+        values[rows, columns] = facts[:, 2]
+    return ExpressionMatrix(gene_keys, sample_keys, values)
+
+
+def write_expression_vectors(
+    session: Session, study_key: int, matrix: ExpressionMatrix
+) -> int:
+    """Replace the packed per-gene vectors for a study and return rows written.
+
+    Columns of ``matrix`` are realigned to all of the study's ``dim_sample``
+    keys, so a matrix built from the facts seen during a load (which skips
+    samples without measurements) packs the same vectors as one read back.
+    """
+
+    delete_expression_vectors_for_study(session, study_key)
+    if not len(matrix.gene_keys):
+        return 0
+
+    sample_keys = _load_study_sample_keys(session, study_key)
+    values = matrix.values
+    if not np.array_equal(matrix.sample_keys, sample_keys):
+        values = np.full((len(matrix.gene_keys), len(sample_keys)), np.nan, dtype=_VECTOR_DTYPE)
+        values[:, np.searchsorted(sample_keys, matrix.sample_keys)] = matrix.values
+    packed = np.ascontiguousarray(values, dtype=_VECTOR_DTYPE)
+    sample_count = packed.shape[1]
+    session.execute(
+        insert(FactExpressionVector),
+        [
+            {
+                "study_key": study_key,
+                "gene_key": int(gene_key),
+                "sample_count": sample_count,
+                "expression_values": packed[index].tobytes(),
+            }
+            for index, gene_key in enumerate(matrix.gene_keys)
+        ],
+    )
+    return len(matrix.gene_keys)
+
+
+def rebuild_expression_vectors(session: Session, study_key: int) -> int:
+    """Rebuild a study's vector rows from its row-level ``fact_expression`` data."""
+
+    return write_expression_vectors(
+        session, study_key, load_expression_array(session, study_key, use_vectors=False)
+    )
+
+
+def has_expression_vectors(session: Session, study_key: int) -> bool:
+    return (
+        session.execute(
+            select(FactExpressionVector.id)
+            .where(FactExpressionVector.study_key == study_key)
+            .limit(1)
+        ).first()
+        is not None
+    )
+
+
+def load_expression_vectors(session: Session, study_key: int) -> ExpressionMatrix:
+    """Return the study's packed expression vectors as a float32 matrix."""
+
+    sample_keys = _load_study_sample_keys(session, study_key)
+    rows = session.execute(
+        select(
+            FactExpressionVector.gene_key,
+            FactExpressionVector.sample_count,
+            FactExpressionVector.expression_values,
+        )
+        .where(FactExpressionVector.study_key == study_key)
+        .order_by(FactExpressionVector.gene_key)
+    ).all()
+
+    values = np.empty((len(rows), len(sample_keys)), dtype=np.float32)
+    for index, (gene_key, sample_count, blob) in enumerate(rows):
+        if sample_count != len(sample_keys):
+            raise ValueError(
+                f"Expression vector for gene {gene_key} in study {study_key} holds "
+                f"{sample_count} samples but the study has {len(sample_keys)}; "
+                "rebuild the vectors"
+            )
+        values[index] = np.frombuffer(blob, dtype=_VECTOR_DTYPE)
+
+    gene_keys = np.asarray([row.gene_key for row in rows], dtype=np.int64)
+    return ExpressionMatrix(gene_keys, sample_keys, values)
+
+
+def compute_expression_fingerprint(session: Session, study_key: int) -> ExpressionFingerprint:
+    """Summarise a study's facts with one aggregate query.
+
+    The row count and highest fact id catch appends and deletes. The
+    checksum hashes three integer sums, so it does not depend on row order:
+    the key pairs, the values quantised to 1e-6, and each quantised value
+    weighted by its fact id, which catches values swapped between facts or
+    edits that cancel out. Every per-row term is reduced modulo a 31-bit
+    prime first, keeping products and sums within 64-bit integers.
+    """
+
+    quantised = cast(func.round(FactExpression.expression_value * 1e6), BigInteger)
+    fact_id = cast(FactExpression.id, BigInteger)
+    fact_count, max_fact_id, key_sum, value_sum, weighted_sum = session.execute(
+        select(
+            func.count(FactExpression.id),
+            func.max(FactExpression.id),
+            func.sum(
+                (cast(FactExpression.gene_key, BigInteger) * 1_000_003 + FactExpression.sample_key)
+                % _CHECKSUM_MODULUS
+            ),
+            func.sum(quantised % _CHECKSUM_MODULUS),
+            func.sum(
+                (fact_id % _CHECKSUM_MODULUS) * (quantised % _CHECKSUM_MODULUS)
+                % _CHECKSUM_MODULUS
+            ),
+        ).where(FactExpression.study_key == study_key)
+    ).one()
+    checksum = hashlib.sha256(
+        f"{int(key_sum or 0)}:{int(value_sum or 0)}:{int(weighted_sum or 0)}".encode("ascii")
+    ).hexdigest()
+    return ExpressionFingerprint(int(fact_count), max_fact_id, checksum)
+
+
+def is_correlation_refresh_current(
+    session: Session,
+    study_key: int,
+    fingerprint: ExpressionFingerprint,
+    parameters: str,
+    *,
+    method: str = "spearman",
+) -> bool:
+    refresh = session.get(EtlCorrelationRefresh, (study_key, method))
+    return (
+        refresh is not None
+        and refresh.fact_count == fingerprint.fact_count
+        and refresh.max_fact_id == fingerprint.max_fact_id
+        and refresh.checksum == fingerprint.checksum
+        and refresh.parameters == parameters
+    )
+
+
+def record_correlation_refresh(
+    session: Session,
+    study_key: int,
+    fingerprint: ExpressionFingerprint,
+    parameters: str,
+    *,
+    pruned_count: int = 0,
+    method: str = "spearman",
+) -> None:
+    refresh = session.get(EtlCorrelationRefresh, (study_key, method))
+    if refresh is None:
+        refresh = EtlCorrelationRefresh(study_key=study_key, method=method)
+        session.add(refresh)
+    refresh.fact_count = fingerprint.fact_count
+    refresh.max_fact_id = fingerprint.max_fact_id
+    refresh.checksum = fingerprint.checksum
+    refresh.parameters = parameters
+    refresh.pruned_count = pruned_count
+    refresh.refreshed_at = dt.datetime.utcnow()
+
+
 def iter_studies_with_expression(
     session: Session, study_accessions: Iterable[str] | None = None
 ) -> list[StudyDescriptor]:
@@ -350,6 +1291,9 @@ def iter_studies_with_expression(
 
 __all__ = [
     "DimensionCache",
+    "ExpressionFingerprint",
+    "ExpressionMatrix",
+    "ExpressionMatrixBuilder",
     "StudyDescriptor",
     "bootstrap_cache",
     "get_or_create_gene",
@@ -358,10 +1302,34 @@ __all__ = [
     "get_or_create_platform",
     "get_or_create_illness",
     "bulk_insert_expression_records",
+    "delete_expression_fact_chunk",
+    "delete_expression_vectors_for_study",
     "bulk_insert_gene_pair_correlations",
+    "count_pruned_gene_pairs",
     "delete_gene_pair_correlations_for_study",
+    "insert_gene_pair_correlation_columns",
+    "insert_differential_correlations",
+    "delete_differential_correlations_for_study",
+    "find_illness_key",
+    "iter_gene_pair_p_value_pages",
+    "update_global_q_values",
+    "apply_meta_correlation_sums",
+    "is_study_in_meta_analysis",
+    "iter_studies_missing_from_meta_analysis",
+    "set_study_in_meta_analysis",
+    "compute_expression_fingerprint",
+    "is_correlation_refresh_current",
     "iter_studies_with_expression",
+    "record_correlation_refresh",
+    "load_expression_array",
+    "load_sample_illness_keys",
+    "load_study_pair_correlations",
     "load_gene_expression_matrix",
+    "has_expression_vectors",
+    "load_expression_vectors",
+    "rebuild_expression_vectors",
+    "write_expression_vectors",
     "upsert_state",
+    "advance_checkpoint",
     "clear_state",
 ]
@@ -0,0 +1,195 @@
+"""On-disk cache of a study's stored correlation pairs, written piece by piece."""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import pathlib
+import zipfile
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+import numpy as np
+
+from .correlation import PairCorrelations
+from .repositories import ExpressionFingerprint
+
+LOGGER = logging.getLogger(__name__)
+
+# Bumped whenever the file layout changes, so older files are never matched.
+_CACHE_FORMAT = 2
+# Stored dtype per pair column; p- and q-values keep float64 so tiny values survive.
+_COLUMNS = {
+    "rho": np.float32,
+    "p_values": np.float64,
+    "q_values": np.float64,
+    "n_samples": np.int32,
+}
+# Bootstrap bounds, stored only for pieces whose pairs carry them.
+_INTERVALS = ("rho_lower", "rho_upper")
+
+
+@dataclass(slots=True)
+class CachedCorrelations:
+    """Correlation results read back from a cache file."""
+
+    gene_keys: np.ndarray
+    sample_count: int
+    computed_at: str
+    pruned_count: int
+    pair_sets: list[PairCorrelations]
+    method: str = "spearman"
+    study_pruned_count: int = 0
+
+    @property
+    def correlation_count(self) -> int:
+        return sum(len(pairs) for pairs in self.pair_sets)
+
+
+def cache_file_path(
+    directory: pathlib.Path,
+    accession: str,
+    fingerprint: ExpressionFingerprint,
+    parameters: str,
+) -> pathlib.Path:
+    """Cache file for a study, named after its facts' fingerprint and the parameters."""
+
+    digest = hashlib.sha256(
+        "|".join(
+            (
+                str(fingerprint.fact_count),
+                str(fingerprint.max_fact_id),
+                fingerprint.checksum,
+                parameters,
+                str(_CACHE_FORMAT),
+            )
+        ).encode("utf-8")
+    ).hexdigest()[:24]
+    return directory / f"{accession}-{digest}.npz"
+
+
+def _write_member(archive: zipfile.ZipFile, name: str, array: np.ndarray) -> None:
+    with archive.open(f"{name}.npy", "w", force_zip64=True) as handle:
+        np.lib.format.write_array(handle, np.asanyarray(array), allow_pickle=False)
+
+
+def write_result_cache(
+    path: pathlib.Path,
+    *,
+    gene_keys: np.ndarray,
+    sample_count: int,
+    computed_at: str,
+    pruned_count: int,
+    pair_sets: Iterable[PairCorrelations],
+    method: str = "spearman",
+    study_pruned_count: int = 0,
+) -> None:
+    """Save the stored pairs of a study piece by piece in a compressed ``.npz``.
+
+    Each element of ``pair_sets`` (a whole untiled stratum, or one tile) is
+    written as soon as it arrives: its gene rows as indices into
+    ``gene_keys`` plus its statistics, with p- and q-values kept at float64.
+    Only one piece is held at a time, so writing follows the job's tile
+    memory bound. The file is written beside its final name and renamed
+    into place.
+    """
+
+    gene_keys = np.asarray(gene_keys, dtype=np.int64)
+    row_dtype = np.uint32 if len(gene_keys) <= np.iinfo(np.uint32).max else np.int64
+    # Stratum -1 stands for the whole study (NULL illness_key).
+    pieces: list[int] = []
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f"{path.name}.{os.getpid()}.partial")
+    with zipfile.ZipFile(partial, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for pairs in pair_sets:
+            if not len(pairs):
+                continue
+            index = len(pieces)
+            pieces.append(-1 if pairs.illness_key is None else pairs.illness_key)
+            for name, keys in (("rows_a", pairs.gene_a_keys), ("rows_b", pairs.gene_b_keys)):
+                rows = np.searchsorted(gene_keys, keys).astype(row_dtype)
+                _write_member(archive, f"{name}_{index}", rows)
+            for name, dtype in _COLUMNS.items():
+                _write_member(archive, f"{name}_{index}", getattr(pairs, name).astype(dtype))
+            for name in _INTERVALS:
+                column = getattr(pairs, name)
+                if column is not None:
+                    _write_member(archive, f"{name}_{index}", column.astype(np.float32))
+        for name, value in (
+            ("gene_keys", gene_keys),
+            ("sample_count", np.asarray(sample_count, dtype=np.int64)),
+            ("computed_at", np.asarray(computed_at)),
+            ("pruned_count", np.asarray(pruned_count, dtype=np.int64)),
+            ("study_pruned_count", np.asarray(study_pruned_count, dtype=np.int64)),
+            ("method", np.asarray(method)),
+            ("pieces", np.asarray(pieces, dtype=np.int64)),
+        ):
+            _write_member(archive, name, value)
+    partial.replace(path)
+
+
+def _concatenate(arrays, name: str, indices: list[int], dtype: type) -> np.ndarray:
+    """Join a column over the pieces of one stratum; pieces without it give NaN."""
+
+    return np.concatenate(
+        [
+            arrays[f"{name}_{index}"]
+            if f"{name}_{index}" in arrays.files
+            else np.full(len(arrays[f"rho_{index}"]), np.nan)
+            for index in indices
+        ]
+    ).astype(dtype)
+
+
+def read_result_cache(path: pathlib.Path) -> CachedCorrelations:
+    """Read a cache file back into one columnar pair set per stratum.
+
+    Pieces of a stratum are concatenated in pair order (by gene rows), and
+    bootstrap bounds missing from some of its pieces come back as NaN.
+    """
+
+    with np.load(path) as arrays:
+        gene_keys = arrays["gene_keys"]
+        method = str(arrays["method"])
+        pieces = arrays["pieces"].tolist()
+        pair_sets = []
+        for stratum in dict.fromkeys(pieces):
+            indices = [index for index, key in enumerate(pieces) if key == stratum]
+            rows_a = np.concatenate([arrays[f"rows_a_{index}"] for index in indices])
+            rows_b = np.concatenate([arrays[f"rows_b_{index}"] for index in indices])
+            order = np.lexsort((rows_b, rows_a))
+            intervals = {
+                name: _concatenate(arrays, name, indices, np.float64)[order]
+                for name in _INTERVALS
+                if any(f"{name}_{index}" in arrays.files for index in indices)
+            }
+            pair_sets.append(
+                PairCorrelations(
+                    gene_a_keys=gene_keys[rows_a[order].astype(np.int64)],
+                    gene_b_keys=gene_keys[rows_b[order].astype(np.int64)],
+                    rho=_concatenate(arrays, "rho", indices, np.float64)[order],
+                    p_values=_concatenate(arrays, "p_values", indices, np.float64)[order],
+                    n_samples=_concatenate(arrays, "n_samples", indices, np.int64)[order],
+                    q_values=_concatenate(arrays, "q_values", indices, np.float64)[order],
+                    illness_key=None if stratum < 0 else stratum,
+                    method=method,
+                    **intervals,
+                )
+            )
+        return CachedCorrelations(
+            gene_keys=gene_keys,
+            sample_count=int(arrays["sample_count"]),
+            computed_at=str(arrays["computed_at"]),
+            pruned_count=int(arrays["pruned_count"]),
+            pair_sets=pair_sets,
+            method=method,
+            study_pruned_count=int(arrays["study_pruned_count"]),
+        )
+
+
+__all__ = [
+    "CachedCorrelations",
+    "cache_file_path",
+    "read_result_cache",
+    "write_result_cache",
+]
@@ -0,0 +1,68 @@
+import pathlib
+import sys
+
+SRC_ROOT = pathlib.Path(__file__).resolve().parents[1] / "src"
+if str(SRC_ROOT) not in sys.path:
+    sys.path.insert(0, str(SRC_ROOT))
+
+from etl_for_all_studies.batching import AdaptiveBatchSizer, CheckpointPolicy
+
+
+def test_adaptive_batch_sizer_grows_while_throughput_improves() -> None:
+    sizer = AdaptiveBatchSizer(1000, minimum=100, maximum=4000, max_commit_seconds=5.0)
+
+    sizes = [sizer.batch_size]
+    for _ in range(6):
+        # Larger batches amortise per-commit overhead, so throughput keeps rising.
+        rows = sizer.batch_size
+        sizes.append(sizer.record(rows, elapsed_seconds=0.1 + rows / 50_000, commit_seconds=0.1))
+
+    assert sizes[1] > sizes[0]
+    assert sizes[-1] == 4000
+    assert sizer.best_batch_size == 4000
+
+
+def test_adaptive_batch_sizer_backs_off_on_slow_commits() -> None:
+    sizer = AdaptiveBatchSizer(1000, minimum=200, maximum=4000, max_commit_seconds=0.5)
+
+    for _ in range(10):
+        sizer.record(sizer.batch_size, elapsed_seconds=2.0, commit_seconds=1.5)
+
+    assert sizer.batch_size == 200
+
+
+def test_adaptive_batch_sizer_reverses_when_throughput_drops() -> None:
+    sizer = AdaptiveBatchSizer(1000, minimum=100, maximum=10_000, max_commit_seconds=5.0)
+
+    sizer.record(1000, elapsed_seconds=1.0, commit_seconds=0.1)
+    grown = sizer.batch_size
+    assert grown > 1000
+
+    sizer.record(grown, elapsed_seconds=10.0, commit_seconds=0.1)
+
+    assert sizer.batch_size < grown
+
+
+def test_checkpoint_policy_defaults_to_every_batch() -> None:
+    policy = CheckpointPolicy()
+
+    assert policy.add(10, 400)
+    policy.reset()
+    assert policy.add(1, 40)
+
+
+def test_checkpoint_policy_thresholds() -> None:
+    now = [0.0]
+    policy = CheckpointPolicy(every_rows=100, every_seconds=30.0, every_bytes=0, clock=lambda: now[0])
+
+    assert not policy.add(60, 0)
+    assert policy.add(60, 0)
+    policy.reset()
+
+    assert not policy.add(10, 0)
+    now[0] = 31.0
+    assert policy.add(10, 0)
+
+    by_bytes = CheckpointPolicy(every_bytes=1000)
+    assert not by_bytes.add(10, 800)
+    assert by_bytes.add(10, 800)
@@ -1,11 +1,30 @@
+import math
 import pathlib
+import random
 import sys
 
+import numpy as np
+import pytest
+
 SRC_ROOT = pathlib.Path(__file__).resolve().parents[1] / "src"
 if str(SRC_ROOT) not in sys.path:
     sys.path.insert(0, str(SRC_ROOT))
 
-from etl_for_all_studies.correlation import compute_gene_pair_correlations
+from etl_for_all_studies.correlation import (
+    BootstrapSettings,
+    PairCorrelations,
+    PersistenceFilter,
+    _rank_rows_numpy,
+    _t_two_sided_pvalues_numpy,
+    compute_differential_correlations,
+    compute_gene_pair_correlations,
+    compute_pair_correlations,
+    compute_stratified_pair_correlations,
+    iter_pair_correlation_tiles,
+    prune_pair_correlations,
+)
+from etl_for_all_studies import correlation
+from etl_for_all_studies.multiple_testing import SpilledBenjaminiHochberg, benjamini_hochberg
 
 
 def test_compute_gene_pair_correlations_returns_expected_pairs() -> None:
@@ -83,3 +102,383 @@ def test_compute_gene_pair_correlations_handles_two_samples() -> None:
     assert record.n_samples == 2
     assert 0.0 <= record.p_value <= 1.0
     assert record.q_value is None
+
+
+@pytest.mark.parametrize("missing", ["none", "few", "sparse"])
+def test_compute_gene_pair_correlations_matches_per_pair_spearman(missing: str) -> None:
+    spearmanr = pytest.importorskip("scipy.stats").spearmanr
+    rng = random.Random(7)
+    samples = [f"S{index}" for index in range(12)]
+    gene_expression = {
+        gene_key: {sample: float(rng.randint(0, 6)) for sample in samples}
+        for gene_key in range(1, 9)
+    }
+    if missing == "few":
+        # Missing measurements exercise the pairwise-complete path.
+        del gene_expression[3]["S0"]
+        del gene_expression[5]["S4"]
+    elif missing == "sparse":
+        for gene_key in range(1, 8):
+            for sample in samples:
+                if rng.random() < 0.3:
+                    del gene_expression[gene_key][sample]
+        # Constant only over the samples it shares with gene 2.
+        gene_expression[1] = {"S0": 1.0, "S1": 1.0, "S2": 5.0}
+        gene_expression[2] = {"S0": 3.0, "S1": 4.0, "S3": 2.0}
+    gene_expression[8] = {sample: 2.0 for sample in samples}
+
+    results = compute_gene_pair_correlations(gene_expression, study_key=1)
+
+    expected = {}
+    for gene_a in gene_expression:
+        for gene_b in gene_expression:
+            if gene_a >= gene_b or 8 in (gene_a, gene_b):
+                continue
+            shared = sorted(gene_expression[gene_a].keys() & gene_expression[gene_b].keys())
+            values_a = [gene_expression[gene_a][s] for s in shared]
+            values_b = [gene_expression[gene_b][s] for s in shared]
+            if len(shared) < 2 or len(set(values_a)) < 2 or len(set(values_b)) < 2:
+                continue
+            result = spearmanr(values_a, values_b)
+            expected[(gene_a, gene_b)] = (float(result.statistic), float(result.pvalue), len(shared))
+
+    assert {(r.gene_a_key, r.gene_b_key) for r in results} == set(expected)
+    for record in results:
+        rho, p_value, n_samples = expected[(record.gene_a_key, record.gene_b_key)]
+        assert math.isclose(record.rho_spearman, rho, abs_tol=1e-12)
+        if math.isnan(p_value):
+            assert record.p_value == 1.0 and record.q_value is None
+        else:
+            assert math.isclose(record.p_value, p_value, rel_tol=1e-9, abs_tol=1e-12)
+        assert record.n_samples == n_samples
+
+
+def test_benjamini_hochberg_adjusts_and_preserves_missing() -> None:
+    q_values = benjamini_hochberg([0.01, 0.04, math.nan, 0.03, 0.2])
+
+    assert q_values[0] == pytest.approx(0.04)
+    assert q_values[1] == pytest.approx(0.16 / 3)
+    assert math.isnan(q_values[2])
+    assert q_values[3] == pytest.approx(0.16 / 3)
+    assert q_values[4] == pytest.approx(0.2)
+
+
+@pytest.mark.parametrize("tile_size", [1, 3, 4, 50])
+def test_tiled_pair_correlations_match_untiled(tile_size: int) -> None:
+    rng = np.random.default_rng(11)
+    values = rng.integers(0, 5, size=(10, 9)).astype(float)
+    values[rng.random(values.shape) < 0.15] = np.nan
+    values[6] = 1.0
+    gene_keys = np.arange(100, 110)
+
+    untiled = compute_pair_correlations(values, gene_keys)
+    tiles = list(iter_pair_correlation_tiles(values, gene_keys, tile_size=tile_size))
+
+    expected = {
+        (a, b): (rho, p, n)
+        for a, b, rho, p, n in zip(
+            untiled.gene_a_keys.tolist(),
+            untiled.gene_b_keys.tolist(),
+            untiled.rho.tolist(),
+            untiled.p_values.tolist(),
+            untiled.n_samples.tolist(),
+        )
+    }
+    actual = {}
+    for tile in tiles:
+        assert np.isnan(tile.q_values).all()
+        for a, b, rho, p, n in zip(
+            tile.gene_a_keys.tolist(),
+            tile.gene_b_keys.tolist(),
+            tile.rho.tolist(),
+            tile.p_values.tolist(),
+            tile.n_samples.tolist(),
+        ):
+            assert a < b and (a, b) not in actual
+            actual[(a, b)] = (rho, p, n)
+
+    assert actual.keys() == expected.keys()
+    for pair, (rho, p_value, n_samples) in expected.items():
+        assert actual[pair][0] == pytest.approx(rho, abs=1e-12)
+        assert actual[pair][1] == pytest.approx(p_value, nan_ok=True)
+        assert actual[pair][2] == n_samples
+
+
+def _reference_correlation(method: str, x: np.ndarray, y: np.ndarray) -> float:
+    if method == "pearson":
+        return float(np.corrcoef(x, y)[0, 1])
+    if method == "kendall":
+        signs_x = [np.sign(x[j] - x[i]) for i in range(len(x)) for j in range(i + 1, len(x))]
+        signs_y = [np.sign(y[j] - y[i]) for i in range(len(y)) for j in range(i + 1, len(y))]
+        concordance = sum(a * b for a, b in zip(signs_x, signs_y))
+        return concordance / math.sqrt(np.count_nonzero(signs_x) * np.count_nonzero(signs_y))
+
+    def weighted(v: np.ndarray) -> np.ndarray:
+        deviations = v - np.median(v)
+        u = deviations / (9.0 * np.median(np.abs(deviations)))
+        return deviations * np.where(np.abs(u) < 1, (1 - u**2) ** 2, 0.0)
+
+    a, b = weighted(x), weighted(y)
+    return float(a @ b / math.sqrt((a @ a) * (b @ b)))
+
+
+@pytest.mark.parametrize("method", ["pearson", "kendall", "biweight"])
+@pytest.mark.parametrize("tile_size", [2, 50])
+def test_correlation_methods_match_per_pair_definitions(method: str, tile_size: int) -> None:
+    rng = np.random.default_rng(13)
+    values = np.round(rng.normal(size=(6, 11)), 1)
+    values[0, 3] = 8.0  # An outlier the biweight weights down to zero.
+    values[2, [1, 6]] = np.nan
+    values[5] = 1.5
+    gene_keys = np.arange(60, 66)
+
+    tiles = list(
+        iter_pair_correlation_tiles(values, gene_keys, tile_size=tile_size, method=method)
+    )
+
+    seen = set()
+    for tile in tiles:
+        assert tile.method == method
+        for a, b, rho, p_value, n in zip(
+            tile.gene_a_keys.tolist(),
+            tile.gene_b_keys.tolist(),
+            tile.rho.tolist(),
+            tile.p_values.tolist(),
+            tile.n_samples.tolist(),
+        ):
+            seen.add((a, b))
+            shared = ~np.isnan(values[a - 60]) & ~np.isnan(values[b - 60])
+            expected = _reference_correlation(
+                method, values[a - 60, shared], values[b - 60, shared]
+            )
+            assert n == shared.sum()
+            assert rho == pytest.approx(expected, abs=1e-12)
+            assert 0.0 <= p_value <= 1.0
+    # The constant gene 65 pairs with nothing.
+    assert seen == {(a, b) for a in range(60, 65) for b in range(a + 1, 65)}
+
+
+def test_kendall_matches_scipy_on_tied_input() -> None:
+    stats = pytest.importorskip("scipy.stats")
+    rng = np.random.default_rng(19)
+    values = rng.integers(0, 5, size=(5, 300)).astype(float)
+    values[1, rng.choice(300, size=40, replace=False)] = np.nan
+    values[3, :150] = 2.0  # Half of one gene is a single tie run.
+    gene_keys = np.arange(5)
+
+    pairs = compute_pair_correlations(values, gene_keys, method="kendall")
+
+    assert len(pairs) == 10
+    for a, b, rho, p_value in zip(
+        pairs.gene_a_keys.tolist(),
+        pairs.gene_b_keys.tolist(),
+        pairs.rho.tolist(),
+        pairs.p_values.tolist(),
+    ):
+        shared = ~np.isnan(values[a]) & ~np.isnan(values[b])
+        expected = stats.kendalltau(values[a, shared], values[b, shared], method="asymptotic")
+        assert rho == pytest.approx(expected.statistic, abs=1e-12)
+        assert p_value == pytest.approx(expected.pvalue, rel=1e-9)
+
+
+def test_stratified_pair_correlations_match_each_column_subset() -> None:
+    rng = np.random.default_rng(17)
+    values = rng.integers(0, 6, size=(8, 13)).astype(float)
+    values[2, 3] = np.nan
+    values[5, [0, 7]] = np.nan
+    values[6] = 1.0
+    strata = [3, 1, None, 3, 1, 1, 3, 2, 3, 1, 3, 1, 2]
+    gene_keys = np.arange(20, 28)
+
+    results = compute_stratified_pair_correlations(values, gene_keys, strata)
+
+    assert [pairs.illness_key for pairs in results] == [1, 2, 3]
+    for pairs in results:
+        columns = [index for index, stratum in enumerate(strata) if stratum == pairs.illness_key]
+        expected = compute_pair_correlations(values[:, columns], gene_keys)
+        np.testing.assert_array_equal(pairs.gene_a_keys, expected.gene_a_keys)
+        np.testing.assert_array_equal(pairs.gene_b_keys, expected.gene_b_keys)
+        np.testing.assert_array_equal(pairs.n_samples, expected.n_samples)
+        np.testing.assert_allclose(pairs.rho, expected.rho, atol=1e-12)
+        np.testing.assert_allclose(pairs.q_values, expected.q_values)
+
+
+def test_differential_correlations_apply_fisher_z_test() -> None:
+    rng = np.random.default_rng(23)
+    values = rng.normal(size=(5, 16))
+    values[1, 2] = np.nan
+    strata = [7] * 6 + [9] * 5 + [4] * 4 + [None]
+    gene_keys = np.arange(1, 6)
+
+    results = compute_differential_correlations(values, gene_keys, strata, reference=7)
+
+    assert [(item.illness_key, item.reference_illness_key) for item in results] == [(4, 7), (9, 7)]
+    reference = compute_pair_correlations(values[:, :6], gene_keys)
+    illness = compute_pair_correlations(values[:, 6:11], gene_keys)
+    comparison = results[1]
+    assert len(comparison) == 10
+    np.testing.assert_allclose(comparison.rho_reference, reference.rho)
+    np.testing.assert_allclose(comparison.rho_illness, illness.rho)
+    expected_z = (np.arctanh(illness.rho) - np.arctanh(reference.rho)) / np.sqrt(
+        1.0 / (illness.n_samples - 3) + 1.0 / (reference.n_samples - 3)
+    )
+    np.testing.assert_allclose(comparison.z_scores, expected_z)
+    expected_p = [math.erfc(abs(z) / math.sqrt(2.0)) for z in expected_z]
+    np.testing.assert_allclose(comparison.p_values, expected_p)
+    np.testing.assert_allclose(comparison.q_values, benjamini_hochberg(comparison.p_values))
+    # A reference illness without samples yields no comparisons.
+    assert compute_differential_correlations(values, gene_keys, strata, reference=3) == []
+
+
+@pytest.mark.parametrize("tile_size", [2, 50])
+def test_bootstrap_intervals_match_per_pair_resampling(
+    tile_size: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    rng = np.random.default_rng(29)
+    values = rng.integers(0, 6, size=(6, 9)).astype(float)
+    values[4, 1] = np.nan
+    gene_keys = np.arange(40, 46)
+    settings = BootstrapSettings(resamples=40, confidence=0.9, seed=5)
+    shapes = []
+    original_scores = correlation._bootstrap_scores
+
+    def _recording_scores(ranked, block, draws):
+        scores = original_scores(ranked, block, draws)
+        shapes.append(scores.shape)
+        return scores
+
+    monkeypatch.setattr(correlation, "_bootstrap_scores", _recording_scores)
+
+    tiles = list(
+        iter_pair_correlation_tiles(values, gene_keys, tile_size=tile_size, bootstrap=settings)
+    )
+    # Resampled ranks are only ever held for one block of genes at a time.
+    assert shapes and all(shape[:2] == (40, min(tile_size, 6)) for shape in shapes)
+
+    draws = np.random.default_rng(5).integers(0, 9, size=(40, 9))
+    seen = 0
+    for tile in tiles:
+        for a, b, lower, upper in zip(
+            tile.gene_a_keys.tolist(),
+            tile.gene_b_keys.tolist(),
+            tile.rho_lower.tolist(),
+            tile.rho_upper.tolist(),
+        ):
+            seen += 1
+            if 44 in (a, b):
+                # Rows with missing values get no interval.
+                assert math.isnan(lower) and math.isnan(upper)
+                continue
+            samples = []
+            for columns in draws:
+                x, y = values[a - 40, columns], values[b - 40, columns]
+                if np.ptp(x) and np.ptp(y):
+                    ranks = _rank_rows_numpy(np.vstack([x, y]))
+                    samples.append(np.corrcoef(ranks)[0, 1])
+            expected = np.quantile(samples, [0.05, 0.95])
+            assert lower == pytest.approx(expected[0], abs=1e-5)
+            assert upper == pytest.approx(expected[1], abs=1e-5)
+    assert seen == 15
+
+
+def test_kendall_bootstrap_intervals_match_per_pair_resampling() -> None:
+    rng = np.random.default_rng(31)
+    values = rng.integers(0, 6, size=(5, 12)).astype(float)
+    values[2, 3] = np.nan
+    settings = BootstrapSettings(resamples=30, confidence=0.9, seed=3)
+
+    pairs = compute_pair_correlations(
+        values, np.arange(5), bootstrap=settings, method="kendall"
+    )
+
+    draws = np.random.default_rng(3).integers(0, 12, size=(30, 12))
+    for a, b, lower, upper in zip(
+        pairs.gene_a_keys.tolist(),
+        pairs.gene_b_keys.tolist(),
+        pairs.rho_lower.tolist(),
+        pairs.rho_upper.tolist(),
+    ):
+        if 2 in (a, b):
+            assert math.isnan(lower) and math.isnan(upper)
+            continue
+        samples = [
+            _reference_correlation("kendall", values[a, columns], values[b, columns])
+            for columns in draws
+            if np.ptp(values[a, columns]) and np.ptp(values[b, columns])
+        ]
+        expected = np.quantile(samples, [0.05, 0.95])
+        assert lower == pytest.approx(expected[0], abs=1e-5)
+        assert upper == pytest.approx(expected[1], abs=1e-5)
+
+
+def test_spilled_benjamini_hochberg_matches_in_memory(tmp_path: pathlib.Path) -> None:
+    rng = np.random.default_rng(3)
+    p_values = np.round(rng.random(200), 2)
+    p_values[::17] = np.nan
+    chunks = np.array_split(p_values, 7)
+
+    # Tiny runs and merge chunks force the external sort through several rounds.
+    adjuster = SpilledBenjaminiHochberg(tmp_path, run_size=23, merge_chunk=5)
+    for chunk in chunks:
+        adjuster.add(chunk)
+    adjuster.finalize()
+    spilled = np.concatenate([adjuster.q_values(chunk) for chunk in chunks])
+    adjuster.close()
+
+    np.testing.assert_allclose(spilled, benjamini_hochberg(p_values), equal_nan=True)
+
+
+def test_prune_pair_correlations_applies_thresholds_then_top_k() -> None:
+    pairs = PairCorrelations(
+        gene_a_keys=np.array([1, 1, 1, 2, 2, 3]),
+        gene_b_keys=np.array([2, 3, 4, 3, 4, 4]),
+        rho=np.array([0.9, -0.5, 0.1, 0.35, 0.2, -0.05]),
+        p_values=np.array([0.001, 0.01, 0.001, 0.2, 0.5, 0.9]),
+        n_samples=np.full(6, 10),
+        q_values=np.array([0.006, 0.03, 0.003, 0.24, 0.6, 0.9]),
+    )
+    gene_keys = np.array([1, 2, 3, 4])
+
+    either = prune_pair_correlations(
+        pairs, gene_keys, PersistenceFilter(min_abs_rho=0.3, max_q=0.05)
+    )
+    assert list(zip(either.gene_a_keys, either.gene_b_keys)) == [(1, 2), (1, 3), (1, 4), (2, 3)]
+
+    capped = prune_pair_correlations(
+        pairs, gene_keys, PersistenceFilter(min_abs_rho=0.3, max_q=0.05, top_k=1)
+    )
+    # (2, 3) is neither gene's strongest partner; gene 4 keeps (1, 4) even
+    # though gene 1 ranks it last.
+    assert list(zip(capped.gene_a_keys, capped.gene_b_keys)) == [(1, 2), (1, 3), (1, 4)]
+    assert prune_pair_correlations(pairs, gene_keys, PersistenceFilter()) is pairs
+
+
+def test_numpy_backend_ranks_ties_and_matches_closed_form_pvalues() -> None:
+    ranks = _rank_rows_numpy(np.array([[3.0, 1.0, 3.0, 2.0], [5.0, 5.0, 5.0, 5.0]]))
+    np.testing.assert_array_equal(ranks, [[3.5, 1.0, 3.5, 2.0], [2.5, 2.5, 2.5, 2.5]])
+
+    # With two degrees of freedom the two-sided t tail reduces to 1 - |rho|.
+    rho = np.array([0.0, 1e-12, 0.3, -0.75, 0.999, 1.0, -1.0])
+    np.testing.assert_allclose(
+        _t_two_sided_pvalues_numpy(rho, np.full(rho.shape, 2.0)),
+        1.0 - np.abs(rho),
+        rtol=1e-12,
+        atol=1e-15,
+    )
+
+
+def test_numpy_backend_matches_scipy(monkeypatch: pytest.MonkeyPatch) -> None:
+    pytest.importorskip("scipy.stats")
+    rng = np.random.default_rng(21)
+    values = rng.integers(0, 6, size=(15, 40)).astype(float)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    gene_keys = np.arange(15)
+
+    with_scipy = compute_pair_correlations(values, gene_keys)
+    monkeypatch.setattr(correlation, "_scipy_stats", None)
+    numpy_only = compute_pair_correlations(values, gene_keys)
+
+    np.testing.assert_array_equal(numpy_only.gene_a_keys, with_scipy.gene_a_keys)
+    np.testing.assert_allclose(numpy_only.rho, with_scipy.rho, atol=1e-12)
+    np.testing.assert_allclose(numpy_only.p_values, with_scipy.p_values, rtol=1e-9, atol=1e-14)
+    np.testing.assert_allclose(numpy_only.q_values, with_scipy.q_values, rtol=1e-9, atol=1e-14)
@@ -1,7 +1,11 @@
+import os
 import pathlib
 import sys
 import types
 
+import numpy as np
+
+import pytest
 from sqlalchemy import create_engine, select
 from sqlalchemy.orm import Session
 
@@ -11,26 +15,40 @@ if str(SRC_ROOT) not in sys.path:
 
 from etl_for_all_studies.config import (
     AppConfig,
+    ConfigurationError,
     DatabaseConfig,
     FieldMappingConfig,
     LoggingConfig,
     ProcessingConfig,
 )
-from etl_for_all_studies.correlation_job import run_correlation_job
+from etl_for_all_studies.correlation import (
+    PersistenceFilter,
+    compute_pair_correlations,
+    iter_pair_correlation_tiles,
+    prune_pair_correlations,
+)
+from etl_for_all_studies.correlation_job import _compute_tiles, _load_tile, run_correlation_job
+from etl_for_all_studies.multiple_testing import benjamini_hochberg
+from etl_for_all_studies.result_cache import read_result_cache, write_result_cache
 from etl_for_all_studies.models import (
     Base,
     DimGene,
+    DimIllness,
     DimSample,
     DimStudy,
     FactExpression,
     FactGenePairCorrelation,
+    FactGenePairDiffCorrelation,
+    FactGenePairMeta,
 )
 from etl_for_all_studies.repositories import (
     DimensionCache,
     get_or_create_gene,
+    get_or_create_illness,
     get_or_create_sample,
     get_or_create_study,
     iter_studies_with_expression,
+    load_expression_array,
     load_gene_expression_matrix,
 )
 
@@ -70,9 +88,9 @@ def _build_config(tmp_path: pathlib.Path, db_path: pathlib.Path) -> AppConfig:
     )
 
 
-def _prime_expression_data(session: Session) -> DimStudy:
+def _prime_expression_data(session: Session, accession: str = "GSE500") -> DimStudy:
     cache = DimensionCache({}, {}, {}, {}, {})
-    study_key = get_or_create_study(session, cache, "GSE500")
+    study_key = get_or_create_study(session, cache, accession)
     study = session.get(DimStudy, study_key)
     assert study is not None
 
@@ -80,7 +98,7 @@ def _prime_expression_data(session: Session) -> DimStudy:
     for index in range(3):
         metadata = types.SimpleNamespace(
             gsm_accession=f"GSM{index}",
-            study_accession="GSE500",
+            study_accession=accession,
             platform_accession="UNKNOWN",
             illness_label="UNKNOWN",
             age="UNKNOWN",
@@ -140,6 +158,35 @@ def test_load_gene_expression_matrix_returns_samples(tmp_path):
         assert set(sample_values.keys()) == {"GSM0", "GSM1", "GSM2"}
 
 
+def test_load_expression_array_streams_into_dense_matrix(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'array.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        study = _prime_expression_data(session)
+        legacy = load_gene_expression_matrix(session, study.study_key)
+        session.execute(
+            FactExpression.__table__.delete().where(FactExpression.expression_value == 1.5)
+        )
+        matrix = load_expression_array(session, study.study_key, chunk_size=2)
+        samples = {
+            sample.sample_key: sample.gsm_accession
+            for sample in session.execute(select(DimSample)).scalars()
+        }
+
+    assert matrix.values.dtype.name == "float32"
+    assert matrix.values.shape == (len(matrix.gene_keys), len(matrix.sample_keys))
+    assert list(matrix.gene_keys) == sorted(legacy)
+    assert [samples[key] for key in matrix.sample_keys] == ["GSM0", "GSM1", "GSM2"]
+    assert int(matrix.mask.sum()) == 5
+    for row, gene_key in enumerate(matrix.gene_keys):
+        for column, sample_key in enumerate(matrix.sample_keys):
+            value = legacy[int(gene_key)][samples[int(sample_key)]]
+            if matrix.mask[row, column]:
+                assert matrix.values[row, column] == value
+            else:
+                assert value == 1.5
+
+
 def test_run_correlation_job_generates_pairs(tmp_path):
     db_path = tmp_path / "correlation.db"
     config = _build_config(tmp_path, db_path)
@@ -179,3 +226,557 @@ def test_run_correlation_job_generates_pairs(tmp_path):
     assert record.n_samples == 3
     assert record.gene_a_key != record.gene_b_key
     assert record.rho_spearman != 0.0
+
+
+def test_run_correlation_job_tiled_matches_untiled(tmp_path):
+    results = {}
+    for tile_size in (0, 1):
+        run_dir = tmp_path / f"tile_{tile_size}"
+        run_dir.mkdir()
+        config = _build_config(run_dir, run_dir / "correlation.db")
+        config.correlation.tile_size = tile_size
+        engine = create_engine(config.database.connection_string)
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            _prime_expression_data(session)
+
+        run_correlation_job(config, study_accessions=["GSE500"])
+
+        with Session(engine) as session:
+            results[tile_size] = sorted(
+                (row.gene_a_key, row.gene_b_key, row.rho_spearman, row.p_value, row.q_value)
+                for row in session.execute(select(FactGenePairCorrelation)).scalars()
+            )
+        engine.dispose()
+
+    assert results[1] == results[0]
+    assert len(results[1]) == 1
+
+
+def test_run_correlation_job_stratifies_by_illness(tmp_path):
+    rng = np.random.default_rng(8)
+    values = rng.normal(size=(3, 8))
+    illnesses = ["case", "control"] * 4
+    results = {}
+    for tile_size in (0, 1):
+        run_dir = tmp_path / f"tile_{tile_size}"
+        run_dir.mkdir()
+        config = _build_config(run_dir, run_dir / "correlation.db")
+        config.correlation.tile_size = tile_size
+        config.correlation.stratify_by_illness = True
+        engine = create_engine(config.database.connection_string)
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            cache = DimensionCache({}, {}, {}, {}, {})
+            study_key = get_or_create_study(session, cache, "GSE700")
+            gene_keys = [
+                get_or_create_gene(session, cache, f"ENSG{index}") for index in range(3)
+            ]
+            for column, illness in enumerate(illnesses):
+                metadata = types.SimpleNamespace(
+                    gsm_accession=f"GSM{column}",
+                    study_accession="GSE700",
+                    platform_accession="UNKNOWN",
+                    illness_label=illness,
+                    age="UNKNOWN",
+                    sex="UNKNOWN",
+                )
+                sample_key = get_or_create_sample(session, cache, metadata, study_key=study_key)
+                for row, gene_key in enumerate(gene_keys):
+                    session.add(
+                        FactExpression(
+                            gene_key=gene_key,
+                            sample_key=sample_key,
+                            study_key=study_key,
+                            expression_value=float(values[row, column]),
+                        )
+                    )
+            session.commit()
+
+        run_correlation_job(config)
+
+        with Session(engine) as session:
+            labels = dict(session.execute(select(DimIllness.illness_key, DimIllness.illness_label)).all())
+            results[tile_size] = sorted(
+                (labels.get(row.illness_key, ""), row.gene_a_key, row.gene_b_key, row.rho_spearman, row.q_value)
+                for row in session.execute(select(FactGenePairCorrelation)).scalars()
+            )
+        engine.dispose()
+
+    assert results[1] == pytest.approx(results[0])
+    assert [row[0] for row in results[0]] == [""] * 3 + ["case"] * 3 + ["control"] * 3
+    case = compute_pair_correlations(values[:, 0::2], np.arange(3))
+    np.testing.assert_allclose([row[3] for row in results[0][3:6]], case.rho)
+
+
+def _prime_random_study(session: Session, accession: str, values: np.ndarray) -> None:
+    cache = DimensionCache({}, {}, {}, {}, {})
+    study_key = get_or_create_study(session, cache, accession)
+    gene_keys = [
+        get_or_create_gene(session, cache, f"ENSG{index}") for index in range(values.shape[0])
+    ]
+    for column in range(values.shape[1]):
+        metadata = types.SimpleNamespace(
+            gsm_accession=f"{accession}_GSM{column}",
+            study_accession=accession,
+            platform_accession="UNKNOWN",
+            illness_label="UNKNOWN",
+            age="UNKNOWN",
+            sex="UNKNOWN",
+        )
+        sample_key = get_or_create_sample(session, cache, metadata, study_key=study_key)
+        for row, gene_key in enumerate(gene_keys):
+            session.add(
+                FactExpression(
+                    gene_key=gene_key,
+                    sample_key=sample_key,
+                    study_key=study_key,
+                    expression_value=float(values[row, column]),
+                )
+            )
+    session.commit()
+
+
+def test_run_correlation_job_maintains_meta_analysis_incrementally(tmp_path):
+    config = _build_config(tmp_path, tmp_path / "correlation.db")
+    engine = create_engine(config.database.connection_string)
+    Base.metadata.create_all(engine)
+    rng = np.random.default_rng(21)
+    with Session(engine) as session:
+        _prime_random_study(session, "GSE800", rng.normal(size=(3, 6)))
+        _prime_random_study(session, "GSE801", rng.normal(size=(3, 9)))
+        _prime_random_study(session, "GSE802", rng.normal(size=(3, 7)))
+
+    def expected_meta():
+        with Session(engine) as session:
+            rows = session.execute(
+                select(FactGenePairCorrelation).where(FactGenePairCorrelation.illness_key.is_(None))
+            ).scalars().all()
+        by_pair = {}
+        for row in rows:
+            by_pair.setdefault((row.gene_a_key, row.gene_b_key), []).append(
+                (row.n_samples - 3.0, np.arctanh(row.rho_spearman))
+            )
+        expected = {}
+        for pair, studies in by_pair.items():
+            weights, z = (np.array(column) for column in zip(*studies))
+            z_mean = (weights * z).sum() / weights.sum()
+            q_statistic = (weights * (z - z_mean) ** 2).sum()
+            expected[pair] = (len(studies), np.tanh(z_mean), q_statistic)
+        return expected
+
+    def stored_meta():
+        with Session(engine) as session:
+            return {
+                (row.gene_a_key, row.gene_b_key): (row.study_count, row.rho_meta, row.q_statistic)
+                for row in session.execute(select(FactGenePairMeta)).scalars()
+            }
+
+    # Studies refreshed before the meta-analysis is enabled are caught up later.
+    run_correlation_job(config, study_accessions=["GSE800"])
+    assert stored_meta() == {}
+    config.correlation.meta_analysis = True
+    run_correlation_job(config)
+
+    def assert_meta_matches():
+        expected, stored = expected_meta(), stored_meta()
+        assert stored.keys() == expected.keys()
+        for pair, (count, rho, q_statistic) in expected.items():
+            assert stored[pair][0] == count == 3
+            assert stored[pair][1] == pytest.approx(rho)
+            assert stored[pair][2] == pytest.approx(q_statistic, abs=1e-9)
+
+    assert len(stored_meta()) == 3
+    assert_meta_matches()
+
+    with Session(engine) as session:
+        study = session.execute(select(DimStudy).where(DimStudy.gse_accession == "GSE801")).scalar_one()
+        facts = session.execute(
+            select(FactExpression).where(FactExpression.study_key == study.study_key)
+        ).scalars().all()
+        for fact in facts[::2]:
+            fact.expression_value *= -1.0
+        session.commit()
+    run_correlation_job(config)
+    assert_meta_matches()
+    engine.dispose()
+
+
+@pytest.mark.parametrize(
+    "setting, value", [("min_abs_rho", 0.3), ("max_q", 0.05), ("top_k", 2)]
+)
+def test_run_correlation_job_refuses_meta_analysis_of_pruned_pairs(tmp_path, setting, value):
+    config = _build_config(tmp_path, tmp_path / "correlation.db")
+    config.correlation.meta_analysis = True
+    setattr(config.correlation, setting, value)
+    engine = create_engine(config.database.connection_string)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        _prime_random_study(session, "GSE805", np.random.default_rng(23).normal(size=(3, 6)))
+
+    with pytest.raises(ConfigurationError, match="meta_analysis"):
+        run_correlation_job(config)
+    with Session(engine) as session:
+        assert session.execute(select(FactGenePairCorrelation)).first() is None
+        assert session.execute(select(FactGenePairMeta)).first() is None
+    engine.dispose()
+
+
+def test_run_correlation_job_writes_differential_correlations(tmp_path):
+    config = _build_config(tmp_path, tmp_path / "correlation.db")
+    config.correlation.differential_reference = "control"
+    engine = create_engine(config.database.connection_string)
+    Base.metadata.create_all(engine)
+    rng = np.random.default_rng(29)
+    values = rng.normal(size=(3, 10))
+    with Session(engine) as session:
+        _prime_random_study(session, "GSE900", values)
+        cache = DimensionCache({}, {}, {}, {}, {})
+        control_key = get_or_create_illness(session, cache, "control")
+        case_key = get_or_create_illness(session, cache, "case")
+        for sample in session.execute(select(DimSample)).scalars():
+            column = int(sample.gsm_accession.rsplit("GSM", 1)[1])
+            sample.illness_key = case_key if column >= 5 else control_key
+        session.commit()
+
+    run_correlation_job(config)
+
+    with Session(engine) as session:
+        rows = session.execute(
+            select(FactGenePairDiffCorrelation).order_by(
+                FactGenePairDiffCorrelation.gene_a_key, FactGenePairDiffCorrelation.gene_b_key
+            )
+        ).scalars().all()
+        pooled = session.execute(select(FactGenePairCorrelation)).scalars().all()
+    engine.dispose()
+
+    assert len(rows) == 3
+    assert len(pooled) == 3 and all(row.illness_key is None for row in pooled)
+    assert {(row.illness_key, row.reference_illness_key) for row in rows} == {
+        (case_key, control_key)
+    }
+    reference = compute_pair_correlations(values[:, :5], np.arange(3))
+    case = compute_pair_correlations(values[:, 5:], np.arange(3))
+    np.testing.assert_allclose([row.rho_reference for row in rows], reference.rho)
+    np.testing.assert_allclose([row.rho_illness for row in rows], case.rho)
+    assert all(row.n_illness == row.n_reference == 5 for row in rows)
+
+
+@pytest.mark.parametrize("tile_size", [0, 2])
+def test_run_correlation_job_restores_results_from_cache(tmp_path, monkeypatch, tile_size):
+    from etl_for_all_studies import correlation_job
+    from etl_for_all_studies.models import EtlCorrelationRefresh
+
+    config = _build_config(tmp_path, tmp_path / "correlation.db")
+    config.correlation.cache_directory = tmp_path / "cache"
+    config.correlation.tile_size = tile_size
+    config.correlation.stratify_by_illness = True
+    config.correlation.min_abs_rho = 0.2
+    config.correlation.bootstrap_resamples = 30
+    engine = create_engine(config.database.connection_string)
+    Base.metadata.create_all(engine)
+    rng = np.random.default_rng(31)
+    with Session(engine) as session:
+        _prime_random_study(session, "GSE950", rng.normal(size=(5, 8)))
+        cache = DimensionCache({}, {}, {}, {}, {})
+        case_key = get_or_create_illness(session, cache, "case")
+        for sample in session.execute(select(DimSample)).scalars().all()[:4]:
+            sample.illness_key = case_key
+        session.commit()
+
+    def stored_rows():
+        with Session(engine) as session:
+            return sorted(
+                (
+                    row.illness_key or 0,
+                    row.gene_a_key,
+                    row.gene_b_key,
+                    row.rho_spearman,
+                    row.p_value,
+                    row.q_value,
+                    row.n_samples,
+                    row.rho_ci_lower,
+                    row.rho_ci_upper,
+                )
+                for row in session.execute(select(FactGenePairCorrelation)).scalars()
+            )
+
+    run_correlation_job(config)
+    computed = stored_rows()
+    assert all(row[7] <= row[8] for row in computed)
+    assert len(list((tmp_path / "cache").glob("GSE950-*.npz"))) == 1
+    assert {row[0] for row in computed} == {0, case_key}
+
+    with Session(engine) as session:
+        session.execute(FactGenePairCorrelation.__table__.delete())
+        session.execute(EtlCorrelationRefresh.__table__.delete())
+        session.commit()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cached study was recomputed")
+
+    monkeypatch.setattr(correlation_job, "_compute_study", fail)
+    run_correlation_job(config)
+    restored = stored_rows()
+    engine.dispose()
+
+    assert len(restored) == len(computed)
+    for restored_row, computed_row in zip(restored, computed):
+        assert restored_row[:3] == computed_row[:3]
+        assert restored_row[6] == computed_row[6]
+        np.testing.assert_allclose(restored_row[3:6], computed_row[3:6], rtol=1e-6)
+        np.testing.assert_allclose(restored_row[7:], computed_row[7:], rtol=1e-6)
+
+
+def test_result_cache_writes_tiles_and_keeps_small_p_values(tmp_path):
+    rng = np.random.default_rng(47)
+    values = rng.normal(size=(30, 10))
+    gene_keys = np.arange(1, 31)
+    whole = compute_pair_correlations(values, gene_keys)
+    whole.p_values[3] = 1e-300
+    whole.q_values[3] = 2e-299
+    pruned = prune_pair_correlations(
+        compute_pair_correlations(values[:, :8], gene_keys),
+        gene_keys,
+        PersistenceFilter(min_abs_rho=0.6),
+    )
+    pruned.illness_key = 7
+    assert 0 < len(pruned) < len(whole) // 2
+    half = np.arange(len(whole)) < len(whole) // 2
+    path = tmp_path / "study.npz"
+
+    write_result_cache(
+        path,
+        gene_keys=gene_keys,
+        sample_count=10,
+        computed_at="2024-01-01T00:00:00",
+        pruned_count=len(whole) - len(pruned),
+        # The whole study arrives as two tiles, out of order.
+        pair_sets=[whole.select(~half), pruned, whole.select(half)],
+    )
+
+    with np.load(path) as arrays:
+        # Only the stored pieces are written; no full triangle is ever built.
+        assert max(len(arrays[name]) for name in arrays.files if name.startswith("rho_")) == (
+            len(whole) - len(whole) // 2
+        )
+    cached = read_result_cache(path)
+    assert [pairs.illness_key for pairs in cached.pair_sets] == [None, 7]
+    for expected, restored in zip((whole, pruned), cached.pair_sets):
+        assert restored.gene_a_keys.tolist() == expected.gene_a_keys.tolist()
+        assert restored.gene_b_keys.tolist() == expected.gene_b_keys.tolist()
+        np.testing.assert_allclose(restored.rho, expected.rho, rtol=1e-6)
+        np.testing.assert_array_equal(restored.p_values, expected.p_values)
+        np.testing.assert_array_equal(restored.q_values, expected.q_values)
+    assert cached.pair_sets[0].p_values[3] == 1e-300
+
+
+def test_run_correlation_job_with_worker_processes(tmp_path, monkeypatch):
+    from etl_for_all_studies import correlation_job
+
+    # BLAS caps are set inside the workers; the parent's environment is untouched.
+    monkeypatch.delenv("OMP_NUM_THREADS", raising=False)
+    original_persist = correlation_job._persist_study
+    parent_caps = []
+
+    def _persist(*args, **kwargs):
+        parent_caps.append(os.environ.get("OMP_NUM_THREADS"))
+        return original_persist(*args, **kwargs)
+
+    monkeypatch.setattr(correlation_job, "_persist_study", _persist)
+    results = {}
+    for workers in (1, 2):
+        run_dir = tmp_path / f"workers_{workers}"
+        run_dir.mkdir()
+        config = _build_config(run_dir, run_dir / "correlation.db")
+        config.correlation.workers = workers
+        engine = create_engine(config.database.connection_string)
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            _prime_expression_data(session, "GSE500")
+            _prime_expression_data(session, "GSE501")
+
+        run_correlation_job(config)
+
+        with Session(engine) as session:
+            results[workers] = sorted(
+                (row.study_key, row.gene_a_key, row.gene_b_key, row.rho_spearman, row.q_value)
+                for row in session.execute(select(FactGenePairCorrelation)).scalars()
+            )
+        engine.dispose()
+
+    assert results[2] == results[1]
+    assert len({row[0] for row in results[2]}) == 2
+    assert parent_caps and set(parent_caps) == {None}
+
+
+def test_run_correlation_job_skips_unchanged_studies(tmp_path):
+    config = _build_config(tmp_path, tmp_path / "correlation.db")
+    engine = create_engine(config.database.connection_string)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        _prime_expression_data(session)
+
+    def stored_rho() -> float:
+        with Session(engine) as session:
+            return session.execute(select(FactGenePairCorrelation.rho_spearman)).scalar_one()
+
+    def tamper() -> None:
+        with Session(engine) as session:
+            session.execute(FactGenePairCorrelation.__table__.update().values(rho_spearman=0.0))
+            session.commit()
+
+    run_correlation_job(config)
+    computed = stored_rho()
+    tamper()
+
+    run_correlation_job(config)
+    assert stored_rho() == 0.0
+
+    run_correlation_job(config, force=True)
+    assert stored_rho() == computed
+
+    tamper()
+    with Session(engine) as session:
+        fact = session.execute(select(FactExpression).limit(1)).scalar_one()
+        fact.expression_value += 10.0
+        session.commit()
+    run_correlation_job(config)
+    assert stored_rho() != 0.0
+    engine.dispose()
+
+
+def test_run_correlation_job_keeps_methods_side_by_side(tmp_path):
+    from etl_for_all_studies.models import EtlCorrelationRefresh
+
+    config = _build_config(tmp_path, tmp_path / "correlation.db")
+    config.correlation.meta_analysis = True
+    engine = create_engine(config.database.connection_string)
+    Base.metadata.create_all(engine)
+    values = np.random.default_rng(41).normal(size=(4, 9))
+    with Session(engine) as session:
+        _prime_random_study(session, "GSE990", values)
+
+    def stored(model, *columns):
+        with Session(engine) as session:
+            return sorted(session.execute(select(*(getattr(model, name) for name in columns))).all())
+
+    for method in ("spearman", "pearson"):
+        config.correlation.method = method
+        run_correlation_job(config)
+    config.correlation.method = "spearman"
+    run_correlation_job(config)
+
+    rows = stored(FactGenePairCorrelation, "method", "gene_a_key", "gene_b_key", "rho_spearman")
+    assert [row[0] for row in rows] == ["pearson"] * 6 + ["spearman"] * 6
+    pearson = compute_pair_correlations(values, np.arange(6), method="pearson")
+    np.testing.assert_allclose([row[3] for row in rows[:6]], pearson.rho)
+    assert stored(EtlCorrelationRefresh, "method", "meta_applied") == [("pearson", 1), ("spearman", 1)]
+    meta = stored(FactGenePairMeta, "method", "rho_meta")
+    assert [row[0] for row in meta] == ["pearson"] * 6 + ["spearman"] * 6
+    engine.dispose()
+
+
+def test_compute_tiles_prunes_like_untiled_path(tmp_path):
+    rng = np.random.default_rng(5)
+    values = rng.normal(size=(12, 8))
+    values[3, 2] = np.nan
+    gene_keys = np.arange(1, 13)
+    persistence_filter = PersistenceFilter(min_abs_rho=0.4, max_q=0.5, top_k=2)
+
+    expected = prune_pair_correlations(
+        compute_pair_correlations(values, gene_keys), gene_keys, persistence_filter
+    )
+    tile_paths, persisted, pruned, study_pruned = _compute_tiles(
+        iter_pair_correlation_tiles(values, gene_keys, tile_size=5),
+        gene_keys,
+        directory=tmp_path,
+        persistence_filter=persistence_filter,
+    )
+    tiles = [_load_tile(path) for path in tile_paths]
+
+    def as_rows(pairs):
+        return {
+            (a, b): (rho, q)
+            for a, b, rho, q in zip(
+                pairs.gene_a_keys.tolist(),
+                pairs.gene_b_keys.tolist(),
+                pairs.rho.tolist(),
+                pairs.q_values.tolist(),
+            )
+        }
+
+    actual = {}
+    for tile in tiles:
+        actual.update(as_rows(tile))
+    assert persisted == len(expected) == len(actual)
+    assert pruned == 66 - persisted
+    assert study_pruned == pruned
+    assert actual.keys() == as_rows(expected).keys()
+    for pair, (rho, q_value) in as_rows(expected).items():
+        assert actual[pair][0] == pytest.approx(rho)
+        assert actual[pair][1] == pytest.approx(q_value)
+
+
+def test_run_correlation_job_writes_global_q_values(tmp_path):
+    config = _build_config(tmp_path, tmp_path / "correlation.db")
+    config.correlation.global_fdr = True
+    engine = create_engine(config.database.connection_string)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        _prime_expression_data(session, "GSE500")
+        _prime_expression_data(session, "GSE501")
+        fact = session.execute(select(FactExpression).limit(1)).scalar_one()
+        fact.expression_value = 2.5
+        session.commit()
+
+    run_correlation_job(config)
+
+    with Session(engine) as session:
+        rows = session.execute(
+            select(FactGenePairCorrelation).order_by(FactGenePairCorrelation.correlation_key)
+        ).scalars().all()
+    engine.dispose()
+
+    assert len(rows) == 2
+    expected = benjamini_hochberg(np.array([row.p_value for row in rows]))
+    np.testing.assert_allclose([row.q_value_global for row in rows], expected)
+    assert all(row.q_value_global >= row.q_value for row in rows)
+
+
+@pytest.mark.parametrize("tile_size", [0, 2])
+def test_global_q_values_cover_whole_study_pairs_only(tmp_path, tile_size):
+    config = _build_config(tmp_path, tmp_path / "correlation.db")
+    config.correlation.global_fdr = True
+    config.correlation.stratify_by_illness = True
+    config.correlation.tile_size = tile_size
+    config.correlation.min_abs_rho = 0.3
+    engine = create_engine(config.database.connection_string)
+    Base.metadata.create_all(engine)
+    rng = np.random.default_rng(44)
+    with Session(engine) as session:
+        _prime_random_study(session, "GSE960", rng.normal(size=(6, 9)))
+        cache = DimensionCache({}, {}, {}, {}, {})
+        case_key = get_or_create_illness(session, cache, "case")
+        for sample in session.execute(select(DimSample)).scalars().all()[:5]:
+            sample.illness_key = case_key
+        session.commit()
+
+    run_correlation_job(config)
+
+    with Session(engine) as session:
+        rows = session.execute(
+            select(FactGenePairCorrelation).order_by(FactGenePairCorrelation.correlation_key)
+        ).scalars().all()
+    engine.dispose()
+
+    study_rows = [row for row in rows if row.illness_key is None]
+    stratum_rows = [row for row in rows if row.illness_key == case_key]
+    assert study_rows and stratum_rows
+    assert len(study_rows) < 15
+    assert all(row.q_value_global is None for row in stratum_rows)
+    # Pruned whole-study pairs count as p = 1; stratum pairs are not in the family.
+    p_values = np.ones(15)
+    p_values[: len(study_rows)] = [row.p_value for row in study_rows]
+    expected = benjamini_hochberg(p_values)[: len(study_rows)]
+    np.testing.assert_allclose([row.q_value_global for row in study_rows], expected)
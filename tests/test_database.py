@@ -0,0 +1,71 @@
+import pathlib
+import sys
+
+from sqlalchemy import text
+
+SRC_ROOT = pathlib.Path(__file__).resolve().parents[1] / "src"
+if str(SRC_ROOT) not in sys.path:
+    sys.path.insert(0, str(SRC_ROOT))
+
+from etl_for_all_studies.config import (
+    AppConfig,
+    DatabaseConfig,
+    FieldMappingConfig,
+    LoggingConfig,
+    ProcessingConfig,
+)
+from etl_for_all_studies.database import (
+    create_engine_with_retries,
+    derive_pool_settings,
+    get_pool_metrics,
+)
+
+
+def _config(tmp_path: pathlib.Path, connection_string: str, **database_options) -> AppConfig:
+    return AppConfig(
+        database=DatabaseConfig(connection_string=connection_string, **database_options),
+        processing=ProcessingConfig(
+            input_directory=tmp_path,
+            gene_filter_file=tmp_path / "genes.tsv",
+            max_concurrent_studies=6,
+        ),
+        logging=LoggingConfig(log_directory=tmp_path / "logs"),
+        field_mappings=FieldMappingConfig(),
+    )
+
+
+def test_derive_pool_settings_follows_concurrency(tmp_path: pathlib.Path) -> None:
+    server = _config(tmp_path, "postgresql://etl@db/warehouse")
+    assert derive_pool_settings(server) == (7, 1)
+    assert derive_pool_settings(server, workers=12) == (13, 3)
+
+    sqlite = _config(tmp_path, f"sqlite:///{tmp_path / 'etl.db'}")
+    assert derive_pool_settings(sqlite) == (2, 1)
+
+    overridden = _config(tmp_path, "postgresql://etl@db/warehouse", pool_size=20, max_overflow=0)
+    assert derive_pool_settings(overridden) == (20, 0)
+
+
+def test_single_connection_engine_ignores_worker_concurrency(tmp_path: pathlib.Path) -> None:
+    config = _config(tmp_path, f"sqlite:///{tmp_path / 'etl.db'}", pool_size=20)
+    engine = create_engine_with_retries(config, single_connection=True)
+
+    assert engine.pool.size() == 1
+    assert engine.pool._max_overflow == 0
+    engine.dispose()
+
+
+def test_engine_pool_records_checkouts(tmp_path: pathlib.Path) -> None:
+    engine = create_engine_with_retries(_config(tmp_path, f"sqlite:///{tmp_path / 'etl.db'}"))
+
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    metrics = get_pool_metrics(engine)
+    assert metrics is not None
+    assert metrics.pool_size == 2
+    assert metrics.checkouts == 3
+    assert metrics.checked_out == 0
+    assert metrics.peak_checked_out == 1
+    assert metrics.total_wait_seconds >= 0.0
@@ -104,3 +104,448 @@ def test_process_metadata_uses_directory_study_accession(tmp_path: pathlib.Path)
     assert all(sample.study_key == study_key for sample in dim_samples)
     assert set(cache.samples.keys()) == {("GSM_A", study_key), ("GSM_B", study_key)}
     assert all(sample.study_accession == "GSE123" for sample in samples)
+
+
+def _write_study(root: pathlib.Path, accession: str, genes: dict[str, list[float]]) -> pathlib.Path:
+    study_dir = root / accession
+    study_dir.mkdir()
+    sample_ids = [f"GSM{index}" for index in range(len(next(iter(genes.values()))))]
+    metadata_lines = ["refinebio_accession_code\texperiment_accession"]
+    metadata_lines.extend(f"{sample}\t{accession}" for sample in sample_ids)
+    (study_dir / f"metadata_{accession}.tsv").write_text(
+        "\n".join(metadata_lines) + "\n", encoding="utf-8"
+    )
+    expression_lines = ["gene\t" + "\t".join(sample_ids)]
+    for gene_id, values in genes.items():
+        expression_lines.append(gene_id + "\t" + "\t".join(str(value) for value in values))
+    (study_dir / f"expression_{accession}.tsv").write_text(
+        "\n".join(expression_lines) + "\n", encoding="utf-8"
+    )
+    return study_dir
+
+
+def _build_config(tmp_path: pathlib.Path, **processing_options):
+    from etl_for_all_studies.config import (
+        AppConfig,
+        DatabaseConfig,
+        LoggingConfig,
+        ProcessingConfig,
+    )
+
+    input_dir = tmp_path / "input"
+    input_dir.mkdir(exist_ok=True)
+    gene_filter = tmp_path / "genes.tsv"
+    gene_filter.write_text("ensembl_id\nENSG1\nENSG2\nENSG3\n", encoding="utf-8")
+    return AppConfig(
+        database=DatabaseConfig(
+            connection_string=f"sqlite:///{tmp_path / 'etl.db'}",
+            batch_size=2,
+            max_retries=0,
+            retry_backoff_seconds=0,
+        ),
+        processing=ProcessingConfig(
+            input_directory=input_dir,
+            gene_filter_file=gene_filter,
+            max_concurrent_studies=1,
+            **processing_options,
+        ),
+        logging=LoggingConfig(log_directory=tmp_path / "logs"),
+        field_mappings=FieldMappingConfig(),
+    )
+
+
+def test_process_single_study_pipelined_writes_match_sequential(tmp_path: pathlib.Path) -> None:
+    from etl_for_all_studies.database import create_session_factory
+    from etl_for_all_studies.models import DimGene, EtlStudyState, FactExpression
+
+    genes = {
+        "ENSG1": [1.0, 2.0, 3.0],
+        "ENSG2": [4.0, 5.0, 6.0],
+        "ENSG9": [7.0, 8.0, 9.0],
+        "ENSG3": [0.5, 0.25, 0.125],
+    }
+    loaded: dict[bool, set[tuple[str, str, float]]] = {}
+    for pipelined in (False, True):
+        run_dir = tmp_path / ("pipelined" if pipelined else "sequential")
+        run_dir.mkdir()
+        config = _build_config(run_dir, pipelined_writes=pipelined, write_queue_depth=1)
+        study_dir = _write_study(config.processing.input_directory, "GSE1", genes)
+
+        engine = create_engine(config.database.connection_string)
+        pipeline.Base.metadata.create_all(engine)
+        session_factory = create_session_factory(engine)
+        pipeline._process_single_study(
+            config, session_factory, study_dir, {"ENSG1", "ENSG2", "ENSG3"}
+        )
+
+        with Session(engine) as session:
+            rows = session.execute(
+                select(DimGene.ensembl_id, DimSample.gsm_accession, FactExpression.expression_value)
+                .join(DimGene, FactExpression.gene_key == DimGene.gene_key)
+                .join(DimSample, FactExpression.sample_key == DimSample.sample_key)
+            ).all()
+            loaded[pipelined] = {tuple(row) for row in rows}
+            assert session.execute(select(EtlStudyState)).first() is None
+
+    assert len(loaded[False]) == 9
+    assert loaded[True] == loaded[False]
+
+
+def test_batch_prefetcher_reraises_parser_errors() -> None:
+    import pytest
+
+    def _failing_batches():
+        yield [object()]
+        raise pipeline.ExpressionFormatError("broken row")
+
+    metrics = pipeline.ExpressionLoadMetrics()
+    received = []
+    with pytest.raises(pipeline.ExpressionFormatError):
+        with pipeline._BatchPrefetcher(_failing_batches(), depth=1, metrics=metrics) as batches:
+            for batch in batches:
+                received.append(batch)
+
+    assert len(received) == 1
+    assert metrics.queue_samples >= 1
+
+
+def test_process_single_study_replace_mode_reloads_facts(tmp_path: pathlib.Path) -> None:
+    from etl_for_all_studies.database import create_session_factory
+    from etl_for_all_studies.models import FactExpression
+
+    config = _build_config(tmp_path)
+    config.database.delete_chunk_size = 2
+    input_dir = config.processing.input_directory
+    study_dir = _write_study(input_dir, "GSE2", {"ENSG1": [1.0, 2.0, 3.0], "ENSG2": [4.0, 5.0, 6.0]})
+
+    engine = create_engine(config.database.connection_string)
+    pipeline.Base.metadata.create_all(engine)
+    session_factory = create_session_factory(engine)
+    pipeline._process_single_study(config, session_factory, study_dir, {"ENSG1", "ENSG2"})
+
+    (study_dir / "expression_GSE2.tsv").write_text(
+        "gene\tGSM0\tGSM1\tGSM2\nENSG1\t10.0\t20.0\t30.0\nENSG2\t40.0\t50.0\t60.0\n",
+        encoding="utf-8",
+    )
+
+    def _values() -> list[float]:
+        with Session(engine) as session:
+            return sorted(session.execute(select(FactExpression.expression_value)).scalars())
+
+    # Without replace mode the idempotent loader keeps the existing facts.
+    pipeline._process_single_study(config, session_factory, study_dir, {"ENSG1", "ENSG2"})
+    assert _values() == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+
+    pipeline._process_single_study(
+        config,
+        session_factory,
+        study_dir,
+        {"ENSG1", "ENSG2"},
+        replace_studies=frozenset({"GSE2"}),
+    )
+    assert _values() == [10.0, 20.0, 30.0, 40.0, 50.0, 60.0]
+
+
+def test_replace_mode_resets_checkpoint_before_purging(
+    tmp_path: pathlib.Path, monkeypatch
+) -> None:
+    import pytest
+
+    from etl_for_all_studies.database import create_session_factory
+    from etl_for_all_studies.models import EtlStudyState, FactExpression
+
+    config = _build_config(tmp_path)
+    config.database.delete_chunk_size = 2
+    study_dir = _write_study(
+        config.processing.input_directory,
+        "GSE9",
+        {"ENSG1": [1.0, 2.0, 3.0], "ENSG2": [4.0, 5.0, 6.0]},
+    )
+    engine = create_engine(config.database.connection_string)
+    pipeline.Base.metadata.create_all(engine)
+    session_factory = create_session_factory(engine)
+    pipeline._process_single_study(config, session_factory, study_dir, {"ENSG1", "ENSG2"})
+    with Session(engine) as session:
+        # An interrupted earlier run left a resume point inside the file.
+        pipeline.upsert_state(
+            session, "GSE9", last_gene="ENSG2", last_sample_index=1, metadata_loaded=True
+        )
+        session.commit()
+
+    original_delete = pipeline.delete_expression_fact_chunk
+    calls = {"count": 0}
+
+    def _crashing_delete(session, study_key, chunk_size):
+        calls["count"] += 1
+        if calls["count"] == 2:
+            raise RuntimeError("process killed during purge")
+        return original_delete(session, study_key, chunk_size)
+
+    monkeypatch.setattr(pipeline, "delete_expression_fact_chunk", _crashing_delete)
+    with pytest.raises(RuntimeError):
+        pipeline._process_single_study(
+            config,
+            session_factory,
+            study_dir,
+            {"ENSG1", "ENSG2"},
+            replace_studies=frozenset({"GSE9"}),
+        )
+
+    with Session(engine) as session:
+        state = session.get(EtlStudyState, "GSE9")
+        remaining = len(session.execute(select(FactExpression)).all())
+    engine.dispose()
+
+    assert remaining == 4
+    assert state is not None
+    assert (state.last_processed_gene, state.last_sample_index) == (None, 0)
+
+
+def test_process_single_study_replays_batch_after_transient_failure(
+    tmp_path: pathlib.Path, monkeypatch
+) -> None:
+    from sqlalchemy.exc import OperationalError
+
+    from etl_for_all_studies.database import create_session_factory
+    from etl_for_all_studies.models import FactExpression
+
+    config = _build_config(tmp_path)
+    config.database.max_retries = 2
+    study_dir = _write_study(
+        config.processing.input_directory,
+        "GSE3",
+        {"ENSG1": [1.0, 2.0, 3.0], "ENSG2": [4.0, 5.0, 6.0]},
+    )
+
+    original_insert = pipeline.bulk_insert_expression_records
+    calls = {"count": 0}
+
+    def _flaky_insert(session, records):
+        calls["count"] += 1
+        original_insert(session, records)
+        if calls["count"] == 2:
+            session.flush()
+            raise OperationalError("INSERT", {}, Exception("server closed the connection"))
+
+    monkeypatch.setattr(pipeline, "bulk_insert_expression_records", _flaky_insert)
+
+    engine = create_engine(config.database.connection_string)
+    pipeline.Base.metadata.create_all(engine)
+    pipeline._process_single_study(
+        config, create_session_factory(engine), study_dir, {"ENSG1", "ENSG2"}
+    )
+
+    with Session(engine) as session:
+        values = sorted(session.execute(select(FactExpression.expression_value)).scalars())
+
+    assert values == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    assert calls["count"] == 4
+
+
+def test_process_single_study_replays_batch_whose_commit_succeeded(
+    tmp_path: pathlib.Path, monkeypatch
+) -> None:
+    from sqlalchemy.exc import OperationalError
+
+    from etl_for_all_studies.database import create_session_factory
+    from etl_for_all_studies.models import FactExpression
+
+    config = _build_config(tmp_path)
+    config.database.max_retries = 2
+    study_dir = _write_study(
+        config.processing.input_directory,
+        "GSE5",
+        {"ENSG1": [1.0, 2.0, 3.0], "ENSG2": [4.0, 5.0, 6.0]},
+    )
+
+    original_write = pipeline._write_expression_batch
+    calls = {"count": 0}
+
+    def _ambiguous_write(session, **kwargs):
+        calls["count"] += 1
+        original_write(session, **kwargs)
+        if calls["count"] == 1:
+            # The commit reached the database but the acknowledgement was lost.
+            raise OperationalError("COMMIT", {}, Exception("server closed the connection"))
+
+    monkeypatch.setattr(pipeline, "_write_expression_batch", _ambiguous_write)
+
+    engine = create_engine(config.database.connection_string)
+    pipeline.Base.metadata.create_all(engine)
+    pipeline._process_single_study(
+        config, create_session_factory(engine), study_dir, {"ENSG1", "ENSG2"}
+    )
+
+    with Session(engine) as session:
+        values = sorted(session.execute(select(FactExpression.expression_value)).scalars())
+
+    assert values == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    assert calls["count"] >= 2
+
+
+def test_process_single_study_packs_vectors_from_streamed_batches(
+    tmp_path: pathlib.Path, monkeypatch
+) -> None:
+    from etl_for_all_studies.database import create_session_factory
+    from etl_for_all_studies.models import FactExpression
+    from etl_for_all_studies.repositories import load_expression_array
+
+    config = _build_config(tmp_path, write_expression_vectors=True)
+    study_dir = _write_study(
+        config.processing.input_directory,
+        "GSE6",
+        {"ENSG1": [1.0, 2.0, 3.0], "ENSG2": [4.0, 5.0, 6.0], "ENSG3": [7.0, 8.0, 9.0]},
+    )
+
+    def _no_rebuild(session, study_key):
+        raise AssertionError("vectors were rebuilt from fact_expression")
+
+    monkeypatch.setattr(pipeline, "rebuild_expression_vectors", _no_rebuild)
+
+    engine = create_engine(config.database.connection_string)
+    pipeline.Base.metadata.create_all(engine)
+    pipeline._process_single_study(
+        config, create_session_factory(engine), study_dir, {"ENSG1", "ENSG2", "ENSG3"}
+    )
+
+    with Session(engine) as session:
+        study_key = session.execute(select(DimStudy.study_key)).scalar_one()
+        from_facts = load_expression_array(session, study_key, use_vectors=False)
+        from_vectors = load_expression_array(session, study_key)
+        assert from_vectors.gene_keys.tolist() == from_facts.gene_keys.tolist()
+        assert from_vectors.values.tolist() == from_facts.values.tolist()
+
+        # Reads come from the packed vectors once they exist.
+        fact = session.execute(select(FactExpression).limit(1)).scalar_one()
+        fact.expression_value = 100.0
+        session.commit()
+        assert 100.0 not in load_expression_array(session, study_key).values
+        assert 100.0 in load_expression_array(session, study_key, use_vectors=False).values
+    engine.dispose()
+
+
+def test_process_single_study_inline_correlations_skip_database_reload(
+    tmp_path: pathlib.Path, monkeypatch
+) -> None:
+    from etl_for_all_studies import correlation_job
+    from etl_for_all_studies.database import create_session_factory
+    from etl_for_all_studies.models import FactGenePairCorrelation
+
+    genes = {
+        "ENSG1": [1.0, 2.0, 3.0, 4.0],
+        "ENSG2": [2.0, 1.0, 4.0, 3.0],
+        "ENSG3": [4.0, 3.0, 2.0, 1.5],
+    }
+    stored: dict[bool, list[tuple]] = {}
+    original_load = correlation_job.load_expression_array
+    for inline in (False, True):
+        run_dir = tmp_path / ("inline" if inline else "job")
+        run_dir.mkdir()
+        config = _build_config(run_dir, inline_correlations=inline)
+        study_dir = _write_study(config.processing.input_directory, "GSE4", genes)
+        engine = create_engine(config.database.connection_string)
+        pipeline.Base.metadata.create_all(engine)
+        session_factory = create_session_factory(engine)
+
+        loads = {"count": 0}
+
+        def _counting_load(session, study_key, **kwargs):
+            loads["count"] += 1
+            return original_load(session, study_key, **kwargs)
+
+        monkeypatch.setattr(correlation_job, "load_expression_array", _counting_load)
+        pipeline._process_single_study(
+            config, session_factory, study_dir, {"ENSG1", "ENSG2", "ENSG3"}
+        )
+        if inline:
+            assert loads["count"] == 0
+            # A rerun sees only existing facts, so it must read the matrix back.
+            pipeline._process_single_study(
+                config, session_factory, study_dir, {"ENSG1", "ENSG2", "ENSG3"}
+            )
+            assert loads["count"] == 1
+        else:
+            correlation_job.run_correlation_job(config)
+
+        with Session(engine) as session:
+            stored[inline] = sorted(
+                (row.gene_a_key, row.gene_b_key, row.rho_spearman, row.p_value, row.q_value)
+                for row in session.execute(select(FactGenePairCorrelation)).scalars()
+            )
+        engine.dispose()
+
+    assert len(stored[True]) == 3
+    assert stored[True] == stored[False]
+
+
+def test_run_pipeline_process_executor_loads_studies_and_relays_logs(
+    tmp_path: pathlib.Path, caplog, monkeypatch
+) -> None:
+    import logging
+
+    from etl_for_all_studies.models import FactExpression
+
+    # Spawned workers import the package from the parent's sys.path.
+    monkeypatch.syspath_prepend(str(MODULE_PATH.parents[1]))
+    config = _build_config(tmp_path, executor="process")
+    for accession in ("GSE5", "GSE6"):
+        _write_study(
+            config.processing.input_directory,
+            accession,
+            {"ENSG1": [1.0, 2.0], "ENSG2": [3.0, 4.0], "ENSG9": [5.0, 6.0]},
+        )
+
+    caplog.set_level(logging.INFO)
+    pipeline.run_pipeline(config)
+
+    engine = create_engine(config.database.connection_string)
+    with Session(engine) as session:
+        assert len(session.execute(select(FactExpression)).all()) == 8
+    engine.dispose()
+    messages = [record.getMessage() for record in caplog.records]
+    # Emitted inside the worker process and replayed through the parent's handlers.
+    assert any(message.startswith("Completed study GSE5") for message in messages)
+    assert any("loaded 2 of 2 studies (4 samples, 8 records)" in message for message in messages)
+
+
+def test_run_pipeline_inline_correlations_refresh_global_q_values(
+    tmp_path: pathlib.Path,
+) -> None:
+    import numpy as np
+
+    from etl_for_all_studies.models import FactGenePairCorrelation
+    from etl_for_all_studies.multiple_testing import benjamini_hochberg
+
+    config = _build_config(tmp_path, inline_correlations=True)
+    config.correlation.global_fdr = True
+    _write_study(
+        config.processing.input_directory,
+        "GSE7",
+        {
+            "ENSG1": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "ENSG2": [2.0, 1.0, 4.0, 3.0, 5.0],
+            "ENSG3": [5.0, 3.0, 4.0, 1.0, 2.0],
+        },
+    )
+    _write_study(
+        config.processing.input_directory,
+        "GSE8",
+        {
+            "ENSG1": [1.0, 3.0, 2.0, 5.0, 4.0],
+            "ENSG2": [1.0, 2.0, 3.0, 4.0, 6.0],
+            "ENSG3": [4.0, 4.5, 1.0, 2.0, 3.0],
+        },
+    )
+
+    pipeline.run_pipeline(config)
+
+    engine = create_engine(config.database.connection_string)
+    with Session(engine) as session:
+        rows = session.execute(
+            select(FactGenePairCorrelation).order_by(FactGenePairCorrelation.correlation_key)
+        ).scalars().all()
+    engine.dispose()
+
+    assert len(rows) == 6
+    expected = benjamini_hochberg(np.array([row.p_value for row in rows]))
+    np.testing.assert_allclose([row.q_value_global for row in rows], expected)
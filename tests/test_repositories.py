@@ -1,7 +1,10 @@
+import math
 import pathlib
 import sys
 
-from sqlalchemy import create_engine
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, select
 from sqlalchemy.orm import Session
 
 SRC_ROOT = pathlib.Path(__file__).resolve().parents[1] / "src"
@@ -9,13 +12,29 @@ if str(SRC_ROOT) not in sys.path:
     sys.path.insert(0, str(SRC_ROOT))
 
 from etl_for_all_studies.metadata_processing import SampleMetadata
-from etl_for_all_studies.models import Base, DimSample
+from etl_for_all_studies.models import (
+    Base,
+    DimSample,
+    EtlStudyState,
+    FactExpression,
+    FactGenePairCorrelation,
+)
 from etl_for_all_studies.repositories import (
     DimensionCache,
+    ExpressionMatrix,
+    ExpressionMatrixBuilder,
+    advance_checkpoint,
+    compute_expression_fingerprint,
     get_or_create_gene,
+    get_or_create_illness,
     get_or_create_platform,
     get_or_create_sample,
     get_or_create_study,
+    insert_gene_pair_correlation_columns,
+    load_expression_vectors,
+    rebuild_expression_vectors,
+    upsert_state,
+    write_expression_vectors,
 )
 
 
@@ -89,3 +108,233 @@ def test_get_or_create_platform_handles_existing_without_cache() -> None:
     second_key = get_or_create_platform(session, cache, "GPL570")
 
     assert first_key == second_key
+
+
+def test_advance_checkpoint_updates_existing_state_and_creates_missing() -> None:
+    session = create_session()
+    upsert_state(session, "GSE1", last_gene=None, last_sample_index=0, metadata_loaded=True)
+    session.commit()
+
+    advance_checkpoint(session, "GSE1", last_gene="ENSG5", last_sample_index=3)
+    advance_checkpoint(session, "GSE2", last_gene="ENSG1", last_sample_index=1)
+    session.commit()
+    session.expire_all()
+
+    first = session.get(EtlStudyState, "GSE1")
+    second = session.get(EtlStudyState, "GSE2")
+    assert first is not None and second is not None
+    assert (first.last_processed_gene, first.last_sample_index) == ("ENSG5", 3)
+    assert bool(first.metadata_loaded)
+    assert (second.last_processed_gene, second.last_sample_index) == ("ENSG1", 1)
+
+
+def test_expression_vectors_round_trip_in_sample_key_order() -> None:
+    session = create_session()
+    cache = DimensionCache({}, {}, {}, {}, {})
+    study_key = get_or_create_study(session, cache, "GSE300")
+    sample_keys = [
+        get_or_create_sample(
+            session,
+            cache,
+            SampleMetadata(f"GSM{index}", "GSE300", "", "UNKNOWN", "UNKNOWN", "UNKNOWN"),
+            study_key=study_key,
+        )
+        for index in range(3)
+    ]
+    gene_a = get_or_create_gene(session, cache, "ENSG_A")
+    gene_b = get_or_create_gene(session, cache, "ENSG_B")
+    values = {
+        (gene_a, sample_keys[0]): 1.5,
+        (gene_a, sample_keys[1]): 2.5,
+        (gene_a, sample_keys[2]): 3.5,
+        (gene_b, sample_keys[2]): -1.0,
+    }
+    for (gene_key, sample_key), value in values.items():
+        session.add(
+            FactExpression(
+                gene_key=gene_key,
+                sample_key=sample_key,
+                study_key=study_key,
+                expression_value=value,
+            )
+        )
+    session.commit()
+
+    assert rebuild_expression_vectors(session, study_key) == 2
+    session.commit()
+
+    matrix = load_expression_vectors(session, study_key)
+
+    assert matrix.gene_keys.tolist() == [gene_a, gene_b]
+    assert matrix.sample_keys.tolist() == sorted(sample_keys)
+    assert matrix.values.dtype.name == "float32"
+    assert matrix.values[0].tolist() == [1.5, 2.5, 3.5]
+    assert math.isnan(matrix.values[1, 0]) and matrix.values[1, 2] == -1.0
+    assert matrix.mask.sum() == 4
+
+    # A matrix over only the measured samples is realigned to every study sample.
+    partial = ExpressionMatrix(
+        matrix.gene_keys, matrix.sample_keys[[0, 2]], matrix.values[:, [0, 2]]
+    )
+    assert write_expression_vectors(session, study_key, partial) == 2
+    session.commit()
+    realigned = load_expression_vectors(session, study_key)
+    assert realigned.sample_keys.tolist() == sorted(sample_keys)
+    assert realigned.values[0, 0] == 1.5 and math.isnan(realigned.values[0, 1])
+
+
+def test_expression_matrix_builder_fills_rows_as_batches_arrive() -> None:
+    builder = ExpressionMatrixBuilder([30, 10, 20])
+    builder.add([(10, 7, 1.0), (20, 7, 2.0), (10, 5, 3.0)])
+    builder.add([(30, 7, 4.0), (20, 5, 5.0)])
+    builder.add([])
+
+    matrix = builder.build()
+
+    assert matrix.gene_keys.tolist() == [5, 7]
+    assert matrix.sample_keys.tolist() == [10, 20, 30]
+    assert matrix.values.dtype.name == "float32"
+    assert matrix.values[1].tolist() == [1.0, 2.0, 4.0]
+    assert matrix.values[0, :2].tolist() == [3.0, 5.0] and math.isnan(matrix.values[0, 2])
+
+
+def test_expression_fingerprint_detects_swapped_and_cancelling_edits() -> None:
+    session = create_session()
+    cache = DimensionCache({}, {}, {}, {}, {})
+    study_key = get_or_create_study(session, cache, "GSE300")
+    sample_key = get_or_create_sample(
+        session,
+        cache,
+        SampleMetadata("GSM1", "GSE300", "", "UNKNOWN", "UNKNOWN", "UNKNOWN"),
+        study_key=study_key,
+    )
+    facts = [
+        FactExpression(
+            gene_key=get_or_create_gene(session, cache, f"ENSG{index}"),
+            sample_key=sample_key,
+            study_key=study_key,
+            expression_value=value,
+        )
+        for index, value in enumerate([1.5, 2.25, -3.0])
+    ]
+    session.add_all(facts)
+    session.commit()
+    fingerprints = {compute_expression_fingerprint(session, study_key).checksum}
+
+    # Swap two values between facts: counts and plain sums are unchanged.
+    facts[0].expression_value, facts[1].expression_value = 2.25, 1.5
+    session.commit()
+    fingerprints.add(compute_expression_fingerprint(session, study_key).checksum)
+
+    # Edits that cancel out in the value total.
+    facts[0].expression_value += 0.5
+    facts[2].expression_value -= 0.5
+    session.commit()
+    fingerprints.add(compute_expression_fingerprint(session, study_key).checksum)
+
+    assert len(fingerprints) == 3
+    assert compute_expression_fingerprint(session, study_key).checksum in fingerprints
+
+
+def test_insert_gene_pair_correlation_columns_writes_pages() -> None:
+    session = create_session()
+    cache = DimensionCache({}, {}, {}, {}, {})
+    study_key = get_or_create_study(session, cache, "GSE300")
+    gene_keys = [get_or_create_gene(session, cache, f"ENSG{index}") for index in range(4)]
+    session.commit()
+
+    pairs = [(a, b) for a in gene_keys for b in gene_keys if a < b][:5]
+    inserted = insert_gene_pair_correlation_columns(
+        session,
+        study_key=study_key,
+        computed_at="2024-01-01T00:00:00+00:00",
+        gene_a_keys=np.array([a for a, _ in pairs]),
+        gene_b_keys=np.array([b for _, b in pairs]),
+        rho=np.array([0.1, 0.2, 0.3, 0.4, 0.5]),
+        p_values=np.array([0.01, np.nan, 0.2, 0.3, 0.4]),
+        q_values=np.array([0.05, np.nan, 0.25, 0.3, 0.4]),
+        n_samples=np.array([5, 2, 5, 5, 5]),
+        page_size=2,
+    )
+    session.commit()
+
+    rows = session.execute(
+        select(FactGenePairCorrelation).order_by(FactGenePairCorrelation.rho_spearman)
+    ).scalars().all()
+    assert inserted == 5
+    assert [(row.gene_a_key, row.gene_b_key) for row in rows] == pairs
+    assert rows[1].p_value == 1.0 and rows[1].q_value is None
+    assert rows[0].q_value == 0.05 and rows[0].study_key == study_key
+
+
+def test_whole_study_gene_pair_rows_are_unique() -> None:
+    from sqlalchemy.exc import IntegrityError
+
+    session = create_session()
+    cache = DimensionCache({}, {}, {}, {}, {})
+    study_key = get_or_create_study(session, cache, "GSE300")
+    gene_a, gene_b = (get_or_create_gene(session, cache, f"ENSG{index}") for index in range(2))
+    illness_key = get_or_create_illness(session, cache, "case")
+    session.commit()
+
+    def insert_pair(illness: int | None) -> None:
+        insert_gene_pair_correlation_columns(
+            session,
+            study_key=study_key,
+            computed_at="2024-01-01T00:00:00+00:00",
+            gene_a_keys=np.array([gene_a]),
+            gene_b_keys=np.array([gene_b]),
+            rho=np.array([0.5]),
+            p_values=np.array([0.01]),
+            q_values=np.array([0.01]),
+            n_samples=np.array([5]),
+            illness_key=illness,
+        )
+
+    insert_pair(None)
+    insert_pair(illness_key)
+    session.commit()
+
+    with pytest.raises(IntegrityError):
+        insert_pair(None)
+    session.rollback()
+    with pytest.raises(IntegrityError):
+        insert_pair(illness_key)
+
+
+def test_apply_meta_correlation_sums_keeps_concurrent_contributions(monkeypatch) -> None:
+    from etl_for_all_studies import repositories
+    from etl_for_all_studies.meta_analysis import fisher_z_contributions
+    from etl_for_all_studies.models import FactGenePairMeta
+
+    session = create_session()
+    gene_a, gene_b = np.array([1, 1, 2]), np.array([2, 3, 3])
+    first = fisher_z_contributions(gene_a, gene_b, np.array([0.5, -0.2, 0.1]), np.array([10, 8, 6]))
+    second = fisher_z_contributions(gene_a, gene_b, np.array([0.3, 0.4, 0.0]), np.array([7, 9, 12]))
+    original_insert = repositories._insert_missing_meta_rows
+
+    def _racing_insert(session, pairs, **kwargs):
+        # Another writer summarises the same new pairs between our read and our insert.
+        monkeypatch.setattr(repositories, "_insert_missing_meta_rows", original_insert)
+        repositories.apply_meta_correlation_sums(session, second, updated_at="t0")
+        original_insert(session, pairs, **kwargs)
+
+    monkeypatch.setattr(repositories, "_insert_missing_meta_rows", _racing_insert)
+    repositories.apply_meta_correlation_sums(session, first, updated_at="t1", page_size=2)
+    session.commit()
+
+    rows = session.execute(
+        select(FactGenePairMeta).order_by(FactGenePairMeta.gene_a_key, FactGenePairMeta.gene_b_key)
+    ).scalars().all()
+    assert [(row.gene_a_key, row.gene_b_key, row.study_count) for row in rows] == [
+        (1, 2, 2),
+        (1, 3, 2),
+        (2, 3, 2),
+    ]
+    for index, row in enumerate(rows):
+        assert row.sum_weighted_z == pytest.approx(
+            first.sum_weighted_z[index] + second.sum_weighted_z[index]
+        )
+        weights = first.sum_weights[index] + second.sum_weights[index]
+        expected_rho = math.tanh(row.sum_weighted_z / weights)
+        assert row.rho_meta == pytest.approx(expected_rho)